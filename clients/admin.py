@@ -1,5 +1,7 @@
-﻿from django.contrib import admin
-from .models import Client, ServicePlan, Invoice, Payment, NetworkUsage, SystemSettings, SystemResetLog
+﻿from django.contrib import admin, messages
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import path
+from .models import Client, ServicePlan, Invoice, Payment, LedgerEntry, MpesaCallback, NetworkUsage, OutboundMessage, ProvisioningTask, StatementImport, StkPushRequest, SystemSettings, SystemResetLog
 
 # Remove custom header/title to use Django defaults
 # admin.site.site_header = 'Django Administration'
@@ -9,8 +11,8 @@ from .models import Client, ServicePlan, Invoice, Payment, NetworkUsage, SystemS
 # Register models with basic admin classes
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
-    list_display = ['name', 'email', 'phone', 'service_plan', 'is_active']
-    list_filter = ['is_active', 'service_plan']
+    list_display = ['name', 'email', 'phone', 'service_plan', 'is_active', 'provisioning_status']
+    list_filter = ['is_active', 'service_plan', 'provisioning_status']
     search_fields = ['name', 'email', 'phone']
 
 @admin.register(ServicePlan)
@@ -25,8 +27,151 @@ class InvoiceAdmin(admin.ModelAdmin):
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
-    list_display = ['client', 'amount', 'payment_method', 'payment_date']
+    list_display = ['client', 'amount', 'payment_method', 'transaction_id', 'payment_date']
     list_filter = ['payment_method', 'payment_date']
+    search_fields = ['transaction_id', 'client__name']
+    change_list_template = 'admin/clients/payment/change_list.html'
+    
+    def get_urls(self):
+        urls = [
+            path(
+                'import-statement/',
+                self.admin_site.admin_view(self.import_statement_view),
+                name='clients_payment_import_statement'
+            ),
+            path(
+                'import-statement/<int:import_id>/',
+                self.admin_site.admin_view(self.import_status_view),
+                name='clients_payment_import_status'
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def import_statement_view(self, request):
+        """Upload an M-Pesa statement; run_statement_imports imports it in the background"""
+        from .forms import PaymentStatementUploadForm
+        
+        if not self.has_add_permission(request):
+            messages.error(request, 'You do not have permission to import payments')
+            return redirect('admin:clients_payment_changelist')
+        
+        form = PaymentStatementUploadForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            statement_import = StatementImport.objects.create(
+                filename=form.cleaned_data['statement'].name[:255],
+                statement=form.cleaned_data['statement'],
+                dry_run=form.cleaned_data['dry_run'],
+                uploaded_by=request.user,
+            )
+            return redirect('admin:clients_payment_import_status', import_id=statement_import.pk)
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': 'Import M-Pesa statement',
+        }
+        return render(request, 'admin/clients/payment/import_statement.html', context)
+    
+    def import_status_view(self, request, import_id):
+        """Progress and result of a queued statement import; refreshes itself until it finishes"""
+        statement_import = get_object_or_404(StatementImport, pk=import_id)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'statement_import': statement_import,
+            'finished': statement_import.status in ('done', 'failed'),
+            'title': f'Import of {statement_import.filename}',
+        }
+        return render(request, 'admin/clients/payment/import_status.html', context)
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['client', 'entry_type', 'amount', 'description', 'created_at']
+    list_filter = ['entry_type', 'created_at']
+    search_fields = ['client__name', 'description']
+    raw_id_fields = ['client', 'invoice', 'payment']
+    
+    # The ledger is append-only: corrections are new adjustment entries
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def save_model(self, request, obj, form, change):
+        from .ledger import post_entry
+        post_entry(obj)
+
+@admin.register(ProvisioningTask)
+class ProvisioningTaskAdmin(admin.ModelAdmin):
+    list_display = ['client', 'action', 'status', 'attempts', 'next_attempt_at', 'updated_at']
+    list_filter = ['status', 'action']
+    search_fields = ['client__username', 'client__name']
+    raw_id_fields = ['client']
+    actions = ['retry_now']
+    
+    @admin.action(description='Retry selected tasks now')
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+        updated = queryset.exclude(status='done').update(
+            status='pending', next_attempt_at=timezone.now(), updated_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} tasks queued for retry')
+
+@admin.register(OutboundMessage)
+class OutboundMessageAdmin(admin.ModelAdmin):
+    list_display = ['phone', 'channel', 'campaign', 'status', 'attempts', 'sent_at', 'last_error']
+    list_filter = ['status', 'channel']
+    search_fields = ['phone', 'campaign', 'client__name']
+    raw_id_fields = ['client']
+    actions = ['retry_now']
+    
+    @admin.action(description='Retry selected messages now')
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+        updated = queryset.filter(status='failed').update(
+            status='pending', attempts=0, next_attempt_at=timezone.now(), updated_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} messages queued for retry')
+
+@admin.register(StatementImport)
+class StatementImportAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'status', 'dry_run', 'uploaded_by', 'created_at', 'completed_at']
+    list_filter = ['status', 'dry_run']
+    exclude = ['statement']
+    readonly_fields = ['progress', 'unmatched_receipts', 'last_error']
+    
+    # Statements are uploaded through Payments > Import M-Pesa statement
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(StkPushRequest)
+class StkPushRequestAdmin(admin.ModelAdmin):
+    list_display = ['checkout_request_id', 'client', 'amount', 'phone', 'account_reference', 'created_at']
+    search_fields = ['checkout_request_id', 'phone', 'account_reference']
+    # Setting the client of a push lets its unmatched result be processed again
+    raw_id_fields = ['client']
+    readonly_fields = ['checkout_request_id', 'amount', 'phone', 'account_reference']
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(MpesaCallback)
+class MpesaCallbackAdmin(admin.ModelAdmin):
+    list_display = ['receipt', 'kind', 'amount', 'phone', 'account', 'status', 'received_at', 'processed_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['receipt', 'key', 'phone', 'account']
+    raw_id_fields = ['payment']
+    readonly_fields = ['payload']
+    actions = ['process_again']
+    
+    # e.g. after adding the client an unmatched payment belongs to
+    @admin.action(description='Process selected callbacks again')
+    def process_again(self, request, queryset):
+        from django.utils import timezone
+        updated = queryset.filter(status='unmatched').update(status='pending', updated_at=timezone.now())
+        self.message_user(request, f'{updated} callbacks queued for processing')
 
 @admin.register(NetworkUsage)
 class NetworkUsageAdmin(admin.ModelAdmin):
@@ -4,3 +4,6 @@ class ClientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clients'
     verbose_name = 'Clients Management'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,500 @@
+# BACKUP FORMAT
+# A backup is a directory of gzipped NDJSON chunk files, one JSON object per row, plus a
+# manifest.json listing each model's fields, row count and per-chunk SHA-256 of the NDJSON
+# text. Rows are streamed from the database and written chunk by chunk, and restore reads
+# them back line by line into bulk_create batches, so memory does not grow with table size.
+# The manifest is written last: a directory without one is an incomplete backup.
+#
+# An incremental backup holds only the rows changed since its parent's watermark (the time
+# the parent started), the tombstones of rows deleted since then, and the oldest row still
+# kept in each retention-managed table. Its manifest names its parent and the full backup
+# the chain starts from; restore loads that full backup and replays each increment in turn.
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.db.models import Max, Min, Q, Sum
+from django.db.models.deletion import Collector
+from django.utils import timezone
+
+FORMAT_NAME = 'isp-billing-ndjson'
+FORMAT_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+TOMBSTONE_MODEL = 'clients.deletedrecord'
+
+# Rows per chunk file, and rows fetched from the database per round trip
+CHUNK_ROWS = 100000
+FETCH_SIZE = 2000
+
+# Field an incremental backup compares with the parent's watermark to find changed rows.
+# Models not listed are small and copied whole into every backup.
+CHANGE_FIELDS = {
+    'clients.client': 'updated_at',
+    'clients.provisioningtask': 'updated_at',
+    'clients.outboundmessage': 'updated_at',
+    'clients.stkpushrequest': 'updated_at',
+    'clients.mpesacallback': 'updated_at',
+    'clients.statementimport': 'updated_at',
+    'clients.invoice': 'updated_at',
+    'clients.payment': 'updated_at',
+    'clients.ledgerentry': 'created_at',
+    'clients.networkusage': 'updated_at',
+    'clients.usagesample': 'sampled_at',
+    'clients.usagerollup': 'updated_at',
+    'clients.usagecounter': 'read_at',
+    'clients.routersample': 'sampled_at',
+    'clients.routersessionsnapshot': 'sampled_at',
+    'clients.interfacesample': 'sample__sampled_at',
+    'clients.systemsettings': 'updated_at',
+    'clients.systemresetlog': 'reset_date',
+}
+
+# Retention purges delete the oldest rows without tombstones: (model, field, filter) whose
+# oldest remaining value is recorded, and everything before it is deleted on restore
+RETENTION_FLOORS = [
+    ('clients.networkusage', 'usage_date', {}),
+    ('clients.usagesample', 'sampled_at', {}),
+    ('clients.usagerollup', 'period_start', {'resolution': 'hour'}),
+    ('clients.usagerollup', 'period_start', {'resolution': 'month'}),
+    ('clients.routersample', 'sampled_at', {}),
+]
+
+# Rows are re-read from a little before the parent's watermark, in case a transaction that
+# started before it committed after; replaying a row twice is harmless
+WATERMARK_OVERLAP = datetime.timedelta(minutes=5)
+
+class BackupError(Exception):
+    pass
+
+class BackupEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder without its millisecond rounding of datetimes and times"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+def backup_models():
+    """Models in the clients app, each after the models it has foreign keys to"""
+    pending = [
+        model for model in apps.get_app_config('clients').get_models()
+        if model_label(model) != TOMBSTONE_MODEL
+    ]
+    ordered = []
+    while pending:
+        for model in pending:
+            dependencies = {
+                field.related_model for field in model._meta.concrete_fields
+                if field.related_model is not None and field.related_model is not model
+            }
+            if not dependencies & set(pending):
+                ordered.append(model)
+                pending.remove(model)
+                break
+        else:
+            # Circular references: constraint checks are deferred on restore anyway
+            ordered += pending
+            break
+    return ordered
+
+def model_label(model):
+    return model._meta.label_lower
+
+def field_names(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+class ChunkWriter:
+    """Writes one model's rows as numbered .ndjson.gz files of at most chunk_rows rows"""
+
+    def __init__(self, directory, label, chunk_rows):
+        self.directory = directory
+        self.label = label
+        self.chunk_rows = chunk_rows
+        self.chunks = []
+        self.file = None
+
+    def open_chunk(self):
+        name = f'{self.label}.{len(self.chunks) + 1:04d}.ndjson.gz'
+        self.file = gzip.open(os.path.join(self.directory, name), 'wt', encoding='utf-8', compresslevel=6)
+        self.digest = hashlib.sha256()
+        self.chunks.append({'file': name, 'rows': 0})
+
+    def close_chunk(self):
+        if self.file is not None:
+            self.file.close()
+            self.chunks[-1]['sha256'] = self.digest.hexdigest()
+            self.file = None
+
+    def write(self, row):
+        if self.file is None or self.chunks[-1]['rows'] >= self.chunk_rows:
+            self.close_chunk()
+            self.open_chunk()
+        line = json.dumps(row, cls=BackupEncoder, ensure_ascii=False) + '\n'
+        self.file.write(line)
+        self.digest.update(line.encode('utf-8'))
+        self.chunks[-1]['rows'] += 1
+
+def dump_model(directory, model, queryset=None, chunk_rows=CHUNK_ROWS):
+    """Stream a model's rows (or the queryset's) into chunk files; returns its manifest entry"""
+    fields = field_names(model)
+    queryset = model._default_manager.all() if queryset is None else queryset
+    writer = ChunkWriter(directory, model_label(model), chunk_rows)
+    rows = 0
+    for values in queryset.order_by('pk').values_list(*fields).iterator(chunk_size=FETCH_SIZE):
+        writer.write(values)
+        rows += 1
+    writer.close_chunk()
+    return {'model': model_label(model), 'fields': fields, 'rows': rows, 'chunks': writer.chunks}
+
+def backup_summary():
+    """Headline figures for the manifest and the backup email, computed in the database"""
+    from .models import Client, Invoice, Payment
+    return {
+        'total_clients': Client.objects.count(),
+        'total_invoices': Invoice.objects.count(),
+        'total_payments': Payment.objects.count(),
+        'total_revenue': Payment.objects.aggregate(total=Sum('amount'))['total'] or 0,
+    }
+
+def write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, cls=BackupEncoder, indent=2)
+    os.replace(path + '.tmp', path)
+
+def resolve_field(model, path):
+    """The field at the end of a lookup path like 'sample__sampled_at'"""
+    for name in path.split('__'):
+        field = model._meta.get_field(name)
+        model = field.related_model or model
+    return field
+
+def changed_rows(model, since):
+    """The model's rows changed at or after `since`, or all of them for models without a change field"""
+    queryset = model._default_manager.all()
+    path = CHANGE_FIELDS.get(model_label(model))
+    if path is None:
+        return queryset
+    if not isinstance(resolve_field(model, path), models.DateTimeField):
+        since = timezone.localdate(since)
+    return queryset.filter(**{f'{path}__gte': since})
+
+def retention_floors():
+    """Oldest value left in each retention-managed table (None when it is empty)"""
+    floors = []
+    for label, field, filters in RETENTION_FLOORS:
+        oldest = apps.get_model(label)._default_manager.filter(**filters).aggregate(oldest=Min(field))['oldest']
+        floors.append({'model': label, 'field': field, 'filter': filters, 'oldest': oldest})
+    return floors
+
+def manifest_watermark(manifest):
+    """When a backup's snapshot started (version 1 manifests only have created_at)"""
+    return datetime.datetime.fromisoformat(manifest.get('watermark') or manifest['created_at'])
+
+def latest_backup(root):
+    """Path of the newest complete backup directory in root, or None"""
+    if not os.path.isdir(root):
+        return None
+    # backup_YYYYmmdd_HHMMSS names sort chronologically
+    names = sorted(name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name, MANIFEST_NAME)))
+    return os.path.join(root, names[-1]) if names else None
+
+def create_backup(directory, chunk_rows=CHUNK_ROWS, progress=None, parent=None):
+    """Write a backup of the clients app into directory; returns the manifest.
+
+    With parent (a sibling backup directory) only what changed since the parent is written.
+    """
+    from .models import DeletedRecord, SystemResetLog
+    from .system_reset import RESET_TYPES
+    now = timezone.now()
+    manifest = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'kind': 'full',
+        'created_at': now,
+        'watermark': now,
+        'models': [],
+    }
+    since = None
+    if parent is not None:
+        parent = os.path.normpath(parent)
+        if os.path.dirname(parent) != os.path.dirname(os.path.normpath(directory)):
+            raise BackupError('An incremental backup must be stored next to its parent')
+        parent_manifest = read_manifest(parent)
+        since = manifest_watermark(parent_manifest) - WATERMARK_OVERLAP
+        manifest.update({
+            'kind': 'incremental',
+            'parent': os.path.basename(parent),
+            'base': parent_manifest.get('base') or os.path.basename(parent),
+            'since': since,
+        })
+
+    os.makedirs(directory, exist_ok=True)
+    # One repeatable-read snapshot on PostgreSQL, so every table is dumped as of the same moment
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        if since is not None and SystemResetLog.objects.filter(reset_type__in=RESET_TYPES).filter(
+            Q(reset_date__gte=since) | Q(completed_at__gte=since) | Q(status='running')
+        ).exists():
+            # Resets delete in bulk without tombstones
+            raise BackupError('The system was reset since the last backup; take a full backup instead')
+
+        for model in backup_models():
+            if since is None:
+                entry = dump_model(directory, model, chunk_rows=chunk_rows)
+            else:
+                entry = dump_model(directory, model, changed_rows(model, since), chunk_rows)
+                entry['whole'] = model_label(model) not in CHANGE_FIELDS
+            manifest['models'].append(entry)
+            if progress:
+                progress(entry)
+
+        if since is not None:
+            manifest['deletions'] = dump_model(
+                directory, DeletedRecord, DeletedRecord.objects.filter(deleted_at__gte=since), chunk_rows
+            )
+            manifest['floors'] = retention_floors()
+        manifest['summary'] = backup_summary()
+    manifest['finished_at'] = timezone.now()
+    write_manifest(directory, manifest)
+
+    if since is None:
+        # Deletions before a full backup are already reflected in it
+        DeletedRecord.objects.filter(deleted_at__lt=now - WATERMARK_OVERLAP).delete()
+    return manifest
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise BackupError(f'{directory} has no {MANIFEST_NAME}; the backup is missing or incomplete')
+    if manifest.get('format') != FORMAT_NAME or manifest.get('version', 0) > FORMAT_VERSION:
+        raise BackupError(f'Unsupported backup format: {manifest.get("format")} v{manifest.get("version")}')
+    return manifest
+
+def read_chunk(directory, chunk):
+    """Rows of one chunk file, checking the row count and checksum once it has been read"""
+    digest = hashlib.sha256()
+    rows = 0
+    with gzip.open(os.path.join(directory, chunk['file']), 'rt', encoding='utf-8') as f:
+        for line in f:
+            digest.update(line.encode('utf-8'))
+            rows += 1
+            yield json.loads(line)
+    if rows != chunk['rows'] or digest.hexdigest() != chunk['sha256']:
+        raise BackupError(f'{chunk["file"]} is corrupt (rows or checksum do not match the manifest)')
+
+def read_chunk_rows(directory, entry):
+    """Rows of every chunk of a manifest entry as {field: value} dicts"""
+    for chunk in entry['chunks']:
+        for row in read_chunk(directory, chunk):
+            yield dict(zip(entry['fields'], row))
+
+def backup_chain(directory):
+    """[(path, manifest)] from the full backup a backup builds on up to the backup itself"""
+    root = os.path.dirname(os.path.normpath(directory))
+    chain = []
+    path = os.path.normpath(directory)
+    while True:
+        manifest = read_manifest(path)
+        chain.append((path, manifest))
+        if manifest.get('kind', 'full') == 'full':
+            return chain[::-1]
+        path = os.path.join(root, manifest['parent'])
+        if any(path == seen for seen, _ in chain):
+            raise BackupError(f'{directory} has a circular chain of parents')
+
+def verify_backup(directory):
+    """Read every chunk of a backup and the backups it builds on; returns its chain"""
+    chain = backup_chain(directory)
+    for path, manifest in chain:
+        entries = manifest['models'] + ([manifest['deletions']] if 'deletions' in manifest else [])
+        for entry in entries:
+            for chunk in entry['chunks']:
+                for _ in read_chunk(path, chunk):
+                    pass
+    return chain
+
+def value_converters(model, fields):
+    """(position, field) pairs whose JSON value needs to_python() (decimals, dates, times, UUIDs)"""
+    convert = (models.DecimalField, models.DateField, models.TimeField, models.DurationField, models.UUIDField)
+    converters = []
+    for position, name in enumerate(fields):
+        field = model._meta.get_field(name)
+        if isinstance(field, convert):
+            converters.append((position, field))
+    return converters
+
+class RawDates:
+    """Switch off auto_now / auto_now_add for the fields in a backup, so stored timestamps are kept"""
+
+    def __init__(self, model, fields):
+        self.fields = [
+            field for field in model._meta.concrete_fields
+            if field.attname in fields and (getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False))
+        ]
+
+    def __enter__(self):
+        self.saved = [(field, field.auto_now, field.auto_now_add) for field in self.fields]
+        for field in self.fields:
+            field.auto_now = field.auto_now_add = False
+
+    def __exit__(self, *exc):
+        for field, auto_now, auto_now_add in self.saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+def existing_targets(model, fields, restored):
+    """For nullable foreign keys to models outside the backup: position -> set of existing ids"""
+    targets = {}
+    for position, name in enumerate(fields):
+        field = model._meta.get_field(name)
+        if field.related_model is not None and field.related_model not in restored and field.null:
+            targets[position] = set(field.related_model._default_manager.values_list('pk', flat=True))
+    return targets
+
+def restore_model(directory, entry, batch_size, restored, upsert=False):
+    """bulk_create one model's rows from its chunks; returns rows restored.
+
+    With upsert, rows whose primary key already exists are overwritten.
+    """
+    model = apps.get_model(entry['model'])
+    fields = entry['fields']
+    unknown = set(fields) - set(field_names(model))
+    if unknown:
+        raise BackupError(f'{entry["model"]} has fields this schema does not: {", ".join(sorted(unknown))}')
+    converters = value_converters(model, fields)
+    dangling = existing_targets(model, fields, restored)
+    options = {}
+    if upsert:
+        options = {
+            'update_conflicts': True,
+            'unique_fields': [model._meta.pk.name],
+            'update_fields': [name for name in fields if name != model._meta.pk.attname],
+        }
+
+    count = 0
+    batch = []
+    with RawDates(model, fields):
+        for chunk in entry['chunks']:
+            for row in read_chunk(directory, chunk):
+                for position, field in converters:
+                    if row[position] is not None:
+                        row[position] = field.to_python(row[position])
+                for position, ids in dangling.items():
+                    if row[position] is not None and row[position] not in ids:
+                        row[position] = None
+                batch.append(model(**dict(zip(fields, row))))
+                if len(batch) >= batch_size:
+                    model._default_manager.bulk_create(batch, **options)
+                    count += len(batch)
+                    batch = []
+        if batch:
+            model._default_manager.bulk_create(batch, **options)
+            count += len(batch)
+    return count
+
+def delete_rows(queryset):
+    """Delete rows with the cascades and SET_NULLs the source database applied, but send no
+    delete signals: the ledger, revenue and tombstone rows they would write are in the backup"""
+    collector = Collector(using=queryset.db, origin=queryset)
+    collector.collect(queryset)
+    collector.sort()
+    for fast in collector.fast_deletes:
+        fast._raw_delete(fast.db)
+    for (field, value), batches in collector.field_updates.items():
+        for batch in batches:
+            if not isinstance(batch, models.QuerySet):
+                batch = field.model._base_manager.filter(pk__in=[obj.pk for obj in batch])
+            batch.update(**{field.name: value})
+    # sort() put the rows that depend on others first
+    for model, instances in collector.data.items():
+        model._base_manager.filter(pk__in=[obj.pk for obj in instances])._raw_delete(queryset.db)
+
+def delete_ids(model, ids, batch_size=500):
+    """Delete rows by primary key, so cascades match the source database"""
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        delete_rows(model._base_manager.filter(pk__in=ids[start:start + batch_size]))
+
+def replay_increment(directory, manifest, batch_size, restored, progress=None):
+    """Apply one incremental backup on top of what is already restored; returns {model label: rows}"""
+    # Deletions and purges first: the increment's rows (rollups included) are the final word
+    deleted = {}
+    for row in read_chunk_rows(directory, manifest['deletions']):
+        deleted.setdefault(row['model'], set()).add(row['object_id'])
+    for label, ids in deleted.items():
+        delete_ids(apps.get_model(label), ids)
+
+    for floor in manifest['floors']:
+        model = apps.get_model(floor['model'])
+        queryset = model._default_manager.filter(**floor['filter'])
+        if floor['oldest'] is not None:
+            oldest = resolve_field(model, floor['field']).to_python(floor['oldest'])
+            queryset = queryset.filter(**{f'{floor["field"]}__lt': oldest})
+        delete_rows(queryset)
+
+    counts = {}
+    for entry in manifest['models']:
+        if entry.get('whole'):
+            # Replaced outright; foreign keys into it are only checked at commit
+            table = connection.ops.quote_name(apps.get_model(entry['model'])._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {table}')
+        counts[entry['model']] = restore_model(directory, entry, batch_size, restored, upsert=not entry.get('whole'))
+        if progress:
+            progress(directory, entry['model'], counts[entry['model']])
+    return counts
+
+def restore_backup(directory, batch_size=5000, flush=False, progress=None):
+    """Load a backup, and the backups it builds on, in one transaction; returns {model label: rows}.
+
+    progress(backup path, model label, rows) is called after each model of each backup.
+    """
+    from .models import DeletedRecord
+    chain = backup_chain(directory)
+    base, manifest = chain[0]
+    entries = manifest['models']
+    restored_models = [apps.get_model(entry['model']) for entry in entries]
+    tables = [model._meta.db_table for model in restored_models]
+
+    counts = {}
+    with transaction.atomic():
+        last_tombstone = DeletedRecord.objects.aggregate(last=Max('pk'))['last'] or 0
+        if flush:
+            connection.ops.execute_sql_flush(
+                connection.ops.sql_flush(no_style(), tables, reset_sequences=True)
+            )
+        else:
+            occupied = [model_label(model) for model in restored_models if model._default_manager.exists()]
+            if occupied:
+                raise BackupError(f'Tables already hold data ({", ".join(occupied)}); restore with flush to replace it')
+
+        # Foreign keys are checked once at the end instead of row by row
+        with connection.constraint_checks_disabled():
+            for entry in entries:
+                counts[entry['model']] = restore_model(base, entry, batch_size, set(restored_models))
+                if progress:
+                    progress(base, entry['model'], counts[entry['model']])
+            for path, increment in chain[1:]:
+                for label, rows in replay_increment(path, increment, batch_size, set(restored_models), progress).items():
+                    counts[label] = counts.get(label, 0) + rows
+        connection.check_constraints(table_names=tables)
+        # Replayed deletions are not new deletions of this database
+        DeletedRecord.objects.filter(pk__gt=last_tombstone).delete()
+
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), restored_models)
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+    return counts
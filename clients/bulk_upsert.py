@@ -0,0 +1,49 @@
+# BULK UPSERT HELPERS
+# INSERT ... ON CONFLICT DO UPDATE for counter-style tables (rollups, usage totals).
+# Works on PostgreSQL and SQLite 3.24+.
+
+from django.db import connection
+
+def upsert_increment(model, rows, key_fields, increment_fields, insert_fields=(), replace_fields=(), conflict_target=None, batch_size=500):
+    """Insert rows, or add their increment_fields onto the existing row with the same key.
+
+    rows is a list of dicts keyed by field name. insert_fields are only written when a new
+    row is created (e.g. created_at); replace_fields overwrite the existing value (e.g.
+    updated_at). conflict_target is the SQL list of the unique index columns/expressions and
+    defaults to the key columns. Returns rows written.
+    """
+    if not rows:
+        return 0
+
+    fields = [
+        model._meta.get_field(name)
+        for name in list(key_fields) + list(increment_fields) + list(insert_fields) + list(replace_fields)
+    ]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(field.column) for field in fields)
+    if conflict_target is None:
+        conflict_target = ', '.join(quote(model._meta.get_field(name).column) for name in key_fields)
+    updates = ', '.join(
+        f'{quote(column)} = {table}.{quote(column)} + excluded.{quote(column)}'
+        for column in (model._meta.get_field(name).column for name in increment_fields)
+    )
+    for name in replace_fields:
+        column = quote(model._meta.get_field(name).column)
+        updates += f', {column} = excluded.{column}'
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+
+    written = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            params = []
+            for row in chunk:
+                params += [field.get_db_prep_save(row[field.name], connection) for field in fields]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {", ".join([placeholders] * len(chunk))} '
+                f'ON CONFLICT ({conflict_target}) DO UPDATE SET {updates}',
+                params
+            )
+            written += len(chunk)
+    return written
@@ -0,0 +1,9 @@
+# TEMPLATE CONTEXT PROCESSORS
+
+from django.utils.functional import SimpleLazyObject
+from .router_sessions import get_session_snapshot
+
+def router_sessions(request):
+    """Expose the request's router session snapshot, read from the stored RouterSessionSnapshot
+    (never the router) only if a template uses it"""
+    return {'router_sessions': SimpleLazyObject(lambda: get_session_snapshot(request))}
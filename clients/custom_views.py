@@ -1,5 +1,5 @@
 ﻿from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponseBadRequest
 from django.db import models
 from django.db.models import Sum, Count, Q, Avg, Max, Min
 from django.contrib import messages
@@ -7,8 +7,10 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
 from datetime import datetime, timedelta
 import json
-import csv
 from decimal import Decimal
+from .reporting.exports import export_rows, filter_dates, parse_date_range, streaming_csv_response, wants_gzip
+from .reporting.periods import time_series
+from .usage_retention import usage_totals
 
 # ===== HELPER FUNCTIONS =====
 
@@ -224,7 +226,8 @@ def system_settings(request):
 @user_passes_test(is_admin)
 def reset_history(request):
     """System reset and maintenance log"""
-    from .models import SystemResetLog, NetworkUsage, Client
+    from .models import SystemResetLog
+    from .system_reset import reset_summary, run_reset
     
     reset_logs = SystemResetLog.objects.all().select_related('reset_by').order_by('-reset_date')
     
@@ -233,17 +236,13 @@ def reset_history(request):
         reset_details = request.POST.get('reset_details', '')
         
         if reset_type:
-            # Perform the reset action based on type
-            if reset_type == 'network_stats':
-                deleted_count, _ = NetworkUsage.objects.all().delete()
-                details = f"Network statistics reset. Deleted {deleted_count} records."
-            elif reset_type == 'test_data':
-                # Example: Delete test clients
-                test_clients = Client.objects.filter(name__icontains='test')
-                deleted_count = test_clients.count()
-                test_clients.delete()
-                details = f"Test data reset. Deleted {deleted_count} test clients."
-            elif reset_type == 'cache':
+            # Data resets run in batches and log themselves
+            if reset_type in ('network_stats', 'test_data'):
+                log = run_reset(reset_type, user=request.user)
+                messages.success(request, f'Reset operation completed: {reset_summary(log)} deleted')
+                return redirect('reset_history')
+            
+            if reset_type == 'cache':
                 details = "System cache cleared."
             else:
                 details = reset_details or f"Manual reset: {reset_type}"
@@ -296,7 +295,7 @@ def billing_reports(request):
         start_date = end_date - timedelta(days=30)
     
     # Import models
-    from .models import Invoice, Payment, Client
+    from .models import Invoice, Client, RevenueDaily
     
     # Invoice statistics
     total_invoices = Invoice.objects.filter(created_at__range=[start_date, end_date]).count()
@@ -315,21 +314,26 @@ def billing_reports(request):
         total_amount=Sum('amount')
     ).order_by('-total_amount')
     
-    # Payment statistics
-    payment_stats = Payment.objects.filter(payment_date__range=[start_date, end_date]).aggregate(
-        total_payments=Count('id'),
-        total_collected=Sum('amount'),
-        avg_payment=Avg('amount')
+    # Payment statistics (from the daily revenue rollup)
+    period_rollup = RevenueDaily.objects.filter(date__range=[start_date.date(), end_date.date()])
+    payment_stats = period_rollup.aggregate(
+        total_payments=Sum('payment_count'),
+        total_collected=Sum('total')
+    )
+    payment_stats['total_payments'] = payment_stats['total_payments'] or 0
+    payment_stats['avg_payment'] = (
+        payment_stats['total_collected'] / payment_stats['total_payments'] if payment_stats['total_payments'] else None
     )
     
     # Payment method analysis
-    payment_methods = Payment.objects.filter(payment_date__range=[start_date, end_date]).values(
+    payment_methods = list(period_rollup.values(
         'payment_method'
     ).annotate(
-        count=Count('id'),
-        total=Sum('amount'),
-        avg=Avg('amount')
-    ).order_by('-total')
+        count=Sum('payment_count'),
+        total=Sum('total')
+    ).order_by('-total'))
+    for method in payment_methods:
+        method['avg'] = method['total'] / method['count'] if method['count'] else None
     
     # Collection performance
     total_invoiced_amount = Invoice.objects.filter(created_at__range=[start_date, end_date]).aggregate(
@@ -357,23 +361,24 @@ def billing_reports(request):
     ).order_by('-total_paid')[:10]  # Top 10 paying clients
     
     # Monthly billing trend
-    monthly_trend = []
-    for i in range(6):  # Last 6 months
-        month_start = end_date.replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        month_invoices = Invoice.objects.filter(created_at__range=[month_start, month_end])
-        month_payments = Payment.objects.filter(payment_date__range=[month_start, month_end])
-        
-        monthly_trend.append({
-            'month': month_start.strftime('%b %Y'),
-            'invoices_count': month_invoices.count(),
-            'invoices_amount': month_invoices.aggregate(total=Sum('amount'))['total'] or Decimal('0'),
-            'payments_count': month_payments.count(),
-            'payments_amount': month_payments.aggregate(total=Sum('amount'))['total'] or Decimal('0'),
-        })
-    
-    monthly_trend.reverse()
+    invoice_months = time_series(
+        Invoice.objects.all(), 'created_at', 'month', 6,
+        count=Count('id'), total=Sum('amount')
+    )
+    payment_months = time_series(
+        RevenueDaily.objects.all(), 'date', 'month', 6,
+        count=Sum('payment_count'), total=Sum('total')
+    )
+    monthly_trend = [
+        {
+            'month': invoices['label'],
+            'invoices_count': invoices['count'],
+            'invoices_amount': invoices['total'] or Decimal('0'),
+            'payments_count': payments['count'],
+            'payments_amount': payments['total'] or Decimal('0'),
+        }
+        for invoices, payments in zip(invoice_months, payment_months)
+    ]
     
     context = {
         'start_date': start_date.date(),
@@ -387,7 +392,7 @@ def billing_reports(request):
         
         # Payment metrics
         'payment_stats': payment_stats,
-        'payment_methods': list(payment_methods),
+        'payment_methods': payment_methods,
         'collection_rate': collection_rate,
         
         # Overdue analysis
@@ -419,7 +424,7 @@ def billing_reports_api(request):
     end_date = timezone.now()
     start_date = end_date - timedelta(days=30) if period == 'monthly' else end_date - timedelta(days=365)
     
-    from .models import Invoice, Payment
+    from .models import Invoice, RevenueDaily
     
     # Daily billing data for charts
     daily_invoices = Invoice.objects.filter(
@@ -429,11 +434,11 @@ def billing_reports_api(request):
         count=Count('id')
     ).order_by('date')
     
-    daily_payments = Payment.objects.filter(
-        payment_date__range=[start_date, end_date]
-    ).extra({'date': "date(payment_date)"}).values('date').annotate(
-        amount=Sum('amount'),
-        count=Count('id')
+    daily_payments = RevenueDaily.objects.filter(
+        date__range=[start_date.date(), end_date.date()]
+    ).values('date').annotate(
+        amount=Sum('total'),
+        count=Sum('payment_count')
     ).order_by('date')
     
     data = {
@@ -446,48 +451,31 @@ def billing_reports_api(request):
 
 @login_required
 def export_billing_report(request):
-    """Export billing report to CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="billing_report.csv"'
-    
-    writer = csv.writer(response)
-    
-    from .models import Invoice, Payment, Client
-    
-    # Write CSV headers
-    writer.writerow(['Billing Report', f'Generated: {timezone.now().strftime("%Y-%m-%d %H:%M")}'])
-    writer.writerow([])
-    
-    # Invoice summary
-    writer.writerow(['INVOICE SUMMARY'])
-    writer.writerow(['Total Invoices', Invoice.objects.count()])
-    writer.writerow(['Pending Invoices', Invoice.objects.filter(status='pending').count()])
-    writer.writerow(['Paid Invoices', Invoice.objects.filter(status='paid').count()])
-    writer.writerow(['Overdue Invoices', Invoice.objects.filter(due_date__lt=timezone.now().date(), status='pending').count()])
-    writer.writerow([])
-    
-    # Payment summary
-    writer.writerow(['PAYMENT SUMMARY'])
-    total_revenue = Payment.objects.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    writer.writerow(['Total Revenue', f'KSh {total_revenue:,.2f}'])
-    
-    # Payment methods
-    writer.writerow([])
-    writer.writerow(['PAYMENT METHODS'])
-    writer.writerow(['Method', 'Count', 'Amount'])
-    payment_methods = Payment.objects.values('payment_method').annotate(
-        count=Count('id'),
-        total=Sum('amount')
-    ).order_by('-total')
-    
-    for method in payment_methods:
-        writer.writerow([
-            method['payment_method'] or 'Unknown',
-            method['count'],
-            f'KSh {method["total"]:,.2f}'
-        ])
+    """Stream invoices as CSV (?start_date=&end_date= on the invoice date, ?status=, ?gzip=1)"""
+    from .models import Invoice
     
-    return response
+    try:
+        start_date, end_date = parse_date_range(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    
+    invoices = filter_dates(Invoice.objects.order_by('created_at'), 'created_at', start_date, end_date)
+    status = request.GET.get('status', 'all')
+    if status != 'all':
+        if status not in dict(Invoice.STATUS_CHOICES):
+            return HttpResponseBadRequest(f'Unknown invoice status: {status}')
+        invoices = invoices.filter(status=status)
+    
+    rows = export_rows(invoices, [
+        'invoice_number', 'client__name', 'client__username', 'client__service_plan__name',
+        'amount', 'status', 'created_at', 'due_date', 'paid_at',
+    ])
+    return streaming_csv_response(
+        'billing_report',
+        ['Invoice Number', 'Client', 'Username', 'Plan', 'Amount', 'Status', 'Created', 'Due Date', 'Paid At'],
+        rows,
+        compress=wants_gzip(request),
+    )
 
 # ===== SYSTEM REPORTS VIEWS =====
 
@@ -497,7 +485,7 @@ def system_reports(request):
     """Comprehensive system performance and operational reports"""
     
     # Import models
-    from .models import Client, ServicePlan, Invoice, Payment, NetworkUsage, SystemResetLog
+    from .models import Client, ServicePlan, Invoice, NetworkUsage, SystemResetLog, RevenueDaily
     
     # System overview metrics
     system_metrics = {
@@ -506,40 +494,39 @@ def system_reports(request):
         'total_service_plans': ServicePlan.objects.count(),
         'active_service_plans': ServicePlan.objects.filter(is_active=True).count(),
         'total_invoices': Invoice.objects.count(),
-        'total_payments': Payment.objects.count(),
+        'total_payments': RevenueDaily.objects.aggregate(count=Sum('payment_count'))['count'] or 0,
         'system_uptime': '99.9%',  # This would come from actual monitoring
     }
     
     # Client growth analysis
-    client_growth = []
-    for i in range(12):  # Last 12 months
-        month_start = timezone.now().replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        new_clients = Client.objects.filter(created_at__range=[month_start, month_end]).count()
-        churned_clients = Client.objects.filter(
-            is_active=False,
-            updated_at__range=[month_start, month_end]
-        ).count()
-        
-        client_growth.append({
-            'month': month_start.strftime('%b %Y'),
-            'new_clients': new_clients,
-            'churned_clients': churned_clients,
-            'net_growth': new_clients - churned_clients,
-        })
-    
-    client_growth.reverse()
+    new_by_month = time_series(Client.objects.all(), 'created_at', 'month', 12, count=Count('id'))
+    churned_by_month = time_series(Client.objects.filter(is_active=False), 'deactivated_at', 'month', 12, count=Count('id'))
+    client_growth = [
+        {
+            'month': new['label'],
+            'new_clients': new['count'],
+            'churned_clients': churned['count'],
+            'net_growth': new['count'] - churned['count'],
+        }
+        for new, churned in zip(new_by_month, churned_by_month)
+    ]
     
     # Service plan distribution
-    plan_distribution = Client.objects.values(
+    revenue_by_plan = dict(
+        RevenueDaily.objects.values('service_plan').annotate(
+            total=Sum('total')
+        ).order_by().values_list('service_plan', 'total')
+    )
+    plan_distribution = list(Client.objects.values(
+        'service_plan',
         'service_plan__name',
         'service_plan__price'
     ).annotate(
         client_count=Count('id'),
-        active_clients=Count('id', filter=Q(is_active=True)),
-        total_revenue=Sum('payment__amount')
-    ).order_by('-client_count')
+        active_clients=Count('id', filter=Q(is_active=True))
+    ).order_by('-client_count'))
+    for plan in plan_distribution:
+        plan['total_revenue'] = revenue_by_plan.get(plan['service_plan'])
     
     # System performance metrics (mock data - would come from monitoring)
     performance_metrics = {
@@ -552,13 +539,15 @@ def system_reports(request):
     }
     
     # Network usage statistics
+    # Totals span the daily and monthly tiers; averages are per day over the daily tier
     network_stats = NetworkUsage.objects.aggregate(
-        total_download=Sum('download_bytes'),
-        total_upload=Sum('upload_bytes'),
         average_download=Avg('download_bytes'),
         average_upload=Avg('upload_bytes'),
         total_records=Count('id')
     )
+    usage = usage_totals()
+    network_stats['total_download'] = usage['download_bytes']
+    network_stats['total_upload'] = usage['upload_bytes']
     
     # Convert bytes to GB for readability
     if network_stats['total_download']:
@@ -569,22 +558,14 @@ def system_reports(request):
     maintenance_logs = SystemResetLog.objects.all().order_by('-reset_date')[:10]
     
     # Revenue trends
-    revenue_trend = []
-    for i in range(6):  # Last 6 months
-        month_start = timezone.now().replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        monthly_revenue = Payment.objects.filter(
-            payment_date__range=[month_start, month_end]
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        revenue_trend.append({
-            'month': month_start.strftime('%b %Y'),
-            'revenue': float(monthly_revenue),
+    revenue_trend = [
+        {
+            'month': month['label'],
+            'revenue': float(month['revenue']),
             'growth': 0  # Would calculate actual growth
-        })
-    
-    revenue_trend.reverse()
+        }
+        for month in time_series(RevenueDaily.objects.all(), 'date', 'month', 6, revenue=Sum('total'))
+    ]
     
     # System health indicators
     health_indicators = {
@@ -597,7 +578,7 @@ def system_reports(request):
     
     # Operational efficiency metrics
     efficiency_metrics = {
-        'arpu': Payment.objects.aggregate(total=Sum('amount'))['total'] / Client.objects.filter(is_active=True).count() if Client.objects.filter(is_active=True).exists() else 0,
+        'arpu': (RevenueDaily.objects.aggregate(total=Sum('total'))['total'] or 0) / Client.objects.filter(is_active=True).count() if Client.objects.filter(is_active=True).exists() else 0,
         'client_retention_rate': 85.5,  # Would calculate actual retention
         'invoice_processing_time': '2.3 days',  # Average time to process invoices
         'payment_processing_time': '1.1 days',  # Average time to process payments
@@ -606,7 +587,7 @@ def system_reports(request):
     context = {
         'system_metrics': system_metrics,
         'client_growth': client_growth,
-        'plan_distribution': list(plan_distribution),
+        'plan_distribution': plan_distribution,
         'performance_metrics': performance_metrics,
         'network_stats': network_stats,
         'maintenance_logs': maintenance_logs,
@@ -621,38 +602,19 @@ def system_reports(request):
 @user_passes_test(is_admin)
 def system_reports_api(request):
     """API endpoint for system data"""
-    from .models import Client, Payment
+    from .models import Client, RevenueDaily
     
     # Client growth data for charts
-    monthly_growth = []
-    for i in range(12):
-        month_start = timezone.now().replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        new_clients = Client.objects.filter(created_at__range=[month_start, month_end]).count()
-        monthly_growth.append({
-            'month': month_start.strftime('%b %Y'),
-            'new_clients': new_clients,
-        })
-    
-    monthly_growth.reverse()
+    monthly_growth = [
+        {'month': month['label'], 'new_clients': month['count']}
+        for month in time_series(Client.objects.all(), 'created_at', 'month', 12, count=Count('id'))
+    ]
     
     # Revenue data
-    monthly_revenue = []
-    for i in range(12):
-        month_start = timezone.now().replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        revenue = Payment.objects.filter(
-            payment_date__range=[month_start, month_end]
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        monthly_revenue.append({
-            'month': month_start.strftime('%b %Y'),
-            'revenue': float(revenue),
-        })
-    
-    monthly_revenue.reverse()
+    monthly_revenue = [
+        {'month': month['label'], 'revenue': float(month['revenue'])}
+        for month in time_series(RevenueDaily.objects.all(), 'date', 'month', 12, revenue=Sum('total'))
+    ]
     
     data = {
         'monthly_growth': monthly_growth,
@@ -664,61 +626,45 @@ def system_reports_api(request):
 @login_required
 @user_passes_test(is_admin)
 def export_system_report(request):
-    """Export system report to CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="system_report.csv"'
+    """Stream one CSV row per client (?start_date=&end_date= on the signup date, ?status=, ?gzip=1)"""
+    from .models import Client
     
-    writer = csv.writer(response)
-    
-    from .models import Client, ServicePlan, Invoice, Payment
-    
-    # System overview
-    writer.writerow(['SYSTEM OVERVIEW REPORT'])
-    writer.writerow(['Generated', timezone.now().strftime('%Y-%m-%d %H:%M')])
-    writer.writerow([])
-    
-    writer.writerow(['CLIENT STATISTICS'])
-    writer.writerow(['Total Clients', Client.objects.count()])
-    writer.writerow(['Active Clients', Client.objects.filter(is_active=True).count()])
-    writer.writerow(['Inactive Clients', Client.objects.filter(is_active=False).count()])
-    writer.writerow([])
-    
-    writer.writerow(['SERVICE PLAN DISTRIBUTION'])
-    writer.writerow(['Plan Name', 'Total Clients', 'Active Clients'])
-    plan_distribution = Client.objects.values(
-        'service_plan__name'
-    ).annotate(
-        total=Count('id'),
-        active=Count('id', filter=Q(is_active=True))
-    ).order_by('-total')
-    
-    for plan in plan_distribution:
-        writer.writerow([
-            plan['service_plan__name'],
-            plan['total'],
-            plan['active']
-        ])
-    
-    writer.writerow([])
-    writer.writerow(['FINANCIAL OVERVIEW'])
-    total_revenue = Payment.objects.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    writer.writerow(['Total Revenue', f'KSh {total_revenue:,.2f}'])
-    writer.writerow(['Total Invoices', Invoice.objects.count()])
-    writer.writerow(['Pending Invoices', Invoice.objects.filter(status='pending').count()])
-    
-    return response
+    try:
+        start_date, end_date = parse_date_range(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    
+    clients = filter_dates(Client.objects.order_by('created_at'), 'created_at', start_date, end_date)
+    status = request.GET.get('status', 'all')
+    if status != 'all':
+        if status not in dict(Client.STATUS_CHOICES):
+            return HttpResponseBadRequest(f'Unknown client status: {status}')
+        clients = clients.filter(status=status)
+    
+    rows = export_rows(clients, [
+        'id', 'name', 'username', 'phone', 'email', 'client_type', 'service_plan__name',
+        'monthly_fee', 'balance', 'status', 'is_active', 'provisioning_status',
+        'created_at', 'last_payment_date', 'next_payment_date',
+    ])
+    return streaming_csv_response(
+        'system_report',
+        ['Client ID', 'Name', 'Username', 'Phone', 'Email', 'Type', 'Plan', 'Monthly Fee', 'Balance',
+         'Status', 'Active', 'Provisioning', 'Created', 'Last Payment', 'Next Payment'],
+        rows,
+        compress=wants_gzip(request),
+    )
 
 # ===== API ENDPOINTS =====
 
 @login_required
 def api_system_stats(request):
     """API endpoint for system statistics"""
-    from .models import Client, Payment, Invoice, ServicePlan
+    from .models import Client, Invoice, RevenueDaily, ServicePlan
     
     stats = {
         'total_clients': Client.objects.count(),
         'active_clients': Client.objects.filter(is_active=True).count(),
-        'total_revenue': Payment.objects.aggregate(total=Sum('amount'))['total'] or Decimal('0'),
+        'total_revenue': RevenueDaily.objects.aggregate(total=Sum('total'))['total'] or Decimal('0'),
         'pending_invoices': Invoice.objects.filter(status='pending').count(),
         'active_packages': ServicePlan.objects.filter(is_active=True).count(),
     }
@@ -733,13 +679,14 @@ def api_perform_reset(request):
             data = json.loads(request.body)
             reset_type = data.get('reset_type')
             
-            from .models import NetworkUsage, SystemResetLog
+            from .models import SystemResetLog
+            from .system_reset import reset_summary, run_reset
             
             if reset_type == 'network_stats':
-                deleted_count, _ = NetworkUsage.objects.all().delete()
-                message = f"Network statistics reset. Deleted {deleted_count} records."
-            else:
-                message = f"Reset operation: {reset_type}"
+                log = run_reset(reset_type, user=request.user)
+                return JsonResponse({'success': True, 'message': f"Network statistics reset. Deleted {reset_summary(log)}."})
+            
+            message = f"Reset operation: {reset_type}"
             
             # Log the action
             SystemResetLog.objects.create(
@@ -0,0 +1,75 @@
+# DASHBOARD SNAPSHOT CACHE
+# Dashboard figures are computed once and shared through the Django cache (Redis when
+# configured). Snapshots belong to a family with its own generation number: saving or
+# deleting a client, payment or invoice bumps the billing generation, which marks the billing
+# snapshots stale and leaves the usage analytics alone. Only the worker holding the rebuild
+# lock recomputes a stale snapshot; everyone else keeps serving the previous copy meanwhile.
+#
+# Invalidation reaches other workers only through a shared cache. With the default
+# LocMemCache (no REDIS_URL) each process has its own generations, so other processes keep
+# serving their copy until SNAPSHOT_TTL runs out.
+
+import time
+from django.core.cache import cache
+
+SNAPSHOT_PREFIX = 'dashboard:snapshot:'
+GENERATION_PREFIX = 'dashboard:generation:'
+
+# Snapshot families: billing figures (clients, invoices, payments) and usage analytics
+BILLING = 'billing'
+USAGE = 'usage'
+FAMILIES = (BILLING, USAGE)
+
+# Seconds a snapshot is served before it is recomputed even without changes
+SNAPSHOT_TTL = 60
+# How long a stale copy is kept around to serve during a rebuild
+STALE_TTL = 60 * 60
+# A rebuild lock is dropped after this long in case its worker died
+LOCK_TIMEOUT = 30
+
+def current_generation(family=BILLING):
+    return cache.get_or_set(GENERATION_PREFIX + family, 1, timeout=None)
+
+def invalidate_dashboard(families=(BILLING,)):
+    """Mark the snapshots of the given families stale (billing by default)"""
+    for family in families:
+        key = GENERATION_PREFIX + family
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Key missing (evicted or never set): any stored snapshot has an older generation
+            cache.set(key, int(time.time()), timeout=None)
+
+def get_snapshot(name, builder, ttl=SNAPSHOT_TTL, wait=5.0, family=BILLING):
+    """Return builder()'s result from the cache, recomputing it in at most one worker at a time"""
+    key = SNAPSHOT_PREFIX + name
+    generation = current_generation(family)
+    entry = cache.get(key)
+    if entry and entry['generation'] == generation and entry['fresh_until'] > time.time():
+        return entry['data']
+
+    lock_key = key + ':lock'
+    if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        try:
+            data = builder()
+            cache.set(key, {
+                'data': data,
+                'generation': generation,
+                'fresh_until': time.time() + ttl,
+            }, timeout=STALE_TTL)
+            return data
+        finally:
+            cache.delete(lock_key)
+
+    # Someone else is rebuilding: serve the stale copy if there is one
+    if entry:
+        return entry['data']
+
+    # Cold cache: wait briefly for the rebuild rather than piling onto the database
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry:
+            return entry['data']
+    return builder()
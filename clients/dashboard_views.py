@@ -1,8 +1,9 @@
 from django.shortcuts import render
 from django.db.models import Sum, Count, Avg, Q
 from django.utils import timezone
-from datetime import datetime, timedelta
-from .models import Client, Payment, ServicePlan
+from datetime import date, datetime, timedelta
+from .models import Client, Payment, RevenueDaily, ServicePlan
+from .reporting.periods import time_series
 import calendar
 
 def admin_dashboard(request):
@@ -13,66 +14,39 @@ def admin_dashboard(request):
     
     # ===== REAL DATA CALCULATIONS =====
     
+    # Revenue figures are read from the daily revenue rollup, one grouped query per series
+    revenue = RevenueDaily.objects.all()
+    
+    # Monthly revenue trend for line graph (last 6 months including current)
+    monthly_trend = [
+        {
+            'month': month['start'].strftime('%b'),
+            'revenue': float(month['revenue']),
+            'full_month': month['start'].strftime('%B %Y')
+        }
+        for month in time_series(revenue, 'date', 'month', 6, revenue=Sum('total'))
+    ]
+    
     # Monthly revenue (resets each month) - CURRENT MONTH ONLY
-    monthly_revenue_current = Payment.objects.filter(
-        payment_date__year=current_year,
-        payment_date__month=current_month,
-        status='Completed'
-    ).aggregate(total=Sum('amount'))['total'] or 0
-
+    monthly_revenue_current = monthly_trend[-1]['revenue']
+    
+    # Quarterly revenue for the previous and current year
+    quarters = time_series(
+        revenue, 'date', 'quarter', 8, end=date(current_year, 12, 31), revenue=Sum('total')
+    )
+    previous_quarters, current_quarters = quarters[:4], quarters[4:]
+    
     # Yearly revenue data
     yearly_revenue = {
-        'total': 0,
-        'q1': 0, 'q2': 0, 'q3': 0, 'q4': 0
+        f'q{quarter}': float(current_quarters[quarter - 1]['revenue']) for quarter in range(1, 5)
     }
-    
-    # Current year quarterly revenue
-    for quarter in range(1, 5):
-        start_month = (quarter - 1) * 3 + 1
-        end_month = quarter * 3
-        
-        quarter_payments = Payment.objects.filter(
-            payment_date__year=current_year,
-            payment_date__month__gte=start_month,
-            payment_date__month__lte=end_month,
-            status='Completed'
-        )
-        revenue = quarter_payments.aggregate(total=Sum('amount'))['total'] or 0
-        yearly_revenue[f'q{quarter}'] = float(revenue)
-    
-    # Total yearly revenue
     yearly_revenue['total'] = sum([yearly_revenue['q1'], yearly_revenue['q2'], yearly_revenue['q3'], yearly_revenue['q4']])
     
-    # Monthly revenue trend for line graph (last 6 months)
-    monthly_trend = []
-    for i in range(5, -1, -1):  # Last 6 months including current
-        month_date = timezone.now() - timedelta(days=30*i)
-        month_year = month_date.year
-        month_num = month_date.month
-        
-        month_payments = Payment.objects.filter(
-            payment_date__year=month_year,
-            payment_date__month=month_num,
-            status='Completed'
-        )
-        revenue = month_payments.aggregate(total=Sum('amount'))['total'] or 0
-        
-        monthly_trend.append({
-            'month': month_date.strftime('%b'),
-            'revenue': float(revenue),
-            'full_month': month_date.strftime('%B %Y')
-        })
-    
     # Calculate quarterly growth
     quarterly_growth = []
     for quarter in range(1, 5):
         current_q_revenue = yearly_revenue[f'q{quarter}']
-        previous_q_revenue = Payment.objects.filter(
-            payment_date__year=previous_year,
-            payment_date__month__gte=(quarter - 1) * 3 + 1,
-            payment_date__month__lte=quarter * 3,
-            status='Completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        previous_q_revenue = float(previous_quarters[quarter - 1]['revenue'])
         
         if previous_q_revenue > 0:
             growth = ((current_q_revenue - previous_q_revenue) / previous_q_revenue) * 100
@@ -87,27 +61,32 @@ def admin_dashboard(request):
     
     # Client statistics
     total_clients = Client.objects.count()
-    active_clients = Client.objects.filter(status='Active').count()
-    suspended_clients = Client.objects.filter(status='Suspended').count()
+    active_clients = Client.objects.filter(status='active').count()
+    suspended_clients = Client.objects.filter(status='suspended').count()
     
     # Total revenue (all time)
-    total_revenue = Payment.objects.filter(status='Completed').aggregate(total=Sum('amount'))['total'] or 0
+    total_revenue = RevenueDaily.objects.aggregate(total=Sum('total'))['total'] or 0
     
     # Service plan distribution with revenue
     service_stats = []
     service_plans = ServicePlan.objects.all()
+    current_month_start = date(current_year, current_month, 1)
+    plan_revenue_current = dict(
+        revenue.filter(date__gte=current_month_start).values('service_plan').annotate(
+            total=Sum('total')
+        ).order_by().values_list('service_plan', 'total')
+    )
+    plan_client_counts = dict(
+        Client.objects.filter(status='active').values('service_plan').annotate(
+            count=Count('id')
+        ).order_by().values_list('service_plan', 'count')
+    )
     
     for plan in service_plans:
-        plan_clients = Client.objects.filter(service_plan=plan, status='Active')
-        client_count = plan_clients.count()
+        client_count = plan_client_counts.get(plan.pk, 0)
         
         # Calculate monthly revenue for this service plan
-        plan_revenue = Payment.objects.filter(
-            client__service_plan=plan,
-            payment_date__year=current_year,
-            payment_date__month=current_month,
-            status='Completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        plan_revenue = plan_revenue_current.get(plan.pk) or 0
         
         service_stats.append({
             'service_type': plan.name,
@@ -118,15 +97,15 @@ def admin_dashboard(request):
     # ===== REAL DATA FOR SIDEBAR SECTIONS =====
     
     # Recent payments (last 5 completed payments)
-    recent_payments = Payment.objects.filter(status='Completed').select_related('client').order_by('-payment_date')[:5]
+    recent_payments = Payment.objects.select_related('client').order_by('-payment_date')[:5]
     
     # Top data users (you'll need to add data usage tracking to your Client model)
     # For now, using active clients as placeholder
     top_data_users = []
-    active_clients_list = Client.objects.filter(status='Active')[:5]
+    active_clients_list = Client.objects.filter(status='active').select_related('service_plan')[:5]
     for client in active_clients_list:
         top_data_users.append({
-            'client_name': client.full_name or client.username,
+            'client_name': client.name or client.username,
             'service_type': client.service_plan.name if client.service_plan else 'No Plan',
             'data_used': 0,  # Replace with actual data usage field
             'data_limit': 0,  # Replace with actual data limit field
@@ -135,27 +114,28 @@ def admin_dashboard(request):
     
     # Bandwidth alerts (based on service usage - customize as needed)
     bandwidth_alerts = []
-    high_usage_clients = Client.objects.filter(status='Active')[:3]  # Example: first 3 active clients
+    high_usage_clients = Client.objects.filter(status='active').select_related('service_plan')[:3]  # Example: first 3 active clients
     for client in high_usage_clients:
         bandwidth_alerts.append({
-            'client_name': client.full_name or client.username,
+            'client_name': client.name or client.username,
             'service_type': client.service_plan.name if client.service_plan else 'No Plan',
             'usage_percentage': 85,  # Replace with actual usage calculation
             'alert_type': 'high_usage'
         })
     
     # Expiring soon (clients with upcoming billing dates)
-    next_week = timezone.now() + timedelta(days=7)
+    today = timezone.localdate()
+    next_week = today + timedelta(days=7)
     expiring_soon = Client.objects.filter(
-        status='Active',
-        next_billing_date__lte=next_week,
-        next_billing_date__gte=timezone.now()
+        status='active',
+        next_payment_date__lte=next_week,
+        next_payment_date__gte=today
     )[:5]
     
     # Overdue clients
     overdue_clients = Client.objects.filter(
-        status='Active',
-        next_billing_date__lt=timezone.now()
+        status='active',
+        next_payment_date__lt=today
     )[:5]
     
     # Bandwidth stats (replace with your actual bandwidth tracking)
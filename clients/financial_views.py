@@ -1,11 +1,11 @@
 ﻿from django.shortcuts import render, redirect
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponseBadRequest
 from django.db.models import Sum, Count, Avg
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
-import csv
+from .reporting.exports import export_rows, filter_dates, parse_date_range, streaming_csv_response, wants_gzip
 
 @login_required
 def financial_reports(request):
@@ -35,19 +35,18 @@ def financial_reports(request):
         end_date = datetime.strptime(custom_end, '%Y-%m-%d')
     
     # Import models here to avoid circular imports
-    from .models import Client, Payment, Invoice, ServicePlan
+    from .models import Client, Invoice, RevenueDaily, ServicePlan
+    
+    # Revenue comes from the daily rollup rather than the payments table
+    period_rollup = RevenueDaily.objects.filter(date__range=[start_date.date(), end_date.date()])
     
     # Calculate key financial metrics
-    period_revenue = Payment.objects.filter(
-        payment_date__range=[start_date, end_date]
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    period_revenue = period_rollup.aggregate(total=Sum('total'))['total'] or Decimal('0')
     
     # Revenue by payment method
-    revenue_by_method = Payment.objects.filter(
-        payment_date__range=[start_date, end_date]
-    ).values('payment_method').annotate(
-        total=Sum('amount'),
-        count=Count('id')
+    revenue_by_method = period_rollup.values('payment_method').annotate(
+        total=Sum('total'),
+        count=Sum('payment_count')
     ).order_by('-total')
     
     # Active clients and ARPU
@@ -77,12 +76,19 @@ def financial_reports(request):
     
     # Service plan performance
     plan_performance = []
+    clients_by_plan = dict(
+        Client.objects.filter(is_active=True).values('service_plan').annotate(
+            count=Count('id')
+        ).order_by().values_list('service_plan', 'count')
+    )
+    revenue_by_plan = dict(
+        period_rollup.values('service_plan').annotate(
+            total=Sum('total')
+        ).order_by().values_list('service_plan', 'total')
+    )
     for plan in ServicePlan.objects.all():
-        plan_clients = Client.objects.filter(service_plan=plan, is_active=True).count()
-        plan_revenue = Payment.objects.filter(
-            client__service_plan=plan,
-            payment_date__range=[start_date, end_date]
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        plan_clients = clients_by_plan.get(plan.pk, 0)
+        plan_revenue = revenue_by_plan.get(plan.pk) or Decimal('0')
         
         if plan_clients > 0:
             avg_revenue = plan_revenue / plan_clients
@@ -121,13 +127,13 @@ def financial_reports_api(request):
     else:
         start_date = end_date - timedelta(days=365)
     
-    from .models import Payment
+    from .models import RevenueDaily
     
     # Revenue by day for charts
-    revenue_by_day = Payment.objects.filter(
-        payment_date__range=[start_date, end_date]
-    ).extra({'date': "date(payment_date)"}).values('date').annotate(
-        total=Sum('amount')
+    revenue_by_day = RevenueDaily.objects.filter(
+        date__range=[start_date.date(), end_date.date()]
+    ).values('date').annotate(
+        total=Sum('total')
     ).order_by('date')
     
     data = {
@@ -139,28 +145,28 @@ def financial_reports_api(request):
 
 @login_required
 def export_financial_report(request):
-    """Export financial report to CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="financial_report.csv"'
-    
-    writer = csv.writer(response)
-    
-    # Get basic financial data
-    from .models import Client, Payment, Invoice
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=30)
-    
-    period_revenue = Payment.objects.filter(
-        payment_date__range=[start_date, end_date]
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    # Write CSV
-    writer.writerow(['Financial Report', f'Period: {start_date.date()} to {end_date.date()}'])
-    writer.writerow([])
-    writer.writerow(['Metric', 'Value'])
-    writer.writerow(['Total Revenue', f'KSh {period_revenue:,.2f}'])
-    writer.writerow(['Active Clients', Client.objects.filter(is_active=True).count()])
-    writer.writerow(['Pending Invoices', Invoice.objects.filter(status='pending').count()])
-    writer.writerow(['Collection Rate', f'{(period_revenue / Invoice.objects.filter(created_at__range=[start_date, end_date]).aggregate(total=Sum("amount"))["total"] * 100) if Invoice.objects.filter(created_at__range=[start_date, end_date]).exists() else 0:.1f}%'])
+    """Stream payments as CSV (?start_date=&end_date= on the payment date, ?method=, ?gzip=1)"""
+    from .models import Payment
     
-    return response
+    try:
+        start_date, end_date = parse_date_range(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    
+    payments = filter_dates(Payment.objects.order_by('payment_date'), 'payment_date', start_date, end_date)
+    method = request.GET.get('method', 'all')
+    if method != 'all':
+        if method not in dict(Payment.PAYMENT_METHODS):
+            return HttpResponseBadRequest(f'Unknown payment method: {method}')
+        payments = payments.filter(payment_method=method)
+    
+    rows = export_rows(payments, [
+        'payment_date', 'transaction_id', 'client__name', 'client__username', 'service_plan__name',
+        'payment_method', 'amount', 'invoice__invoice_number', 'notes',
+    ])
+    return streaming_csv_response(
+        'financial_report',
+        ['Date', 'Transaction ID', 'Client', 'Username', 'Plan', 'Method', 'Amount', 'Invoice', 'Notes'],
+        rows,
+        compress=wants_gzip(request),
+    )
@@ -33,3 +33,22 @@ class ClientForm(forms.ModelForm):
             ('Business', 'Business'),
             ('Corporate', 'Corporate'),
         ]
+
+class PaymentStatementUploadForm(forms.Form):
+    # Several months of payments; larger statements go through the import_payments command
+    MAX_SIZE = 20 * 1024 * 1024
+    
+    statement = forms.FileField(
+        help_text='M-Pesa statement in CSV format (up to 20 MB)',
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv'})
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        help_text='Match and count rows without saving payments'
+    )
+    
+    def clean_statement(self):
+        statement = self.cleaned_data['statement']
+        if statement.size > self.MAX_SIZE:
+            raise forms.ValidationError('Statements over 20 MB must be imported with the import_payments command')
+        return statement
@@ -0,0 +1,126 @@
+# CLIENT BALANCE LEDGER
+# Every balance change is written as a LedgerEntry and applied with F() expressions,
+# so concurrent writers never overwrite each other's balance updates.
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .dashboard_cache import invalidate_dashboard
+from .models import Client, LedgerEntry, Payment
+from .revenue import apply_revenue_changes
+
+def post_entry(entry):
+    """Insert one ledger entry and apply it to the client's balance"""
+    with transaction.atomic():
+        entry.save()
+        Client.objects.filter(pk=entry.client_id).update(
+            balance=F('balance') + entry.amount, updated_at=timezone.now()
+        )
+    return entry
+
+def post_entries(entries, batch_size=1000):
+    """Bulk insert ledger entries and apply all balance changes with one UPDATE"""
+    deltas = defaultdict(Decimal)
+    for entry in entries:
+        deltas[entry.client_id] += Decimal(entry.amount)
+
+    with transaction.atomic():
+        created = LedgerEntry.objects.bulk_create(entries, batch_size=batch_size)
+        apply_balance_deltas(deltas)
+    return created
+
+def record_payments(payments, batch_size=1000):
+    """Bulk insert payments with their ledger entries and update balances with one UPDATE.
+
+    Used by statement imports and callback processing instead of Payment.save(),
+    which costs several queries per payment.
+    """
+    missing_plan = {payment.client_id for payment in payments if payment.service_plan_id is None}
+    if missing_plan:
+        plans = dict(Client.objects.filter(pk__in=missing_plan).values_list('pk', 'service_plan_id'))
+        for payment in payments:
+            if payment.service_plan_id is None:
+                payment.service_plan_id = plans.get(payment.client_id)
+
+    with transaction.atomic():
+        created = Payment.objects.bulk_create(payments, batch_size=batch_size)
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(
+                client_id=payment.client_id,
+                payment=payment,
+                invoice_id=payment.invoice_id,
+                entry_type='payment',
+                amount=-payment.amount,
+                description=payment.transaction_id or f"{payment.get_payment_method_display()} payment"
+            )
+            for payment in created
+        ], batch_size=batch_size)
+
+        deltas = defaultdict(Decimal)
+        payment_dates = {}
+        for payment in created:
+            deltas[payment.client_id] -= Decimal(payment.amount)
+            paid_on = timezone.localdate(payment.payment_date)
+            if payment.client_id not in payment_dates or paid_on > payment_dates[payment.client_id]:
+                payment_dates[payment.client_id] = paid_on
+
+        apply_balance_deltas(deltas, payment_dates=payment_dates)
+        apply_revenue_changes([(payment, 1) for payment in created])
+        # bulk_create sends no signals
+        transaction.on_commit(invalidate_dashboard)
+    return created
+
+def apply_balance_deltas(deltas, payment_dates=None):
+    """Add {client_id: amount} to client balances with one UPDATE ... FROM (VALUES ...) statement.
+
+    When payment_dates ({client_id: date}) is given, last/next payment dates are moved
+    forward in the same statement. Works on SQLite 3.33+ and PostgreSQL.
+    """
+    payment_dates = payment_dates or {}
+    client_ids = [client_id for client_id in set(deltas) | set(payment_dates) if deltas.get(client_id) or client_id in payment_dates]
+    if not client_ids:
+        return 0
+
+    table = connection.ops.quote_name(Client._meta.db_table)
+    now = timezone.now()
+    # PostgreSQL types untyped VALUES parameters as text, which cannot be compared with a date
+    # column. SQLite must not cast: CAST('2025-01-31' AS date) gives it the number 2025.
+    if connection.vendor == 'postgresql':
+        row = '(CAST(%s AS bigint), CAST(%s AS numeric), CAST(%s AS date), CAST(%s AS date))'
+    else:
+        row = '(%s, %s, %s, %s)'
+    updated = 0
+    for start in range(0, len(client_ids), 1000):
+        chunk = client_ids[start:start + 1000]
+        params = [now]
+        for client_id in chunk:
+            paid_on = payment_dates.get(client_id)
+            params += [
+                client_id,
+                Decimal(deltas.get(client_id, 0)),
+                paid_on.isoformat() if paid_on else None,
+                (paid_on + timedelta(days=30)).isoformat() if paid_on else None,
+            ]
+        values = ', '.join([row] * len(chunk))
+
+        # VALUES columns are named column1..column4 on both backends
+        sql = f"""
+            UPDATE {table} SET
+                updated_at = %s,
+                balance = {table}.balance + v.column2,
+                last_payment_date = CASE
+                    WHEN v.column3 IS NOT NULL AND ({table}.last_payment_date IS NULL OR {table}.last_payment_date < v.column3)
+                    THEN v.column3 ELSE {table}.last_payment_date END,
+                next_payment_date = CASE
+                    WHEN v.column4 IS NOT NULL AND ({table}.next_payment_date IS NULL OR {table}.next_payment_date < v.column4)
+                    THEN v.column4 ELSE {table}.next_payment_date END
+            FROM (VALUES {values}) AS v
+            WHERE {table}.id = v.column1
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            updated += cursor.rowcount
+    return updated
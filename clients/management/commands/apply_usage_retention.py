@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from clients.usage_retention import apply_retention, retention_settings
+
+class Command(BaseCommand):
+    help = 'Roll network usage up to hourly, daily and monthly totals and purge expired rows'
+
+    def handle(self, *args, **options):
+        config = retention_settings()
+        self.stdout.write(
+            'Keeping raw {usage_raw_retention_days}d, hourly {usage_hourly_retention_days}d, '
+            'daily {usage_daily_retention_days}d, monthly {usage_monthly_retention_days}d '
+            '(0 = forever), batch size {usage_retention_batch_size}'.format(**config)
+        )
+
+        result = apply_retention()
+        for tier in ('raw', 'hourly', 'daily', 'monthly'):
+            self.stdout.write(f"  {tier}: {result[f'{tier}_deleted']} rows deleted")
+
+        self.stdout.write(self.style.SUCCESS('Usage retention applied'))
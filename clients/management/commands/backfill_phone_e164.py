@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from clients.models import Client
+from clients.phones import BACKFILL_BATCH_SIZE, backfill_phone_e164
+
+class Command(BaseCommand):
+    help = 'Normalize every client phone into the indexed phone_e164 column (safe to run again)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BACKFILL_BATCH_SIZE,
+            help='Clients normalized per query'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        started = time.monotonic()
+        changed = backfill_phone_e164(
+            Client,
+            batch_size=options['batch_size'],
+            progress=lambda last, changed: self.stdout.write(f'  up to client {last}: {changed} updated'),
+        )
+        elapsed = time.monotonic() - started
+
+        unmatched = Client.objects.filter(phone_e164='').count()
+        self.stdout.write(f'{unmatched} clients have no usable Kenyan phone number')
+        self.stdout.write(self.style.SUCCESS(f'Normalized {changed} phone numbers in {elapsed:.2f}s'))
@@ -0,0 +1,82 @@
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from clients.models import InvoiceSequence
+from clients.sequences import InvoiceNumberAllocator
+
+class Command(BaseCommand):
+    help = 'Benchmark the invoice number allocator with parallel writers and check for collisions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--writers',
+            type=int,
+            default=8,
+            help='Number of parallel writers (each simulates one gunicorn worker)'
+        )
+        parser.add_argument(
+            '--numbers',
+            type=int,
+            default=5000,
+            help='Invoice numbers requested per writer'
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=100,
+            help='Numbers reserved per counter update'
+        )
+
+    def handle(self, *args, **options):
+        writers = options['writers']
+        per_writer = options['numbers']
+        block_size = options['block_size']
+        if writers < 1 or per_writer < 1 or block_size < 1:
+            raise CommandError('--writers, --numbers and --block-size must be positive')
+
+        # Use a throwaway prefix so real invoice counters are untouched
+        prefix = f"BENCH{int(time.time())}"
+        results = [None] * writers
+        errors = []
+        barrier = threading.Barrier(writers)
+
+        def writer(index):
+            allocator = InvoiceNumberAllocator(block_size=block_size)
+            numbers = []
+            try:
+                barrier.wait()
+                for _ in range(per_writer):
+                    numbers.append(allocator.next_number(prefix))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                results[index] = numbers
+                connection.close()
+
+        self.stdout.write(
+            f'Allocating {writers} x {per_writer} numbers (block size {block_size}) on {connection.vendor}...'
+        )
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        InvoiceSequence.objects.filter(prefix=prefix).delete()
+
+        allocated = [number for numbers in results for number in numbers]
+        collisions = len(allocated) - len(set(allocated))
+        rate = len(allocated) / elapsed if elapsed > 0 else len(allocated)
+
+        self.stdout.write(f'Allocated: {len(allocated)} numbers in {elapsed:.2f}s - {rate:,.0f} numbers/sec')
+        self.stdout.write(f'Counter updates: {writers * -(-per_writer // block_size)}')
+
+        if errors:
+            raise CommandError(f'{len(errors)} writers failed: {errors[0]}')
+        if collisions:
+            raise CommandError(f'{collisions} duplicate invoice numbers allocated')
+
+        self.stdout.write(self.style.SUCCESS('No collisions'))
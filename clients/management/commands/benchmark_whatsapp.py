@@ -0,0 +1,89 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from clients.models import OutboundMessage
+from clients.outbox import insert_messages, new_campaign
+from clients.twilio_standin import TwilioStandIn
+from clients.whatsapp_service import WHATSAPP_CONCURRENCY, WHATSAPP_RATE, WhatsAppService
+
+class Command(BaseCommand):
+    help = 'Benchmark the WhatsApp bulk sender against a local stand-in for the Twilio API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=1000,
+            help='Messages to send'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=WHATSAPP_CONCURRENCY,
+            help='Requests in flight at once (1 behaves like the old sequential loop)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=WHATSAPP_RATE,
+            help='Sender limit in requests per second (0 for no limit)'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=0,
+            help='Stand-in limit in requests per second before it answers 429 (0 for no limit)'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.2,
+            help='Seconds the stand-in takes to answer each request'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Share of requests the stand-in answers with 503'
+        )
+
+    def handle(self, *args, **options):
+        if options['messages'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--messages and --concurrency must be positive')
+
+        standin = TwilioStandIn(
+            limit=options['limit'], latency=options['latency'], error_rate=options['error_rate']
+        ).start()
+        service = WhatsAppService(concurrency=options['concurrency'], rate=options['rate'], api_url=standin.url)
+
+        # Throwaway messages that no worker claims, deleted afterwards
+        campaign = new_campaign('benchmark')
+        insert_messages(
+            [(None, f'07{index:08d}', f'Benchmark message {index}') for index in range(options['messages'])],
+            'whatsapp', campaign, status='processing'
+        )
+        messages = list(OutboundMessage.objects.filter(campaign=campaign).order_by('pk'))
+
+        self.stdout.write(
+            f"Sending {len(messages)} messages ({options['concurrency']} senders, {options['rate'] or 'unlimited'}/s) "
+            f"to a stand-in at {standin.url} ({options['latency']}s latency)..."
+        )
+        try:
+            started = time.monotonic()
+            outcome = service.send_messages(messages)
+            elapsed = time.monotonic() - started
+        finally:
+            standin.stop()
+            OutboundMessage.objects.filter(campaign=campaign).delete()
+
+        counts = standin.counts
+        self.stdout.write(
+            f"Stand-in: {counts['requests']} requests, {counts['accepted']} accepted, "
+            f"{counts['throttled']} answered 429, {counts['error']} answered 503"
+        )
+        self.stdout.write(
+            f"Sent {outcome['sent']} in {elapsed:.2f}s - {outcome['sent'] / elapsed:,.1f} messages/sec "
+            f"({outcome['retry']} left for retry, {outcome['failed']} failed; "
+            f"one at a time would take about {len(messages) * options['latency']:.0f}s)"
+        )
+        if outcome['sent'] == len(messages):
+            self.stdout.write(self.style.SUCCESS('All messages sent'))
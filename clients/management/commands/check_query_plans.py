@@ -0,0 +1,176 @@
+import random
+import re
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from clients.models import Client, Invoice, MpesaCallback, Payment, RevenueDaily, ServicePlan
+from clients.revenue import rebuild_revenue_rollup
+
+def report_queries():
+    """Query shapes used by the report and dashboard views"""
+    now = timezone.now()
+    today = now.date()
+    month_ago = now - timedelta(days=30)
+
+    return [
+        # real_views / views: get_real_dashboard_data, client_management
+        ('active clients', Client.objects.filter(is_active=True)),
+        ('active clients by type', Client.objects.filter(is_active=True, client_type='pppoe')),
+        ('active clients by status', Client.objects.filter(is_active=True, status='suspended')),
+        ('recent clients', Client.objects.filter(is_active=True).order_by('-created_at')[:5]),
+        ('monthly revenue', Payment.objects.filter(
+            payment_date__year=today.year, payment_date__month=today.month
+        ).values('amount')),
+        ('pending invoices', Invoice.objects.filter(status__in=['sent', 'overdue'], due_date__lte=today)),
+        ('recent payments', Payment.objects.select_related('client').order_by('-payment_date')[:5]),
+
+        # custom_views: manage_*, billing_reports, system_reports
+        ('clients by status', Client.objects.filter(status='active')),
+        ('invoices by status', Invoice.objects.filter(status='paid')),
+        ('overdue invoices', Invoice.objects.filter(due_date__lt=today, status='pending')),
+        ('invoices in period', Invoice.objects.filter(created_at__range=[month_ago, now])),
+        ('invoice status breakdown', Invoice.objects.filter(
+            created_at__range=[month_ago, now]
+        ).values('status').annotate(count=Count('id'), total=Sum('amount')).order_by()),
+        ('payments in period', Payment.objects.filter(payment_date__range=[month_ago, now])),
+        ('payment method breakdown', Payment.objects.filter(
+            payment_date__range=[month_ago, now]
+        ).values('payment_method').annotate(count=Count('id'), total=Sum('amount')).order_by()),
+        ('new clients in period', Client.objects.filter(created_at__range=[month_ago, now])),
+        ('churned clients in period', Client.objects.filter(is_active=False, deactivated_at__range=[month_ago, now])),
+
+        # revenue rollup: financial_views, billing_reports, system_reports, admin_dashboard
+        ('revenue by method', RevenueDaily.objects.filter(
+            date__range=[month_ago.date(), today]
+        ).values('payment_method').annotate(total=Sum('total')).order_by()),
+
+        # financial_views: invoice aging
+        ('invoice aging current', Invoice.objects.filter(due_date__gte=today, status='pending')),
+        ('invoice aging 1-30 days', Invoice.objects.filter(
+            due_date__lt=today, due_date__gte=today - timedelta(days=30), status='pending'
+        )),
+
+        # generate_invoices
+        ('due clients', Client.objects.filter(is_active=True, next_payment_date__lte=today)),
+
+        # payment_import and M-Pesa callbacks: matching the paying number
+        ('clients by phone', Client.objects.filter(phone_e164__in=['+254700000001', '+254700000002'])),
+
+        # process_mpesa_callbacks
+        ('pending callbacks', MpesaCallback.objects.filter(status='pending').order_by('pk')[:500]),
+        ('payments by receipt', Payment.objects.filter(transaction_id__in=['RC00000001', 'RC00000002'])),
+    ]
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the report queries and fail if any of them needs a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Insert this many sample clients (with invoices and payments) first; rolled back afterwards'
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Print every query plan'
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'])
+            self.analyze()
+
+            if connection.vendor == 'postgresql':
+                # Ask whether an index *can* serve the query, independent of table size
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, queryset in report_queries():
+                plan = queryset.explain()
+                scanned = self.full_scans(plan)
+                if scanned:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f'FULL SCAN  {name}: {", ".join(scanned)}'))
+                else:
+                    self.stdout.write(f'ok         {name}')
+                if options['verbose_plans'] or scanned:
+                    self.stdout.write(f'           {plan}'.replace('\n', '\n           '))
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'{len(failures)} report queries fall back to a full table scan')
+        self.stdout.write(self.style.SUCCESS('All report queries use an index'))
+
+    def full_scans(self, plan):
+        """Tables read without an index according to the plan"""
+        if connection.vendor == 'postgresql':
+            return re.findall(r'Seq Scan on (\w+)', plan)
+        if connection.vendor == 'sqlite':
+            return [
+                match.group(1) for match in re.finditer(r'SCAN (\w+)(.*)', plan)
+                if 'USING' not in match.group(2) and match.group(1) != 'CONSTANT'
+            ]
+        raise CommandError(f'Plan checks are not implemented for {connection.vendor}')
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def seed(self, count):
+        """Bulk insert sample data shaped like production"""
+        self.stdout.write(f'Seeding {count} clients...')
+        now = timezone.now()
+        plans = ServicePlan.objects.bulk_create([
+            ServicePlan(name=f'Seed plan {i}', price=Decimal(1000 * (i + 1))) for i in range(3)
+        ])
+
+        clients = Client.objects.bulk_create([
+            Client(
+                name=f'Seed client {i}',
+                phone=f'07{i:08d}',
+                phone_e164=f'+2547{i:08d}',
+                address='Seed',
+                username=f'seed-{now.timestamp():.0f}-{i}',
+                password='seed',
+                client_type=random.choice(['pppoe', 'hotspot', 'business']),
+                service_plan=random.choice(plans),
+                monthly_fee=Decimal('1500'),
+                status=random.choice(['active'] * 8 + ['suspended', 'inactive']),
+                is_active=random.random() < 0.9,
+                next_payment_date=(now + timedelta(days=random.randint(-30, 30))).date(),
+                provisioning_status='provisioned',
+            )
+            for i in range(count)
+        ], batch_size=1000)
+
+        invoices = Invoice.objects.bulk_create([
+            Invoice(
+                client=client,
+                invoice_number=f'SEED-{now.timestamp():.0f}-{i}',
+                amount=client.monthly_fee,
+                due_date=(now - timedelta(days=random.randint(0, 365))).date(),
+                status=random.choice(['sent', 'paid', 'paid', 'paid', 'overdue', 'pending']),
+            )
+            for i, client in enumerate(clients)
+        ], batch_size=1000)
+
+        Payment.objects.bulk_create([
+            Payment(
+                client_id=invoice.client_id,
+                invoice=invoice,
+                amount=invoice.amount,
+                payment_method=random.choice(['mpesa', 'mpesa', 'mpesa', 'cash', 'bank']),
+                payment_date=now - timedelta(days=random.randint(0, 365)),
+            )
+            for invoice in invoices if invoice.status == 'paid'
+        ], batch_size=1000)
+        rebuild_revenue_rollup()
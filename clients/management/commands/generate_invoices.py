@@ -0,0 +1,130 @@
+import time
+from datetime import datetime
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from clients.dashboard_cache import invalidate_dashboard
+from clients.ledger import post_entries
+from clients.models import Client, Invoice, LedgerEntry
+
+class Command(BaseCommand):
+    help = 'Generate invoices for every active client due for billing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            help='Billing date (YYYY-MM-DD). Clients due on or before this date are invoiced. Defaults to today'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of invoices inserted per transaction'
+        )
+        parser.add_argument(
+            '--status',
+            type=str,
+            default='sent',
+            choices=[choice for choice, _ in Invoice.STATUS_CHOICES],
+            help='Status given to the new invoices'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many clients are due'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        billing_date = self.parse_date(options['date'])
+        started = time.monotonic()
+
+        due_clients = self.get_due_clients(billing_date)
+        total_amount = sum((fee for _, _, fee in due_clients), Decimal('0'))
+
+        if not due_clients:
+            self.stdout.write(self.style.WARNING(f'No clients due for billing on {billing_date}'))
+            return
+
+        if options['dry_run']:
+            self.stdout.write(
+                f'{len(due_clients)} clients due for billing on {billing_date} (KSH {total_amount:,.2f})'
+            )
+            return
+
+        invoice_numbers = Invoice.allocate_invoice_numbers(len(due_clients))
+        created = 0
+
+        for start in range(0, len(due_clients), chunk_size):
+            chunk = due_clients[start:start + chunk_size]
+            invoices = [
+                Invoice(
+                    client_id=client_id,
+                    invoice_number=invoice_number,
+                    amount=monthly_fee,
+                    due_date=due_date,
+                    status=options['status'],
+                )
+                for (client_id, due_date, monthly_fee), invoice_number
+                in zip(chunk, invoice_numbers[start:start + chunk_size])
+            ]
+
+            with transaction.atomic():
+                Invoice.objects.bulk_create(invoices, batch_size=chunk_size)
+                if options['status'] in Invoice.BILLABLE_STATUSES:
+                    post_entries([
+                        LedgerEntry(
+                            client_id=invoice.client_id,
+                            invoice=invoice,
+                            entry_type='charge',
+                            amount=invoice.amount,
+                            description=f'Invoice {invoice.invoice_number}'
+                        )
+                        for invoice in invoices
+                    ], batch_size=chunk_size)
+
+            created += len(invoices)
+            self.stdout.write(f'  {created}/{len(due_clients)} invoices created')
+
+        if created:
+            # bulk_create sends no signals
+            invalidate_dashboard()
+
+        elapsed = time.monotonic() - started
+        rate = created / elapsed if elapsed > 0 else created
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {created} invoices (KSH {total_amount:,.2f}) in {elapsed:.2f}s - {rate:,.0f} invoices/sec'
+        ))
+
+    def parse_date(self, value):
+        """Parse the --date option"""
+        if not value:
+            return datetime.now().date()
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date "{value}". Use YYYY-MM-DD')
+
+    def get_due_clients(self, billing_date):
+        """Fetch (id, due date, fee) for every client due and not yet invoiced in one query"""
+        already_invoiced = Invoice.objects.filter(
+            client=OuterRef('pk'),
+            due_date=OuterRef('next_payment_date')
+        )
+
+        return list(
+            Client.objects.filter(
+                is_active=True,
+                status='active',
+                next_payment_date__lte=billing_date,
+                monthly_fee__gt=0
+            ).filter(
+                ~Exists(already_invoiced)
+            ).order_by('pk').values_list('pk', 'next_payment_date', 'monthly_fee')
+        )
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from clients.payment_import import PaymentStatementImporter
+
+class Command(BaseCommand):
+    help = 'Import payments from a downloaded M-Pesa statement (CSV)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            type=str,
+            help='Path to the statement CSV file'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows inserted per batch'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Match and count rows without saving payments'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        importer = PaymentStatementImporter(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run']
+        )
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as statement:
+                stats = importer.import_file(statement)
+        except FileNotFoundError:
+            raise CommandError(f'Statement not found: {options["path"]}')
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rate = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else stats['rows']
+        self.stdout.write(
+            f"Rows: {stats['rows']} | Imported: {stats['imported']} | Duplicates: {stats['duplicates']} | "
+            f"Unmatched: {stats['unmatched']} | Skipped: {stats['skipped']} | Unreadable date: {stats['failed']}"
+        )
+        if importer.unmatched_receipts:
+            shown = importer.unmatched_receipts[:20]
+            self.stdout.write(self.style.WARNING(
+                f"Unmatched receipts (first {len(shown)}): {', '.join(shown)}"
+            ))
+
+        if importer.failed_receipts:
+            shown = importer.failed_receipts[:20]
+            self.stdout.write(self.style.ERROR(
+                f"Not imported, completion time unreadable (first {len(shown)}): {', '.join(shown)}"
+            ))
+
+        prefix = 'Dry run: would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} KSH {stats['amount']:,.2f} in {stats['seconds']:.2f}s - {rate:,.0f} rows/sec"
+        ))
@@ -0,0 +1,91 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from clients.mikrotik_integration import mikrotik_manager
+from clients.usage_ingest import UsageIngestor, radius_readings, router_readings
+from clients.usage_retention import apply_retention
+
+class Command(BaseCommand):
+    help = 'Turn per-user byte counters from the router or RADIUS accounting into NetworkUsage totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            choices=['router', 'radius'],
+            default='router',
+            help='Where counters come from'
+        )
+        parser.add_argument(
+            '--file',
+            help='RADIUS accounting CSV export (required for --source radius)'
+        )
+        parser.add_argument(
+            '--counter-bits',
+            type=int,
+            choices=[32, 64],
+            default=64,
+            help='Width of the byte counters, for wraparound handling'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Clients per upsert statement'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Seconds between polls; 0 reads once and exits'
+        )
+
+    def handle(self, *args, **options):
+        if options['source'] == 'radius' and not options['file']:
+            raise CommandError('--file is required for --source radius')
+        if options['batch_size'] < 1 or options['interval'] < 0:
+            raise CommandError('--batch-size must be positive and --interval not negative')
+
+        last_retention = None
+
+        try:
+            while True:
+                started = time.monotonic()
+                close_old_connections()
+
+                ingestor = UsageIngestor(counter_bits=options['counter_bits'], batch_size=options['batch_size'])
+                if options['source'] == 'radius':
+                    try:
+                        with open(options['file'], newline='', encoding='utf-8') as fileobj:
+                            stats = ingestor.ingest(radius_readings(fileobj))
+                    except OSError as e:
+                        raise CommandError(f'Cannot read {options["file"]}: {e}')
+                else:
+                    try:
+                        stats = ingestor.ingest(router_readings(mikrotik_manager))
+                    except Exception as e:
+                        if not options['interval']:
+                            raise CommandError(f'Router read failed: {e}')
+                        self.stdout.write(self.style.WARNING(f'  router read failed: {e}'))
+                        stats = None
+
+                if stats:
+                    self.stdout.write(
+                        f"  {stats['clients']} clients from {stats['readings']} readings in {stats['seconds']:.2f}s "
+                        f"({stats['new']} new, {stats['resets']} resets, {stats['wraps']} wraps, {stats['unknown']} unknown users), "
+                        f"{(stats['download_bytes'] + stats['upload_bytes']) / 1024 ** 2:.1f} MB"
+                    )
+
+                if not options['interval']:
+                    break
+
+                if last_retention is None or started - last_retention > 3600:
+                    deleted = sum(apply_retention().values())
+                    if deleted:
+                        self.stdout.write(f'  retention removed {deleted} old usage rows')
+                    last_retention = started
+
+                time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping usage ingestion')
+
+        self.stdout.write(self.style.SUCCESS('Usage ingestion finished'))
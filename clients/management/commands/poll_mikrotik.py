@@ -0,0 +1,62 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from clients.mikrotik_integration import mikrotik_manager
+from clients.router_state import prune_samples, take_sample
+
+class Command(BaseCommand):
+    help = 'Sample MikroTik sessions, interface counters and resources into RouterSample rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            help='Seconds between samples'
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=7,
+            help='Delete samples older than this many days'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Take one sample and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['interval'] <= 0 or options['keep_days'] < 1:
+            raise CommandError('--interval and --keep-days must be positive')
+
+        self.stdout.write(f"Polling {mikrotik_manager.host} every {options['interval']:g}s")
+        last_prune = None
+
+        try:
+            while True:
+                started = time.monotonic()
+                close_old_connections()
+
+                sample = take_sample()
+                if sample.error:
+                    self.stdout.write(self.style.WARNING(f'  router read failed: {sample.error}'))
+                else:
+                    self.stdout.write(
+                        f'  {sample.sampled_at:%H:%M:%S} {sample.total_sessions} sessions, '
+                        f'cpu {sample.cpu_load}%'
+                    )
+
+                if last_prune is None or started - last_prune > 3600:
+                    pruned = prune_samples(options['keep_days'])
+                    if pruned:
+                        self.stdout.write(f'  pruned {pruned} old samples')
+                    last_prune = started
+
+                if options['once']:
+                    break
+                time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping router poller')
+
+        self.stdout.write(self.style.SUCCESS('Router poller stopped'))
@@ -0,0 +1,56 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from clients.mpesa_callbacks import CALLBACK_BATCH_SIZE, process_callbacks
+
+class Command(BaseCommand):
+    help = 'Record stored M-Pesa callbacks as payments, one transaction per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=CALLBACK_BATCH_SIZE,
+            help='Callbacks recorded per transaction'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Seconds to wait when no callbacks are pending'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the pending callbacks once and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        self.stdout.write('M-Pesa callback processor started')
+        totals = {'processed': 0, 'duplicate': 0, 'unmatched': 0, 'failed': 0}
+        started = time.monotonic()
+
+        try:
+            while True:
+                counts = process_callbacks(options['batch_size'])
+                if not any(counts.values()):
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                for outcome, count in counts.items():
+                    totals[outcome] += count
+                self.stdout.write(
+                    f"  batch of {sum(counts.values())}: {totals['processed']} recorded, {totals['duplicate']} duplicates, "
+                    f"{totals['unmatched']} unmatched, {totals['failed']} failed ({time.monotonic() - started:.1f}s)"
+                )
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping M-Pesa callback processor')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded {totals['processed']} payments ({totals['duplicate']} duplicates, "
+            f"{totals['unmatched']} unmatched, {totals['failed']} failed or cancelled)"
+        ))
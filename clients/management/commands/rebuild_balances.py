@@ -0,0 +1,96 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+from clients.models import Client, LedgerEntry
+
+class Command(BaseCommand):
+    help = 'Recompute every client balance from the ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of client ids handled per chunk'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of chunks processed in parallel'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report balances that differ from the ledger'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        if chunk_size < 1 or workers < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+
+        bounds = Client.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            self.stdout.write(self.style.WARNING('No clients to rebuild'))
+            return
+
+        started = time.monotonic()
+        ranges = [
+            (low, min(low + chunk_size, bounds['high'] + 1))
+            for low in range(bounds['low'], bounds['high'] + 1, chunk_size)
+        ]
+
+        checked = changed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk_checked, chunk_changed in executor.map(
+                lambda chunk: self.rebuild_chunk(*chunk, dry_run=options['dry_run']), ranges
+            ):
+                checked += chunk_checked
+                changed += chunk_changed
+
+        elapsed = time.monotonic() - started
+        verb = 'would change' if options['dry_run'] else 'corrected'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} clients in {len(ranges)} chunks ({elapsed:.2f}s): {changed} balances {verb}'
+        ))
+
+    def rebuild_chunk(self, low, high, dry_run=False):
+        """Rebuild balances for clients with low <= pk < high"""
+        try:
+            with transaction.atomic():
+                clients = Client.objects.filter(pk__gte=low, pk__lt=high).only('pk', 'balance').order_by()
+                if not dry_run:
+                    # Lock the rows first so payments posted meanwhile land on top of the rebuilt value
+                    clients = clients.select_for_update()
+                clients = list(clients)
+
+                totals = dict(
+                    LedgerEntry.objects.filter(
+                        client_id__gte=low, client_id__lt=high
+                    ).order_by().values('client_id').annotate(
+                        total=Sum('amount')
+                    ).values_list('client_id', 'total')
+                )
+
+                stale = []
+                now = timezone.now()
+                for client in clients:
+                    balance = totals.get(client.pk) or Decimal('0')
+                    if client.balance != balance:
+                        client.balance = balance
+                        client.updated_at = now
+                        stale.append(client)
+
+                if stale and not dry_run:
+                    Client.objects.bulk_update(stale, ['balance', 'updated_at'], batch_size=500)
+
+            return len(clients), len(stale)
+        finally:
+            # Each worker thread holds its own connection
+            connection.close()
@@ -0,0 +1,41 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from clients.models import Payment
+from clients.revenue import rebuild_revenue_rollup
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily revenue rollup from the payments table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Only rebuild days from this date on (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--assign-plans',
+            action='store_true',
+            help="Attribute payments without a service plan to the client's current plan first"
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since must be in YYYY-MM-DD format')
+
+        if options['assign_plans']:
+            assigned = 0
+            missing = Payment.objects.filter(service_plan__isnull=True, client__service_plan__isnull=False)
+            for service_plan_id in missing.values_list('client__service_plan', flat=True).distinct():
+                assigned += Payment.objects.filter(
+                    service_plan__isnull=True, client__service_plan=service_plan_id
+                ).update(service_plan=service_plan_id, updated_at=timezone.now())
+            self.stdout.write(f'Assigned a service plan to {assigned} payments')
+
+        rows = rebuild_revenue_rollup(since=since)
+        scope = f'since {since}' if since else 'for all payments'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily revenue rows {scope}'))
@@ -0,0 +1,58 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from clients.backups import BackupError, restore_backup, verify_backup
+from clients.dashboard_cache import FAMILIES, invalidate_dashboard
+
+class Command(BaseCommand):
+    help = 'Restore system data from a backup_system directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Backup directory (the one holding manifest.json); an incremental backup is replayed on top of the backups it builds on'
+        )
+        parser.add_argument(
+            '--flush',
+            action='store_true',
+            help='Empty the tables first; without it the tables must already be empty'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per INSERT batch'
+        )
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Check every chunk against the manifest without writing anything'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        started = time.monotonic()
+        try:
+            if options['verify_only']:
+                chain = verify_backup(options['path'])
+                rows = sum(entry['rows'] for _, manifest in chain for entry in manifest['models'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'Backup is intact: {rows} rows in a full backup and {len(chain) - 1} increment(s)'
+                ))
+                return
+
+            counts = restore_backup(
+                options['path'],
+                batch_size=options['batch_size'],
+                flush=options['flush'],
+                progress=lambda path, model, rows: self.stdout.write(f'  {os.path.basename(path)} {model}: {rows} rows'),
+            )
+        except BackupError as e:
+            raise CommandError(str(e))
+
+        invalidate_dashboard(FAMILIES)
+        self.stdout.write(self.style.SUCCESS(
+            f'Restored {sum(counts.values())} rows in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,119 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from clients.mikrotik_integration import mikrotik_manager
+from clients.models import Client, ProvisioningTask
+from clients.task_queue import claim_batch, schedule_retry
+
+class Command(BaseCommand):
+    help = 'Process queued MikroTik provisioning tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Tasks handled per router session'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=6,
+            help='Attempts before a task is marked as failed'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue once and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['max_attempts'] < 1:
+            raise CommandError('--batch-size and --max-attempts must be positive')
+
+        self.stdout.write('Provisioning worker started')
+        totals = {'done': 0, 'retry': 0, 'failed': 0}
+
+        try:
+            while True:
+                task_ids = claim_batch(ProvisioningTask, options['batch_size'])
+                if not task_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                tasks = list(ProvisioningTask.objects.filter(pk__in=task_ids).select_related('client'))
+                for outcome, count in self.process_batch(tasks, options['max_attempts']).items():
+                    totals[outcome] += count
+                self.stdout.write(
+                    f"  batch of {len(tasks)}: {totals['done']} done, {totals['retry']} retrying, {totals['failed']} failed"
+                )
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping provisioning worker')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Provisioned {totals['done']} clients ({totals['retry']} retries scheduled, {totals['failed']} failed)"
+        ))
+
+    def process_batch(self, tasks, max_attempts):
+        """Run a batch of tasks over one router session"""
+        outcome = {'done': 0, 'retry': 0, 'failed': 0}
+        done = []
+
+        try:
+            mikrotik_manager.connect()
+        except Exception as e:
+            # Router unreachable: retry the whole batch later
+            for task in tasks:
+                self.record_failure(task, f'Router connection failed: {e}', max_attempts, outcome)
+            return outcome
+
+        try:
+            for task in tasks:
+                try:
+                    success, message = self.run_task(task)
+                except Exception as e:
+                    success, message = False, str(e)
+
+                if success:
+                    done.append(task)
+                else:
+                    self.record_failure(task, message, max_attempts, outcome)
+        finally:
+            mikrotik_manager.disconnect()
+
+        if done:
+            with transaction.atomic():
+                ProvisioningTask.objects.filter(pk__in=[task.pk for task in done]).update(
+                    status='done', last_error='', updated_at=timezone.now()
+                )
+                Client.objects.filter(pk__in=[task.client_id for task in done]).update(
+                    provisioning_status='provisioned', provisioning_error='', updated_at=timezone.now()
+                )
+            outcome['done'] += len(done)
+        return outcome
+
+    def run_task(self, task):
+        client = task.client
+        if task.action == 'create_pppoe':
+            return mikrotik_manager.create_pppoe_user(client.username, client.password)
+        if task.action == 'create_hotspot':
+            return mikrotik_manager.create_hotspot_user(client.username, client.password)
+        return False, f'Unknown action {task.action}'
+
+    def record_failure(self, task, error, max_attempts, outcome):
+        if schedule_retry(task, error, max_attempts):
+            outcome['retry'] += 1
+        else:
+            outcome['failed'] += 1
+            Client.objects.filter(pk=task.client_id).update(
+                provisioning_status='failed', provisioning_error=str(error)[:255], updated_at=timezone.now()
+            )
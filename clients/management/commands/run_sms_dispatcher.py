@@ -0,0 +1,113 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from clients.models import OutboundMessage
+from clients.outbox import mark_sent
+from clients.rate_limit import TokenBucket
+from clients.sms_service import group_messages, sms_service
+from clients.task_queue import claim_batch, schedule_retry
+
+class Command(BaseCommand):
+    help = 'Send queued outbox SMS messages through a rate-limited pool of sender threads, one request per group of identical texts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Messages claimed from the outbox at a time'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='Send requests in flight at once'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=20,
+            help='Provider limit in send requests per second (0 for no limit)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='Seconds to wait when the outbox is empty'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=5,
+            help='Attempts before a message is marked as failed'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the outbox once and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['concurrency'] < 1 or options['max_attempts'] < 1:
+            raise CommandError('--batch-size, --concurrency and --max-attempts must be positive')
+        if options['rate'] < 0:
+            raise CommandError('--rate cannot be negative')
+
+        self.bucket = TokenBucket(options['rate'])
+        self.stdout.write(f"SMS dispatcher started ({options['concurrency']} senders, {options['rate'] or 'unlimited'}/s)")
+        totals = {'sent': 0, 'retry': 0, 'failed': 0}
+        started = time.monotonic()
+
+        try:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                while True:
+                    message_ids = claim_batch(OutboundMessage, options['batch_size'], filters=Q(channel='sms'))
+                    if not message_ids:
+                        if options['once']:
+                            break
+                        time.sleep(options['interval'])
+                        continue
+
+                    outbox = list(OutboundMessage.objects.filter(pk__in=message_ids))
+                    groups = group_messages(outbox, sms_service.batch_limit)
+                    results = [result for group in executor.map(self.send, groups) for result in group]
+                    for outcome, count in self.record(results, options['max_attempts']).items():
+                        totals[outcome] += count
+                    self.stdout.write(
+                        f"  batch of {len(outbox)} in {len(groups)} requests: {totals['sent']} sent, {totals['retry']} retrying, "
+                        f"{totals['failed']} failed ({time.monotonic() - started:.1f}s)"
+                    )
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping SMS dispatcher')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} messages ({totals['retry']} retries scheduled, {totals['failed']} failed)"
+        ))
+
+    def send(self, group):
+        """Send one group of identical texts in a single request from a pool thread; returns (message, error or None, provider id) per message"""
+        body, messages = group
+        self.bucket.acquire()
+        results = sms_service.send_batch(body, [message.phone for message in messages])
+        return [
+            (message, None, result.get('message_id', '')) if result.get('status') == 'success'
+            else (message, result.get('message', 'No response from the SMS provider'), '')
+            for message, result in zip(messages, results)
+        ]
+
+    def record(self, results, max_attempts):
+        """Store a batch's outcomes: sent messages in one executemany UPDATE, failures through schedule_retry"""
+        outcome = {'sent': 0, 'retry': 0, 'failed': 0}
+        sent = []
+        for message, error, provider_id in results:
+            if error is None:
+                sent.append((message.pk, provider_id))
+            elif schedule_retry(message, error, max_attempts):
+                outcome['retry'] += 1
+            else:
+                outcome['failed'] += 1
+
+        mark_sent(sent)
+        outcome['sent'] = len(sent)
+        return outcome
@@ -0,0 +1,72 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from clients.models import StatementImport
+from clients.payment_import import run_statement_import
+from clients.task_queue import claim_batch, schedule_retry
+
+class Command(BaseCommand):
+    help = 'Import M-Pesa statements uploaded in the admin'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows inserted per batch'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to wait when no statements are queued'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=3,
+            help='Attempts before an import is marked as failed'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Import the queued statements once and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['max_attempts'] < 1:
+            raise CommandError('--batch-size and --max-attempts must be positive')
+
+        self.stdout.write('Statement import worker started')
+        imported = 0
+
+        try:
+            while True:
+                # One statement at a time; a long import is picked up again only after stale_after
+                import_ids = claim_batch(StatementImport, 1)
+                if not import_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                statement_import = StatementImport.objects.get(pk=import_ids[0])
+                self.stdout.write(f'  importing {statement_import.filename}')
+                try:
+                    stats = run_statement_import(statement_import, batch_size=options['batch_size'])
+                except Exception as e:
+                    schedule_retry(statement_import, e, options['max_attempts'])
+                    self.stdout.write(self.style.WARNING(f'  {statement_import.filename} failed: {e}'))
+                    continue
+
+                if stats is None:
+                    self.stdout.write(self.style.WARNING(f'  {statement_import.filename} is not a statement'))
+                    continue
+                imported += 1
+                self.stdout.write(
+                    f"  {statement_import.filename}: {stats['imported']} imported, {stats['duplicates']} duplicates, "
+                    f"{stats['unmatched']} unmatched in {stats['seconds']:.1f}s"
+                )
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping statement import worker')
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} statements'))
@@ -0,0 +1,78 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from clients.models import OutboundMessage
+from clients.task_queue import claim_batch
+from clients.whatsapp_service import WHATSAPP_BATCH_SIZE, WHATSAPP_CONCURRENCY, WHATSAPP_MAX_ATTEMPTS, WHATSAPP_RATE, WhatsAppService
+
+class Command(BaseCommand):
+    help = 'Send queued WhatsApp messages (retries and requeued failures) through the concurrent bulk sender'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=WHATSAPP_BATCH_SIZE,
+            help='Messages claimed from the outbox at a time'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=WHATSAPP_CONCURRENCY,
+            help='Requests in flight at once'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=WHATSAPP_RATE,
+            help='Twilio limit in requests per second (0 for no limit)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='Seconds to wait when the outbox is empty'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=WHATSAPP_MAX_ATTEMPTS,
+            help='Attempts before a message is marked as failed'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the outbox once and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['concurrency'] < 1 or options['max_attempts'] < 1:
+            raise CommandError('--batch-size, --concurrency and --max-attempts must be positive')
+        if options['rate'] < 0:
+            raise CommandError('--rate cannot be negative')
+
+        service = WhatsAppService(concurrency=options['concurrency'], rate=options['rate'])
+        self.stdout.write(f"WhatsApp sender started ({options['concurrency']} senders, {options['rate'] or 'unlimited'}/s)")
+        totals = {'sent': 0, 'retry': 0, 'failed': 0}
+
+        try:
+            while True:
+                message_ids = claim_batch(OutboundMessage, options['batch_size'], filters=Q(channel='whatsapp'))
+                if not message_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                messages = list(OutboundMessage.objects.filter(pk__in=message_ids))
+                for outcome, count in service.send_messages(messages, options['max_attempts']).items():
+                    totals[outcome] += count
+                self.stdout.write(
+                    f"  batch of {len(messages)}: {totals['sent']} sent, {totals['retry']} retrying, {totals['failed']} failed"
+                )
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping WhatsApp sender')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} messages ({totals['retry']} retries scheduled, {totals['failed']} failed)"
+        ))
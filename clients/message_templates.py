@@ -0,0 +1,125 @@
+# MESSAGE TEMPLATES
+# A campaign's text is compiled once: its [Placeholders] are checked against Client fields and
+# turned into a str.format pattern, so rendering a recipient is a single format() call on a
+# values_list row holding only the fields the template uses. sms_segments says how many SMS
+# parts a rendered message will be billed as.
+
+import re
+from django.core.exceptions import FieldDoesNotExist
+from .models import Client
+
+PLACEHOLDER = re.compile(r'\[([A-Za-z][A-Za-z0-9_]*)\]')
+
+# Friendly names for common fields; any other [field] must be a Client field or a field
+# reached through one of its foreign keys, e.g. [service_plan__speed]
+ALIASES = {
+    'Name': 'name',
+    'Username': 'username',
+    'Phone': 'phone',
+    'Plan': 'service_plan__name',
+    'Amount': 'monthly_fee',
+    'Balance': 'balance',
+    'Date': 'next_payment_date',
+}
+
+# GSM 03.38: the basic set takes one 7-bit character, the extension table two
+GSM_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM_EXTENDED = frozenset("^{}\\[~]|€\f")
+GSM_CHARS = GSM_BASIC | GSM_EXTENDED
+# ASCII outside GSM-7 (the backtick and most control characters), and the extension table
+NON_GSM_ASCII = re.compile(r'[^\n\r\f\x20-\x5f\x61-\x7e]')
+GSM_EXTENDED_PATTERN = re.compile(r'[\^{}\\\[~\]|\f€]')
+
+class TemplateError(Exception):
+    pass
+
+def resolve_placeholder(name):
+    """The Client lookup a placeholder stands for, or None if there is no such field"""
+    lookup = ALIASES.get(name, name)
+    model = Client
+    parts = lookup.split('__')
+    for position, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        last = position == len(parts) - 1
+        if not field.concrete:
+            return None
+        if field.is_relation:
+            # Foreign keys can be followed, but a relation is not a value to print
+            if last or not field.many_to_one:
+                return None
+            model = field.related_model
+        elif not last:
+            return None
+    return lookup
+
+def sms_segments(text):
+    """SMS parts a message needs: 160 GSM-7 characters (153 per part when split), else 70 UCS-2 (67)"""
+    # A regex scan of plain ASCII is much faster than a set lookup per character
+    if text.isascii():
+        gsm = not NON_GSM_ASCII.search(text)
+    else:
+        gsm = GSM_CHARS.issuperset(text)
+    if gsm:
+        length = len(text) + len(GSM_EXTENDED_PATTERN.findall(text))
+        single, part = 160, 153
+    else:
+        # UTF-16 code units: characters outside the BMP, such as emoji, take two
+        length = len(text.encode('utf-16-le')) // 2
+        single, part = 70, 67
+    return 1 if length <= single else -(-length // part)
+
+class MessageTemplate:
+    """A message template compiled once and rendered for many recipients.
+
+    fields are the Client lookups to fetch with values_list(*template.fields, ...); columns
+    after them are ignored by render, so a row may carry the pk and phone as well.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.fields = []
+        pieces = []
+        unknown = []
+        position = 0
+        for match in PLACEHOLDER.finditer(text):
+            pieces.append(text[position:match.start()].replace('{', '{{').replace('}', '}}'))
+            position = match.end()
+            lookup = resolve_placeholder(match.group(1))
+            if lookup is None:
+                unknown.append(match.group(0))
+                continue
+            if lookup not in self.fields:
+                self.fields.append(lookup)
+            pieces.append('{%d}' % self.fields.index(lookup))
+        pieces.append(text[position:].replace('{', '{{').replace('}', '}}'))
+
+        if unknown:
+            raise TemplateError(
+                f"Unknown placeholder(s) {', '.join(unknown)}; use {', '.join(f'[{name}]' for name in ALIASES)} "
+                f"or a client field name"
+            )
+        self.pattern = ''.join(pieces)
+
+    def render(self, row):
+        """The message for one values_list row; empty fields render as ''"""
+        if None in row:
+            row = ['' if value is None else value for value in row]
+        return self.pattern.format(*row)
+
+    def render_rows(self, rows):
+        """Render many rows in one tight loop; returns a list of messages"""
+        pattern = self.pattern.format
+        return [
+            pattern(*row) if None not in row else pattern(*['' if value is None else value for value in row])
+            for row in rows
+        ]
+
+def compile_template(text):
+    """Compile a template, or pass an already compiled one through"""
+    return text if isinstance(text, MessageTemplate) else MessageTemplate(text)
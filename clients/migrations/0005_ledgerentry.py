@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_opening_balances(apps, schema_editor):
+    """Record existing balances as opening adjustments so the ledger sums to them"""
+    Client = apps.get_model('clients', 'Client')
+    LedgerEntry = apps.get_model('clients', 'LedgerEntry')
+
+    batch = []
+    for client_id, balance in Client.objects.exclude(balance=0).values_list('pk', 'balance').iterator(chunk_size=2000):
+        batch.append(LedgerEntry(
+            client_id=client_id,
+            entry_type='adjustment',
+            amount=balance,
+            description='Opening balance',
+        ))
+        if len(batch) >= 2000:
+            LedgerEntry.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        LedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0004_invoicesequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('charge', 'Charge'), ('payment', 'Payment'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clients.client')),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='clients.invoice')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='clients.payment')),
+            ],
+            options={
+                'verbose_name_plural': 'Ledger entries',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RunPython(create_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0005_ledgerentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='payment_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='transaction_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+    ]
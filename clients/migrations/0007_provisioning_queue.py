@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0006_payment_import_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='provisioning_error',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        # Existing clients were provisioned synchronously by Client.save()
+        migrations.AddField(
+            model_name='client',
+            name='provisioning_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('provisioned', 'Provisioned'), ('failed', 'Failed')], default='provisioned', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='client',
+            name='provisioning_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('provisioned', 'Provisioned'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ProvisioningTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('create_pppoe', 'Create PPPoE user'), ('create_hotspot', 'Create hotspot user')], max_length=30)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clients.client')),
+            ],
+            options={
+                'ordering': ['next_attempt_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='clients_pro_status_09372a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0007_provisioning_queue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['is_active', 'client_type'], name='clients_cli_is_acti_acf677_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['status', 'is_active'], name='clients_cli_status_ef884a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['is_active', 'next_payment_date'], name='clients_cli_is_acti_ec347b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['created_at'], name='clients_cli_created_4ff9ec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['is_active', 'updated_at'], name='clients_cli_is_acti_1f348f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'due_date'], name='clients_inv_status_e27c98_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'created_at'], name='clients_inv_status_ad67e7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_at'], name='clients_inv_created_4d84f0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date', 'payment_method'], name='clients_pay_payment_421dcd_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:12
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_revenue(apps, schema_editor):
+    """Attribute existing payments to the client's current plan and build the rollup"""
+    Client = apps.get_model('clients', 'Client')
+    Payment = apps.get_model('clients', 'Payment')
+    RevenueDaily = apps.get_model('clients', 'RevenueDaily')
+
+    Payment.objects.filter(service_plan__isnull=True).update(
+        service_plan=Subquery(Client.objects.filter(pk=OuterRef('client_id')).values('service_plan')[:1])
+    )
+
+    sums = Payment.objects.annotate(day=TruncDate('payment_date')).order_by().values(
+        'day', 'service_plan', 'payment_method'
+    ).annotate(total=Sum('amount'), payment_count=Count('id'))
+    RevenueDaily.objects.bulk_create([
+        RevenueDaily(
+            date=row['day'],
+            service_plan_id=row['service_plan'],
+            payment_method=row['payment_method'],
+            total=row['total'],
+            payment_count=row['payment_count'],
+        )
+        for row in sums.iterator(chunk_size=5000)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0008_reporting_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='service_plan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='clients.serviceplan'),
+        ),
+        migrations.CreateModel(
+            name='RevenueDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_method', models.CharField(choices=[('mpesa', 'M-Pesa'), ('cash', 'Cash'), ('bank', 'Bank Transfer'), ('card', 'Credit Card')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('service_plan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='clients.serviceplan')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily revenue',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(models.F('date'), models.F('payment_method'), django.db.models.functions.comparison.Coalesce('service_plan', 0), name='clients_revenuedaily_unique_key')],
+            },
+        ),
+        migrations.RunPython(backfill_revenue, migrations.RunPython.noop),
+    ]
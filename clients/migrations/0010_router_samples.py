@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0009_revenue_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouterSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sampled_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('cpu_load', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('free_memory', models.BigIntegerField(blank=True, null=True)),
+                ('total_memory', models.BigIntegerField(blank=True, null=True)),
+                ('uptime', models.CharField(blank=True, max_length=50)),
+                ('pppoe_sessions', models.IntegerField(default=0)),
+                ('hotspot_sessions', models.IntegerField(default=0)),
+                ('sessions', models.JSONField(default=dict)),
+                ('error', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'ordering': ['-sampled_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='InterfaceSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('status', models.CharField(blank=True, max_length=20)),
+                ('rx_bytes', models.BigIntegerField(default=0)),
+                ('tx_bytes', models.BigIntegerField(default=0)),
+                ('rx_rate', models.BigIntegerField(blank=True, null=True)),
+                ('tx_rate', models.BigIntegerField(blank=True, null=True)),
+                ('sample', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='interfaces', to='clients.routersample')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0010_router_samples'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(blank=True, max_length=100)),
+                ('download_bytes', models.BigIntegerField(default=0)),
+                ('upload_bytes', models.BigIntegerField(default=0)),
+                ('read_at', models.DateTimeField()),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='usage_counter', to='clients.client')),
+            ],
+        ),
+    ]
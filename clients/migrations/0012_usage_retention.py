@@ -0,0 +1,87 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_retention_settings(apps, schema_editor):
+    """Add the usage retention settings with their defaults so they show up in System Settings"""
+    SystemSettings = apps.get_model('clients', 'SystemSettings')
+    defaults = [
+        ('usage_raw_retention_days', '7', 'Days raw usage samples are kept; older usage stays as hourly totals'),
+        ('usage_hourly_retention_days', '90', 'Days hourly usage totals are kept; older usage stays as daily totals'),
+        ('usage_daily_retention_days', '400', 'Days daily usage totals are kept; older usage stays as monthly totals'),
+        ('usage_monthly_retention_days', '0', 'Days monthly usage totals are kept (0 keeps them forever)'),
+        ('usage_retention_batch_size', '5000', 'Rows deleted per statement when purging old usage'),
+    ]
+    for key, value, description in defaults:
+        SystemSettings.objects.get_or_create(
+            key=key,
+            defaults={'value': value, 'value_type': 'integer', 'description': description},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0011_usage_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hourly'), ('month', 'Monthly')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('download_bytes', models.BigIntegerField(default=0)),
+                ('upload_bytes', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-period_start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sampled_at', models.DateTimeField()),
+                ('download_bytes', models.BigIntegerField(default=0)),
+                ('upload_bytes', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-sampled_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='networkusage',
+            index=models.Index(fields=['usage_date'], name='clients_net_usage_d_f04839_idx'),
+        ),
+        migrations.AddField(
+            model_name='usagerollup',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clients.client'),
+        ),
+        migrations.AddField(
+            model_name='usagesample',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clients.client'),
+        ),
+        migrations.AddIndex(
+            model_name='usagerollup',
+            index=models.Index(fields=['resolution', 'period_start'], name='clients_usa_resolut_5ae349_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='usagerollup',
+            constraint=models.UniqueConstraint(fields=('client', 'resolution', 'period_start'), name='clients_usagerollup_unique_period'),
+        ),
+        migrations.AddIndex(
+            model_name='usagesample',
+            index=models.Index(fields=['sampled_at'], name='clients_usa_sampled_a739d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usagesample',
+            index=models.Index(fields=['client', 'sampled_at'], name='clients_usa_client__cd02b2_idx'),
+        ),
+        migrations.RunPython(add_retention_settings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:39
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+
+def backfill_updated_at(apps, schema_editor):
+    """Start updated_at from the latest timestamp each row already has instead of the migration time"""
+    Invoice = apps.get_model('clients', 'Invoice')
+    Payment = apps.get_model('clients', 'Payment')
+    Invoice.objects.update(updated_at=Coalesce('paid_at', 'created_at'))
+    Payment.objects.update(updated_at=F('payment_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0012_usage_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='usagerollup',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['updated_at'], name='clients_cli_updated_ee37e2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['updated_at'], name='clients_inv_updated_edf3ef_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['updated_at'], name='clients_pay_updated_0272ad_idx'),
+        ),
+    ]
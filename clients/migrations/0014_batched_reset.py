@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:47
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def complete_existing_resets(apps, schema_editor):
+    """Resets logged before batching ran in one go and finished when they were logged"""
+    SystemResetLog = apps.get_model('clients', 'SystemResetLog')
+    SystemResetLog.objects.update(completed_at=F('reset_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0013_incremental_backups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systemresetlog',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemresetlog',
+            name='progress',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='systemresetlog',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], default='completed', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='systemresetlog',
+            name='reset_type',
+            field=models.CharField(choices=[('clients', 'Clients Only'), ('financial', 'Financial Data'), ('all', 'Complete Reset'), ('custom', 'Custom Reset'), ('network_stats', 'Network Statistics'), ('test_data', 'Test Data')], max_length=20),
+        ),
+        migrations.RunPython(complete_existing_resets, migrations.RunPython.noop),
+    ]
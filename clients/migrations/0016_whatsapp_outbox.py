@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0015_sms_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboundmessage',
+            name='channel',
+            field=models.CharField(choices=[('sms', 'SMS'), ('whatsapp', 'WhatsApp')], default='sms', max_length=20),
+        ),
+    ]
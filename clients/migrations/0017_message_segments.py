@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0016_whatsapp_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='segments',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+def normalize_phones(apps, schema_editor):
+    """Normalize the phones of existing clients"""
+    from clients.phones import backfill_phone_e164
+    backfill_phone_e164(apps.get_model('clients', 'Client'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0017_message_segments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='phone_e164',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.RunPython(normalize_phones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0018_client_phone_e164'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MpesaCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('stk', 'STK push result'), ('c2b', 'C2B confirmation')], max_length=10)),
+                ('key', models.CharField(max_length=120, unique=True)),
+                ('receipt', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('result_code', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('account', models.CharField(blank=True, max_length=100)),
+                ('transaction_time', models.DateTimeField(blank=True, null=True)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('duplicate', 'Duplicate receipt'), ('unmatched', 'No matching client'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='clients.payment')),
+            ],
+            options={
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='clients_mpe_status_17fdd8_idx'), models.Index(fields=['updated_at'], name='clients_mpe_updated_c5a002_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0019_mpesa_callbacks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networkusage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
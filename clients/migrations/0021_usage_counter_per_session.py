@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def drop_merged_counters(apps, schema_editor):
+    """Counters of summed sessions ("id1,id2") match no session; their clients start from a new baseline"""
+    UsageCounter = apps.get_model('clients', 'UsageCounter')
+    UsageCounter.objects.filter(session_id__contains=',').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0020_network_usage_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usagecounter',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_counters', to='clients.client'),
+        ),
+        migrations.AlterField(
+            model_name='usagecounter',
+            name='read_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='usagecounter',
+            unique_together={('client', 'session_id')},
+        ),
+        migrations.RunPython(drop_merged_counters, migrations.RunPython.noop),
+    ]
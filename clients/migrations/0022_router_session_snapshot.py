@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:42
+
+from django.db import migrations, models
+
+
+def keep_latest_sessions(apps, schema_editor):
+    """Carry the latest sample's usernames over before the history loses them"""
+    RouterSample = apps.get_model('clients', 'RouterSample')
+    RouterSessionSnapshot = apps.get_model('clients', 'RouterSessionSnapshot')
+    latest = RouterSample.objects.filter(error='').order_by('-sampled_at').first()
+    if latest is not None:
+        RouterSessionSnapshot.objects.create(pk=1, sampled_at=latest.sampled_at, sessions=latest.sessions)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0021_usage_counter_per_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouterSessionSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sampled_at', models.DateTimeField()),
+                ('sessions', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.RunPython(keep_latest_sessions, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='routersample',
+            name='sessions',
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_receipts(apps, schema_editor):
+    """Stop with the receipts to resolve rather than a bare IntegrityError from the constraint"""
+    Payment = apps.get_model('clients', 'Payment')
+    duplicates = list(
+        Payment.objects.filter(payment_method='mpesa').exclude(transaction_id='')
+        .values('transaction_id').annotate(count=Count('pk')).filter(count__gt=1)
+        .values_list('transaction_id', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'M-Pesa receipts recorded more than once; delete the duplicate payments and migrate again: '
+            + ', '.join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0023_statement_imports'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StkPushRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(max_length=100, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('phone', models.CharField(max_length=20)),
+                ('account_reference', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RunPython(check_duplicate_receipts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('payment_method', 'mpesa'), models.Q(('transaction_id', ''), _negated=True)), fields=('transaction_id',), name='clients_payment_unique_mpesa_receipt', violation_error_message='This M-Pesa receipt has already been recorded.'),
+        ),
+        migrations.AddField(
+            model_name='stkpushrequest',
+            name='client',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='clients.client'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0024_stk_requests_unique_receipts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statementimport',
+            name='failed_receipts',
+            field=models.JSONField(default=list),
+        ),
+    ]
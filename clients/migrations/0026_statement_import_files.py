@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:01
+
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+
+
+def write_queued_statements(apps, schema_editor):
+    """Statements still waiting in the content column move to files"""
+    StatementImport = apps.get_model('clients', 'StatementImport')
+    for statement_import in StatementImport.objects.exclude(content='').exclude(status='done').iterator(chunk_size=1):
+        statement_import.statement.save(
+            statement_import.filename, ContentFile(statement_import.content.encode('utf-8')), save=False
+        )
+        statement_import.save(update_fields=['statement'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0025_statement_import_failed_receipts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statementimport',
+            name='statement',
+            field=models.FileField(blank=True, upload_to='statement_imports/%Y/%m/'),
+        ),
+        migrations.RunPython(write_queued_statements, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='statementimport',
+            name='content',
+        ),
+    ]
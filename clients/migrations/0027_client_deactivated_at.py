@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:04
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_deactivated_at(apps, schema_editor):
+    """The last change to a client already inactive is the best record of when it left"""
+    Client = apps.get_model('clients', 'Client')
+    Client.objects.filter(is_active=False).update(deactivated_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0026_statement_import_files'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='client',
+            name='clients_cli_is_acti_1f348f_idx',
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='deactivated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_deactivated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['is_active', 'deactivated_at'], name='clients_cli_is_acti_9cc933_idx'),
+        ),
+    ]
@@ -87,6 +87,33 @@ class MikroTikManager:
             {'name': 'guest2', 'server': 'hotspot1', 'address': '192.168.1.101'}
         ]
     
+    def get_user_counters(self):
+        """Get per-user byte counters of active sessions (bytes-in is what the router received from the user)"""
+        if not self.connected:
+            self.connect()
+        elapsed = int(time.time()) % 86400  # sessions restart daily
+        return [
+            {'name': 'client1', 'service': 'pppoe', 'session-id': '0x81000001', 'bytes-in': elapsed * 2000, 'bytes-out': elapsed * 25000},
+            {'name': 'client2', 'service': 'pppoe', 'session-id': '0x81000002', 'bytes-in': elapsed * 1500, 'bytes-out': elapsed * 18000},
+            {'name': 'client3', 'service': 'pppoe', 'session-id': '0x81000003', 'bytes-in': elapsed * 500, 'bytes-out': elapsed * 6000},
+            {'name': 'guest1', 'service': 'hotspot', 'session-id': '0x82000001', 'bytes-in': elapsed * 300, 'bytes-out': elapsed * 4000},
+            {'name': 'guest2', 'service': 'hotspot', 'session-id': '0x82000002', 'bytes-in': elapsed * 200, 'bytes-out': elapsed * 3000}
+        ]
+    
+    def create_pppoe_user(self, username, password, profile='default'):
+        """Create PPPoE secret"""
+        if not self.connected:
+            self.connect()
+        print(f'Mock: Created PPPoE user {username}')
+        return True, f'PPPoE user {username} created'
+    
+    def create_hotspot_user(self, username, password, profile='default'):
+        """Create hotspot user"""
+        if not self.connected:
+            self.connect()
+        print(f'Mock: Created hotspot user {username}')
+        return True, f'Hotspot user {username} created'
+    
     def is_connected(self):
         return self.connected
     
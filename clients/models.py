@@ -1,10 +1,14 @@
 ﻿# COMPLETE CLIENT MODELS WITH ALL FEATURES
 # Copyright (c) 2025 Martin Mutinda
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import User
 from datetime import datetime, timedelta
-from .mikrotik_integration import mikrotik_manager
+from .phones import to_e164
+from .router_sessions import latest_session_snapshot
 
 class ServicePlan(models.Model):
     PLAN_TYPES = [
@@ -28,6 +32,21 @@ class ServicePlan(models.Model):
     def get_active_clients_count(self):
         return self.client_set.filter(is_active=True).count()
 
+class ClientQuerySet(models.QuerySet):
+    def with_connection_status(self, snapshot=None):
+        """Annotate currently_connected from one router session snapshot (a SessionSnapshot);
+        None for every client when the snapshot is unknown"""
+        if snapshot is None:
+            snapshot = latest_session_snapshot()
+        if not snapshot.known:
+            return self.annotate(currently_connected=models.Value(None, output_field=models.BooleanField()))
+        return self.annotate(currently_connected=models.Case(
+            models.When(client_type='pppoe', username__in=snapshot.pppoe, then=models.Value(True)),
+            models.When(client_type='hotspot', username__in=snapshot.hotspot, then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField(),
+        ))
+
 class Client(models.Model):
     CLIENT_TYPES = [
         ('pppoe', 'PPPoE'),
@@ -41,10 +60,18 @@ class Client(models.Model):
         ('inactive', 'Inactive'),
     ]
     
+    PROVISIONING_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('provisioned', 'Provisioned'),
+        ('failed', 'Failed'),
+    ]
+    
     # Basic Information
     name = models.CharField(max_length=200)
     email = models.EmailField(blank=True)
     phone = models.CharField(max_length=20)
+    # phone as +254XXXXXXXXX ('' if it is not a Kenyan number), for matching M-Pesa payers
+    phone_e164 = models.CharField(max_length=16, blank=True, db_index=True, editable=False)
     id_number = models.CharField(max_length=20, blank=True)
     address = models.TextField()
     
@@ -63,6 +90,12 @@ class Client(models.Model):
     # Status
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     is_active = models.BooleanField(default=True)
+    # When is_active was last turned off, for the churn reports (updated_at moves with every payment)
+    deactivated_at = models.DateTimeField(blank=True, null=True, editable=False)
+    
+    # Router provisioning (handled by run_provisioning_worker)
+    provisioning_status = models.CharField(max_length=20, choices=PROVISIONING_STATUS_CHOICES, default='pending')
+    provisioning_error = models.CharField(max_length=255, blank=True)
     
     # Timestamps
     registration_date = models.DateField(auto_now_add=True)
@@ -73,8 +106,22 @@ class Client(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     
+    objects = ClientQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Dashboard counts: is_active alone or with client_type
+            models.Index(fields=['is_active', 'client_type']),
+            models.Index(fields=['status', 'is_active']),
+            # Billing runs pick due clients by next_payment_date
+            models.Index(fields=['is_active', 'next_payment_date']),
+            # Growth/churn reports and the default ordering
+            models.Index(fields=['created_at']),
+            models.Index(fields=['is_active', 'deactivated_at']),
+            # Incremental backups
+            models.Index(fields=['updated_at']),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.username})"
@@ -88,21 +135,34 @@ class Client(models.Model):
         if not self.next_payment_date:
             self.next_payment_date = datetime.now().date() + timedelta(days=30)
             
-        # Create MikroTik user if new client
-        if not self.pk:  # New client
-            try:
-                if self.client_type == 'pppoe':
-                    success, message = mikrotik_manager.create_pppoe_user(
-                        self.username, self.password
-                    )
-                elif self.client_type == 'hotspot':
-                    success, message = mikrotik_manager.create_hotspot_user(
-                        self.username, self.password
-                    )
-            except Exception as e:
-                print(f"Warning: Could not create MikroTik user: {e}")
+        # Keep the normalized phone in sync (bulk writes use phones.backfill_phone_e164)
+        self.phone_e164 = to_e164(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'phone_e164'}
+        
+        if self.is_active:
+            self.deactivated_at = None
+        elif self.deactivated_at is None:
+            self.deactivated_at = timezone.now()
+        if update_fields is not None and 'is_active' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'deactivated_at'}
+            
+        is_new = self._state.adding
+        if is_new and self.client_type not in ProvisioningTask.CLIENT_ACTIONS:
+            # No router account needed for this client type
+            self.provisioning_status = 'provisioned'
+            
+        with transaction.atomic():
+            super().save(*args, **kwargs)
             
-        super().save(*args, **kwargs)
+            # Queue the MikroTik account for the provisioning worker instead of
+            # calling the router while the request waits
+            if is_new and self.provisioning_status == 'pending':
+                ProvisioningTask.objects.create(
+                    client=self,
+                    action=ProvisioningTask.CLIENT_ACTIONS[self.client_type]
+                )
     
     def get_balance_status(self):
         """Get client balance status"""
@@ -119,21 +179,94 @@ class Client(models.Model):
             return (datetime.now().date() - self.next_payment_date).days
         return 0
     
-    def get_connection_status(self):
-        """Check if client is currently connected via MikroTik"""
-        try:
-            active_connections = mikrotik_manager.get_active_connections()
-            if self.client_type == 'pppoe':
-                for connection in active_connections.get('pppoe', []):
-                    if connection.get('name') == self.username:
-                        return True
-            elif self.client_type == 'hotspot':
-                for connection in active_connections.get('hotspot', []):
-                    if connection.get('user') == self.username:
-                        return True
-            return False
-        except:
-            return False
+    def get_connection_status(self, snapshot=None):
+        """Check if client is currently connected via MikroTik.
+        
+        Pass a SessionSnapshot when checking many clients; otherwise the latest sample is read.
+        None when there is no recent sample to tell.
+        """
+        if snapshot is None:
+            snapshot = latest_session_snapshot()
+        return snapshot.is_connected(self.client_type, self.username)
+
+class ProvisioningTask(models.Model):
+    """Queued MikroTik account change, processed by run_provisioning_worker"""
+    ACTION_CHOICES = [
+        ('create_pppoe', 'Create PPPoE user'),
+        ('create_hotspot', 'Create hotspot user'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    # Client type -> action queued when the client is created
+    CLIENT_ACTIONS = {
+        'pppoe': 'create_pppoe',
+        'hotspot': 'create_hotspot',
+    }
+    
+    client = models.ForeignKey(Client, on_delete=models.CASCADE)
+    action = models.CharField(max_length=30, choices=ACTION_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_action_display()} for {self.client.username} ({self.status})"
+
+class OutboundMessage(models.Model):
+    """Message in the outbox, sent by run_sms_dispatcher or the WhatsApp bulk sender"""
+    CHANNEL_CHOICES = [
+        ('sms', 'SMS'),
+        ('whatsapp', 'WhatsApp'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    client = models.ForeignKey(Client, on_delete=models.SET_NULL, blank=True, null=True)
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES, default='sms')
+    phone = models.CharField(max_length=20)
+    body = models.TextField()
+    # SMS parts the body is billed as (see message_templates.sms_segments)
+    segments = models.PositiveSmallIntegerField(default=1)
+    # Groups the messages queued by one send, e.g. a reminder blast
+    campaign = models.CharField(max_length=100, blank=True, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    provider_message_id = models.CharField(max_length=100, blank=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_channel_display()} to {self.phone} ({self.status})"
 
 class Invoice(models.Model):
     STATUS_CHOICES = [
@@ -144,6 +277,9 @@ class Invoice(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    # Statuses that count towards the client's balance
+    BILLABLE_STATUSES = ('sent', 'paid', 'overdue')
+    
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
     invoice_number = models.CharField(max_length=50, unique=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -151,33 +287,78 @@ class Invoice(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
     created_at = models.DateTimeField(auto_now_add=True)
     paid_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Pending/overdue lookups and invoice aging
+            models.Index(fields=['status', 'due_date']),
+            # Status breakdowns over a created_at window, plus plain date ranges
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['created_at']),
+            # Incremental backups
+            models.Index(fields=['updated_at']),
+        ]
     
     def __str__(self):
         return f"Invoice {self.invoice_number} - {self.client.name}"
     
+    @classmethod
+    def allocate_invoice_numbers(cls, count, date_str=None):
+        """Reserve a block of consecutive invoice numbers for today"""
+        from .sequences import reserve_block
+        
+        date_str = date_str or datetime.now().strftime('%Y%m%d')
+        first, last = reserve_block(date_str, count)
+        return [f"{date_str}-{num:04d}" for num in range(first, last + 1)]
+    
     def generate_invoice_number(self):
         """Generate unique invoice number"""
         if not self.invoice_number:
-            date_str = datetime.now().strftime('%Y%m%d')
-            last_invoice = Invoice.objects.filter(
-                invoice_number__startswith=date_str
-            ).order_by('-invoice_number').first()
+            from .sequences import invoice_number_allocator
             
-            if last_invoice:
-                last_num = int(last_invoice.invoice_number[-4:])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-                
-            self.invoice_number = f"{date_str}-{new_num:04d}"
+            date_str = datetime.now().strftime('%Y%m%d')
+            num = invoice_number_allocator.next_number(date_str)
+            self.invoice_number = f"{date_str}-{num:04d}"
     
     def save(self, *args, **kwargs):
         if not self.invoice_number:
             self.generate_invoice_number()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.sync_ledger_charge()
+    
+    def ledger_charge(self):
+        """Net of the charge and adjustment entries posted for this invoice (its payments excluded)"""
+        return LedgerEntry.objects.filter(invoice=self, payment__isnull=True).exclude(
+            entry_type='payment'
+        ).aggregate(total=Sum('amount'))['total'] or 0
+    
+    def sync_ledger_charge(self):
+        """Keep the ledger charge for this invoice in line with its amount and status"""
+        from .ledger import post_entry
+        
+        charged = self.ledger_charge()
+        target = self.amount if self.status in self.BILLABLE_STATUSES else 0
+        delta = target - charged
+        
+        if delta:
+            post_entry(LedgerEntry(
+                client_id=self.client_id,
+                invoice=self,
+                entry_type='charge' if not charged and delta > 0 else 'adjustment',
+                amount=delta,
+                description=f"Invoice {self.invoice_number}"
+            ))
+
+class InvoiceSequence(models.Model):
+    """Per-day counter used to hand out blocks of invoice numbers"""
+    prefix = models.CharField(max_length=20, unique=True)
+    last_value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.prefix} -> {self.last_value}"
 
 class Payment(models.Model):
     PAYMENT_METHODS = [
@@ -189,33 +370,244 @@ class Payment(models.Model):
     
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, blank=True, null=True)
+    # Plan the payment was made against, so revenue stays with it if the client changes plan
+    service_plan = models.ForeignKey(ServicePlan, on_delete=models.PROTECT, blank=True, null=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHODS, default='mpesa')
-    transaction_id = models.CharField(max_length=100, blank=True)
-    payment_date = models.DateTimeField(auto_now_add=True)
+    transaction_id = models.CharField(max_length=100, blank=True, db_index=True)
+    payment_date = models.DateTimeField(default=timezone.now)
     notes = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-payment_date']
+        indexes = [
+            # Revenue over a date range, grouped by payment method
+            models.Index(fields=['payment_date', 'payment_method']),
+            # Incremental backups
+            models.Index(fields=['updated_at']),
+        ]
+        constraints = [
+            # An M-Pesa receipt is recorded once, whichever callback or statement brought it in
+            models.UniqueConstraint(
+                fields=['transaction_id'],
+                condition=models.Q(payment_method='mpesa') & ~models.Q(transaction_id=''),
+                name='clients_payment_unique_mpesa_receipt',
+                violation_error_message='This M-Pesa receipt has already been recorded.',
+            ),
+        ]
     
     def __str__(self):
         return f"Payment of KSH {self.amount} by {self.client.name}"
     
     def save(self, *args, **kwargs):
-        # Update client balance
-        if self.client:
-            self.client.balance -= self.amount
-            self.client.last_payment_date = datetime.now().date()
-            self.client.next_payment_date = datetime.now().date() + timedelta(days=30)
-            self.client.save()
+        from .ledger import post_entry
+        from .revenue import apply_revenue_changes
+        
+        is_new = self._state.adding
+        if is_new and self.service_plan_id is None and self.client_id:
+            self.service_plan_id = self.client.service_plan_id
+        
+        with transaction.atomic():
+            previous = None
+            if not is_new:
+                previous = Payment.objects.filter(pk=self.pk).only(
+                    'amount', 'payment_date', 'payment_method', 'service_plan'
+                ).first()
             
-        # Update invoice status if applicable
-        if self.invoice:
-            self.invoice.status = 'paid'
-            self.invoice.paid_at = datetime.now()
-            self.invoice.save()
+            super().save(*args, **kwargs)
             
-        super().save(*args, **kwargs)
+            # Keep the daily revenue rollup in step (edits and refunds move the old row out)
+            changes = [(self, 1)]
+            if previous is not None:
+                changes.append((previous, -1))
+            apply_revenue_changes(changes)
+            
+            if is_new:
+                # Balance moves through the ledger as a single-column UPDATE
+                post_entry(LedgerEntry(
+                    client_id=self.client_id,
+                    payment=self,
+                    invoice_id=self.invoice_id,
+                    entry_type='payment',
+                    amount=-self.amount,
+                    description=self.transaction_id or f"{self.get_payment_method_display()} payment"
+                ))
+                today = timezone.localdate()
+                Client.objects.filter(pk=self.client_id).update(
+                    last_payment_date=today,
+                    next_payment_date=today + timedelta(days=30),
+                    updated_at=timezone.now()
+                )
+                
+                # Update invoice status if applicable
+                if self.invoice:
+                    self.invoice.status = 'paid'
+                    self.invoice.paid_at = timezone.now()
+                    self.invoice.save(update_fields=['status', 'paid_at', 'updated_at'])
+            else:
+                self.sync_ledger_credit()
+    
+    def sync_ledger_credit(self):
+        """Keep the ledger credit for this payment in line with its amount and client"""
+        from .ledger import post_entry
+        
+        credited = {
+            row['client_id']: row['total']
+            for row in LedgerEntry.objects.filter(payment=self).values('client_id').annotate(total=Sum('amount')).order_by()
+        }
+        # A payment moved to another client is taken off the old client's balance
+        for client_id in set(credited) | {self.client_id}:
+            target = -self.amount if client_id == self.client_id else 0
+            delta = target - credited.get(client_id, 0)
+            if delta:
+                post_entry(LedgerEntry(
+                    client_id=client_id,
+                    payment=self,
+                    entry_type='adjustment',
+                    amount=delta,
+                    description=f"Payment {self.transaction_id or self.pk} amended"
+                ))
+
+class StatementImport(models.Model):
+    """M-Pesa statement uploaded in the admin, imported by run_statement_imports"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    filename = models.CharField(max_length=255)
+    # The uploaded CSV, streamed by the worker and deleted once imported
+    statement = models.FileField(upload_to='statement_imports/%Y/%m/', blank=True)
+    dry_run = models.BooleanField(default=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # PaymentStatementImporter statistics, saved after every batch
+    progress = models.JSONField(default=dict)
+    unmatched_receipts = models.JSONField(default=list)
+    # Rows without a completion time that could be read
+    failed_receipts = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+class StkPushRequest(models.Model):
+    """STK push sent by this system; its result callback is matched to the client through it"""
+    checkout_request_id = models.CharField(max_length=100, unique=True)
+    client = models.ForeignKey(Client, on_delete=models.SET_NULL, blank=True, null=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    phone = models.CharField(max_length=20)
+    account_reference = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"STK push {self.checkout_request_id} for KSH {self.amount}"
+
+class MpesaCallback(models.Model):
+    """Raw M-Pesa callback as received, turned into a Payment by process_mpesa_callbacks"""
+    KIND_CHOICES = [
+        ('stk', 'STK push result'),
+        ('c2b', 'C2B confirmation'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('duplicate', 'Duplicate receipt'),
+        ('unmatched', 'No matching client'),
+        # M-Pesa reported the transaction as failed or cancelled
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # stk:<CheckoutRequestID> or c2b:<receipt>; a redelivered callback hits this unique key
+    key = models.CharField(max_length=120, unique=True)
+    receipt = models.CharField(max_length=100, blank=True, db_index=True)
+    result_code = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    phone = models.CharField(max_length=20, blank=True)
+    account = models.CharField(max_length=100, blank=True)
+    transaction_time = models.DateTimeField(blank=True, null=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, blank=True, null=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.receipt or self.key} ({self.status})"
+
+class LedgerEntry(models.Model):
+    """Append-only record of every change to a client's balance"""
+    ENTRY_TYPES = [
+        ('charge', 'Charge'),
+        ('payment', 'Payment'),
+        ('adjustment', 'Adjustment'),
+    ]
+    
+    client = models.ForeignKey(Client, on_delete=models.CASCADE)
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPES)
+    # Signed change to the balance: charges are positive, payments negative
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, blank=True, null=True)
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, blank=True, null=True)
+    description = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'Ledger entries'
+    
+    def __str__(self):
+        return f"{self.get_entry_type_display()} of KSH {self.amount} for {self.client.name}"
+
+class RevenueDaily(models.Model):
+    """Payments summed per day, service plan and payment method for the revenue reports"""
+    date = models.DateField()
+    service_plan = models.ForeignKey(ServicePlan, on_delete=models.PROTECT, blank=True, null=True)
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHODS)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payment_count = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Daily revenue'
+        constraints = [
+            # Treats "no plan" as one key so upserts can target it
+            models.UniqueConstraint(
+                'date', 'payment_method', Coalesce('service_plan', 0),
+                name='clients_revenuedaily_unique_key'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Revenue of KSH {self.total} on {self.date} ({self.payment_method})"
 
 class NetworkUsage(models.Model):
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
@@ -223,10 +615,16 @@ class NetworkUsage(models.Model):
     upload_bytes = models.BigIntegerField(default=0)
     usage_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by the ingest upsert too: late readings still add to past days
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         unique_together = ['client', 'usage_date']
         ordering = ['-usage_date']
+        indexes = [
+            # Date-range totals across all clients and retention purges
+            models.Index(fields=['usage_date']),
+        ]
     
     def __str__(self):
         return f"Usage for {self.client.name} on {self.usage_date}"
@@ -244,6 +642,112 @@ class NetworkUsage(models.Model):
         else:  # KB
             return f"{(total_bytes / 1024):.2f} KB"
 
+class UsageSample(models.Model):
+    """Raw usage between two counter readings; rolled up to hourly and purged after a few days"""
+    client = models.ForeignKey(Client, on_delete=models.CASCADE)
+    sampled_at = models.DateTimeField()
+    download_bytes = models.BigIntegerField(default=0)
+    upload_bytes = models.BigIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-sampled_at']
+        indexes = [
+            models.Index(fields=['sampled_at']),
+            models.Index(fields=['client', 'sampled_at']),
+        ]
+    
+    def __str__(self):
+        return f"Usage sample for {self.client.name} at {self.sampled_at:%Y-%m-%d %H:%M}"
+
+class UsageRollup(models.Model):
+    """Usage summed per client per hour or month (daily totals are NetworkUsage)"""
+    RESOLUTION_CHOICES = [
+        ('hour', 'Hourly'),
+        ('month', 'Monthly'),
+    ]
+    
+    client = models.ForeignKey(Client, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    period_start = models.DateTimeField()
+    download_bytes = models.BigIntegerField(default=0)
+    upload_bytes = models.BigIntegerField(default=0)
+    # Rollups are recomputed in place; incremental backups pick up the ones that changed
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    class Meta:
+        ordering = ['-period_start']
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'resolution', 'period_start'], name='clients_usagerollup_unique_period'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'period_start']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_resolution_display()} usage for {self.client.name} from {self.period_start:%Y-%m-%d %H:%M}"
+
+class UsageCounter(models.Model):
+    """Last byte counters read for one session of a client, so the next reading can be turned into usage"""
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='usage_counters')
+    # Router / RADIUS session the counters belong to; a new session restarts them at zero
+    session_id = models.CharField(max_length=100, blank=True)
+    download_bytes = models.BigIntegerField(default=0)
+    upload_bytes = models.BigIntegerField(default=0)
+    read_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = ['client', 'session_id']
+    
+    def __str__(self):
+        return f"Usage counters for {self.client.name} at {self.read_at:%Y-%m-%d %H:%M}"
+
+class RouterSample(models.Model):
+    """Router state recorded by poll_mikrotik; views read the latest one instead of calling the router"""
+    sampled_at = models.DateTimeField(default=timezone.now, db_index=True)
+    cpu_load = models.PositiveSmallIntegerField(blank=True, null=True)
+    free_memory = models.BigIntegerField(blank=True, null=True)
+    total_memory = models.BigIntegerField(blank=True, null=True)
+    uptime = models.CharField(max_length=50, blank=True)
+    pppoe_sessions = models.IntegerField(default=0)
+    hotspot_sessions = models.IntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+    
+    class Meta:
+        ordering = ['-sampled_at']
+    
+    def __str__(self):
+        return f"Router sample at {self.sampled_at:%Y-%m-%d %H:%M:%S}"
+    
+    @property
+    def total_sessions(self):
+        return self.pppoe_sessions + self.hotspot_sessions
+
+class RouterSessionSnapshot(models.Model):
+    """Usernames connected at the latest successful poll; one row, overwritten by every poll"""
+    sampled_at = models.DateTimeField()
+    # {"pppoe": [...], "hotspot": [...]}
+    sessions = models.JSONField(default=dict)
+    
+    def __str__(self):
+        return f"Router sessions at {self.sampled_at:%Y-%m-%d %H:%M:%S}"
+
+class InterfaceSample(models.Model):
+    """Byte counters of one router interface at the time of a RouterSample"""
+    sample = models.ForeignKey(RouterSample, on_delete=models.CASCADE, related_name='interfaces')
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, blank=True)
+    rx_bytes = models.BigIntegerField(default=0)
+    tx_bytes = models.BigIntegerField(default=0)
+    # Bytes per second since the previous sample of this interface
+    rx_rate = models.BigIntegerField(blank=True, null=True)
+    tx_rate = models.BigIntegerField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} at {self.sample.sampled_at:%Y-%m-%d %H:%M:%S}"
+
 class SystemSettings(models.Model):
     """System configuration settings"""
     SETTING_TYPES = [
@@ -281,6 +785,15 @@ class SystemSettings(models.Model):
         else:
             return self.value
 
+class DeletedRecord(models.Model):
+    """Tombstone of a deleted row, so an incremental backup can replay the deletion"""
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
 class SystemResetLog(models.Model):
     """Log of system reset operations"""
     RESET_TYPES = [
@@ -288,6 +801,12 @@ class SystemResetLog(models.Model):
         ('financial', 'Financial Data'),
         ('all', 'Complete Reset'),
         ('custom', 'Custom Reset'),
+        ('network_stats', 'Network Statistics'),
+        ('test_data', 'Test Data'),
+    ]
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
     ]
     
     reset_type = models.CharField(max_length=20, choices=RESET_TYPES)
@@ -297,6 +816,11 @@ class SystemResetLog(models.Model):
     invoices_deleted = models.IntegerField(default=0)
     payments_deleted = models.IntegerField(default=0)
     reset_date = models.DateTimeField(auto_now_add=True)
+    # A batched reset stays 'running' until its last batch; an interrupted one is resumed from here
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='completed')
+    completed_at = models.DateTimeField(blank=True, null=True)
+    # Rows deleted per model so far, plus the options the reset was started with
+    progress = models.JSONField(default=dict, blank=True)
     
     class Meta:
         ordering = ['-reset_date']
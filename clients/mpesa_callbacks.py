@@ -0,0 +1,223 @@
+# M-PESA CALLBACKS
+# The callback endpoint only validates a Daraja callback and inserts it into MpesaCallback,
+# keyed by CheckoutRequestID (STK push) or receipt (C2B), so a redelivered callback is a
+# no-op insert and Safaricom gets its answer at once. process_callbacks later turns pending
+# callbacks into payments a batch at a time, with one record_payments call per batch.
+# An STK result belongs to the client its push was sent for (StkPushRequest); a C2B
+# confirmation is matched by its account reference or paying number.
+
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from zoneinfo import ZoneInfo
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from .ledger import record_payments
+from .models import Client, MpesaCallback, Payment, StkPushRequest
+from .phones import clients_by_phone
+
+CALLBACK_BATCH_SIZE = 500
+
+# MpesaCallback.amount and Payment.amount are DecimalField(max_digits=10, decimal_places=2)
+AMOUNT_LIMIT = Decimal('100000000')
+
+# Daraja timestamps (20250131143005) are Nairobi local time
+MPESA_TIMEZONE = ZoneInfo('Africa/Nairobi')
+
+def parse_timestamp(value):
+    try:
+        parsed = datetime.strptime(str(value), '%Y%m%d%H%M%S')
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=MPESA_TIMEZONE)
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value))
+        # NaN and Infinity parse, but cannot be stored or compared
+        if not amount.is_finite():
+            raise InvalidOperation
+        amount = amount.quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError):
+        raise ValueError(f'Invalid amount {value!r}')
+    if abs(amount) >= AMOUNT_LIMIT:
+        raise ValueError(f'Amount {value!r} is out of range')
+    return amount
+
+def parse_callback(payload):
+    """MpesaCallback fields for an STK push result or a C2B confirmation; raises ValueError if it is neither"""
+    if not isinstance(payload, dict):
+        raise ValueError('Callback body must be a JSON object')
+
+    body = payload.get('Body')
+    stk = body.get('stkCallback') if isinstance(body, dict) else None
+    if isinstance(stk, dict):
+        checkout_id = str(stk.get('CheckoutRequestID') or '').strip()
+        if not checkout_id:
+            raise ValueError('STK callback without CheckoutRequestID')
+        try:
+            result_code = int(stk.get('ResultCode'))
+        except (TypeError, ValueError):
+            raise ValueError('STK callback without a numeric ResultCode')
+
+        items = (stk.get('CallbackMetadata') or {}).get('Item') or []
+        metadata = {item.get('Name'): item.get('Value') for item in items if isinstance(item, dict)}
+        # Failed and cancelled pushes carry no metadata, but are stored so the outcome is on record
+        if result_code == 0 and not (metadata.get('MpesaReceiptNumber') and metadata.get('Amount') is not None):
+            raise ValueError('Successful STK callback without a receipt and amount')
+        return {
+            'kind': 'stk',
+            'key': f'stk:{checkout_id}'[:120],
+            'receipt': str(metadata.get('MpesaReceiptNumber') or '')[:100],
+            'result_code': result_code,
+            'amount': parse_amount(metadata['Amount']) if metadata.get('Amount') is not None else None,
+            'phone': str(metadata.get('PhoneNumber') or '')[:20],
+            'account': '',
+            'transaction_time': parse_timestamp(metadata.get('TransactionDate')),
+        }
+
+    receipt = str(payload.get('TransID') or '').strip()
+    if receipt and 'TransAmount' in payload:
+        return {
+            'kind': 'c2b',
+            'key': f'c2b:{receipt}'[:120],
+            'receipt': receipt[:100],
+            'result_code': 0,
+            'amount': parse_amount(payload['TransAmount']),
+            'phone': str(payload.get('MSISDN') or '')[:20],
+            'account': str(payload.get('BillRefNumber') or '').strip()[:100],
+            'transaction_time': parse_timestamp(payload.get('TransTime')),
+        }
+    raise ValueError('Not an STK push result or C2B confirmation')
+
+def checkout_request_id(key):
+    return key.removeprefix('stk:')
+
+def store_callback(payload):
+    """Validate a callback and insert it with one INSERT; a callback already stored is ignored"""
+    fields = parse_callback(payload)
+    # Only results of pushes this system sent are accepted
+    if fields['kind'] == 'stk' and not StkPushRequest.objects.filter(
+        checkout_request_id=checkout_request_id(fields['key'])
+    ).exists():
+        raise ValueError('Unknown CheckoutRequestID')
+    # ON CONFLICT DO NOTHING on the unique key, so concurrent redeliveries cannot race
+    MpesaCallback.objects.bulk_create([MpesaCallback(payload=payload, **fields)], ignore_conflicts=True)
+    return fields
+
+def match_clients(callbacks):
+    """{callback id: client id}; STK results by the push that was sent, C2B confirmations by
+    account reference (username or phone), then by the paying number"""
+    pushes = {
+        checkout_id: (client_id, amount)
+        for checkout_id, client_id, amount in StkPushRequest.objects.filter(
+            checkout_request_id__in=[checkout_request_id(callback.key) for callback in callbacks if callback.kind == 'stk']
+        ).values_list('checkout_request_id', 'client_id', 'amount')
+    }
+
+    accounts = {callback.account for callback in callbacks if callback.kind == 'c2b' and callback.account}
+    usernames = {}
+    for client_id, username in Client.objects.filter(
+        username__in=accounts | {account.lower() for account in accounts}
+    ).values_list('pk', 'username'):
+        usernames.setdefault(username.lower(), client_id)
+    phone_index = clients_by_phone(
+        value for callback in callbacks if callback.kind == 'c2b' and callback.account.lower() not in usernames
+        for value in (callback.account, callback.phone)
+    )
+
+    matches = {}
+    for callback in callbacks:
+        if callback.kind == 'stk':
+            # A paid amount other than the one pushed is left unmatched for review
+            client_id, amount = pushes.get(checkout_request_id(callback.key), (None, None))
+            if client_id is not None and amount == callback.amount:
+                matches[callback.pk] = client_id
+            continue
+        client_id = usernames.get(callback.account.lower())
+        if client_id is None:
+            client_id = phone_index.get(callback.account) or phone_index.get(callback.phone)
+        if client_id is not None:
+            matches[callback.pk] = client_id
+    return matches
+
+def process_batch(batch_size=CALLBACK_BATCH_SIZE):
+    """Turn up to batch_size pending callbacks into payments in one transaction; returns counts per outcome"""
+    counts = {'processed': 0, 'duplicate': 0, 'unmatched': 0, 'failed': 0}
+    with transaction.atomic():
+        # SKIP LOCKED (PostgreSQL) keeps a second processor off rows this one is working on.
+        # The fields are parsed again from the payload, so a row stored before a validation
+        # rule existed is marked failed instead of stopping every later batch.
+        rows = list(
+            MpesaCallback.objects.filter(status='pending').order_by('pk').select_for_update(skip_locked=True).only(
+                'payload', 'received_at'
+            )[:batch_size]
+        )
+        if not rows:
+            return counts
+
+        callbacks = []
+        outcomes = {}
+        for row in rows:
+            try:
+                fields = parse_callback(row.payload)
+            except ValueError:
+                outcomes[row.pk] = 'failed'
+                continue
+            callbacks.append(MpesaCallback(pk=row.pk, received_at=row.received_at, **fields))
+
+        # An STK push may also arrive as a C2B confirmation: the receipt decides
+        existing = dict(
+            Payment.objects.filter(
+                transaction_id__in={callback.receipt for callback in callbacks if callback.receipt}
+            ).values_list('transaction_id', 'pk')
+        )
+        clients = match_clients(callbacks)
+
+        payments = {}
+        for callback in callbacks:
+            if callback.result_code != 0 or not callback.receipt or not callback.amount or callback.amount <= 0:
+                outcomes[callback.pk] = 'failed'
+            elif callback.receipt in existing or callback.receipt in payments:
+                outcomes[callback.pk] = 'duplicate'
+            elif callback.pk not in clients:
+                outcomes[callback.pk] = 'unmatched'
+            else:
+                outcomes[callback.pk] = 'processed'
+                payments[callback.receipt] = Payment(
+                    client_id=clients[callback.pk],
+                    amount=callback.amount,
+                    payment_method='mpesa',
+                    transaction_id=callback.receipt,
+                    payment_date=callback.transaction_time or callback.received_at,
+                    notes='M-Pesa STK push' if callback.kind == 'stk' else 'M-Pesa paybill',
+                )
+
+        # One insert for the payments and ledger entries, one UPDATE for all balances
+        if payments:
+            for payment in record_payments(list(payments.values())):
+                existing[payment.transaction_id] = payment.pk
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        quote = connection.ops.quote_name
+        sql = 'UPDATE {} SET {} = %s, {} = %s, {} = %s, {} = %s WHERE {} = %s'.format(
+            quote(MpesaCallback._meta.db_table), quote('status'), quote('payment_id'),
+            quote('processed_at'), quote('updated_at'), quote('id'),
+        )
+        receipts = {callback.pk: callback.receipt for callback in callbacks}
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                (outcome, existing.get(receipts[pk]) if outcome != 'failed' else None, now, now, pk)
+                for pk, outcome in outcomes.items()
+            ])
+        for outcome in outcomes.values():
+            counts[outcome] += 1
+    return counts
+
+def process_callbacks(batch_size=CALLBACK_BATCH_SIZE):
+    """process_batch, run again once if a receipt in the batch was recorded concurrently"""
+    try:
+        return process_batch(batch_size)
+    except IntegrityError:
+        # A statement import or a callback in another processor's batch recorded the same
+        # receipt first; the batch was rolled back, and the second run finds that payment
+        return process_batch(batch_size)
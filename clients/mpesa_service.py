@@ -1,21 +1,67 @@
 ﻿import requests
 import base64
+import hashlib
+import os
+import time
+import uuid
 from datetime import datetime
+from decimal import Decimal
 import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
+from django.core.cache import cache
+from .models import Client, StkPushRequest
+
+# Daraja base URL (sandbox by default; https://api.safaricom.co.ke in production)
+DARAJA_URL = os.getenv('MPESA_API_URL', 'https://sandbox.safaricom.co.ke')
+# (connect, read) seconds for every Daraja call
+DARAJA_TIMEOUT = (5, 30)
+
+# Access tokens live in the Django cache (Redis when configured), so all workers share one.
+# Daraja tokens last an hour; they are refreshed this many seconds before they expire.
+TOKEN_REFRESH_MARGIN = 300
+# A refresh lock is dropped after this long in case its worker died
+TOKEN_LOCK_TIMEOUT = 30
+
+def record_stk_push(response, phone_number, amount, account_reference, client=None):
+    """Remember a push Daraja accepted; its result callback is only accepted and matched through this"""
+    checkout_id = str(response.get('CheckoutRequestID') or '')
+    if str(response.get('ResponseCode')) != '0' or not checkout_id:
+        return None
+    if client is None:
+        # Pushes are sent with the client's username as the account reference
+        client = Client.objects.filter(username__iexact=account_reference).first()
+    return StkPushRequest.objects.create(
+        checkout_request_id=checkout_id[:100],
+        client=client,
+        amount=Decimal(str(amount)),
+        phone=str(phone_number)[:20],
+        account_reference=str(account_reference)[:100],
+    )
 
 class MpesaGateway:
     def __init__(self):
-        self.consumer_key = "YOUR_CONSUMER_KEY"  # You'll get this from Safaricom
-        self.consumer_secret = "YOUR_CONSUMER_SECRET"  # You'll get this from Safaricom
-        self.business_shortcode = "174379"  # Lipa Na M-Pesa shortcode
-        self.passkey = "YOUR_PASSKEY"  # From Safaricom
-        self.callback_url = "https://yourdomain.com/mpesa-callback/"  # Your callback URL
+        self.consumer_key = os.getenv('MPESA_CONSUMER_KEY', "YOUR_CONSUMER_KEY")  # You'll get this from Safaricom
+        self.consumer_secret = os.getenv('MPESA_CONSUMER_SECRET', "YOUR_CONSUMER_SECRET")  # You'll get this from Safaricom
+        self.business_shortcode = os.getenv('MPESA_SHORTCODE', "174379")  # Lipa Na M-Pesa shortcode
+        self.passkey = os.getenv('MPESA_PASSKEY', "YOUR_PASSKEY")  # From Safaricom
+        self.callback_url = os.getenv('MPESA_CALLBACK_URL', "https://yourdomain.com/mpesa-callback/")  # Your callback URL
+        self.base_url = DARAJA_URL
         
-    def get_access_token(self):
-        """Get M-Pesa API access token"""
+        # One pool of keep-alive connections for all Daraja calls. Only failed connects are
+        # retried: a request that reached Daraja is never sent twice.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=10, max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Tokens are per consumer key
+        self.token_key = 'mpesa:token:' + hashlib.sha256(self.consumer_key.encode()).hexdigest()[:16]
+        
+    def fetch_access_token(self):
+        """Get a new M-Pesa API access token from Daraja and cache it"""
         try:
-            url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
+            url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
             auth_string = f"{self.consumer_key}:{self.consumer_secret}"
             encoded_auth = base64.b64encode(auth_string.encode()).decode()
             
@@ -23,27 +69,65 @@ class MpesaGateway:
                 "Authorization": f"Basic {encoded_auth}"
             }
             
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                return response.json()["access_token"]
-            return None
+            response = self.session.get(url, headers=headers, timeout=DARAJA_TIMEOUT)
+            if response.status_code != 200:
+                print(f"Error getting access token: HTTP {response.status_code}")
+                return None
+            data = response.json()
         except Exception as e:
             print(f"Error getting access token: {e}")
             return None
+        
+        expires_in = int(data.get("expires_in", 3599))
+        now = time.time()
+        cache.set(self.token_key, {
+            'token': data["access_token"],
+            'expires_at': now + expires_in,
+            'refresh_at': now + max(expires_in - TOKEN_REFRESH_MARGIN, 0),
+        }, timeout=expires_in)
+        return data["access_token"]
     
-    def stk_push(self, phone_number, amount, account_reference, transaction_desc):
+    def get_access_token(self, wait=5.0):
+        """Return the shared access token, refreshing it in at most one worker at a time"""
+        entry = cache.get(self.token_key)
+        if entry and entry['refresh_at'] > time.time():
+            return entry['token']
+        
+        lock_key = self.token_key + ':lock'
+        if cache.add(lock_key, 1, timeout=TOKEN_LOCK_TIMEOUT):
+            try:
+                token = self.fetch_access_token()
+            finally:
+                cache.delete(lock_key)
+            if token:
+                return token
+        
+        # Someone else is refreshing (or Daraja failed): a token that has not expired still works
+        if entry and entry['expires_at'] > time.time():
+            return entry['token']
+        
+        # No usable token yet: wait for the refresh rather than piling onto the OAuth endpoint
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(self.token_key)
+            if entry and entry['expires_at'] > time.time():
+                return entry['token']
+        return None
+    
+    def invalidate_token(self):
+        """Drop a token Daraja has rejected, so the next call fetches a new one"""
+        cache.delete(self.token_key)
+    
+    def stk_push(self, phone_number, amount, account_reference, transaction_desc, client=None):
         """Initiate STK push to customer"""
         try:
-            access_token = self.get_access_token()
-            if not access_token:
-                return None
-                
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
             password = base64.b64encode(
                 f"{self.business_shortcode}{self.passkey}{timestamp}".encode()
             ).decode()
             
-            url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
+            url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
             
             payload = {
                 "BusinessShortCode": self.business_shortcode,
@@ -59,13 +143,24 @@ class MpesaGateway:
                 "TransactionDesc": transaction_desc
             }
             
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(url, json=payload, headers=headers)
-            return response.json()
+            # A token revoked before its expiry is rejected with 401: fetch a new one and retry once
+            for attempt in range(2):
+                access_token = self.get_access_token()
+                if not access_token:
+                    return None
+                
+                headers = {
+                    "Authorization": f"Bearer {access_token}",
+                    "Content-Type": "application/json"
+                }
+                
+                response = self.session.post(url, json=payload, headers=headers, timeout=DARAJA_TIMEOUT)
+                if response.status_code != 401:
+                    break
+                self.invalidate_token()
+            data = response.json()
+            record_stk_push(data, phone_number, amount, account_reference, client)
+            return data
             
         except Exception as e:
             print(f"Error in STK push: {e}")
@@ -73,15 +168,17 @@ class MpesaGateway:
 
 # Mock M-Pesa service for development (remove in production)
 class MockMpesaGateway:
-    def stk_push(self, phone_number, amount, account_reference, transaction_desc):
+    def stk_push(self, phone_number, amount, account_reference, transaction_desc, client=None):
         """Mock STK push for development"""
         print(f"Mock M-Pesa: Sending STK push to {phone_number} for KSH {amount}")
-        return {
+        data = {
             "ResponseCode": "0",
             "ResponseDescription": "Success",
             "MerchantRequestID": "mock-12345",
-            "CheckoutRequestID": "mock-checkout-12345"
+            "CheckoutRequestID": f"mock-checkout-{uuid.uuid4().hex[:12]}"
         }
+        record_stk_push(data, phone_number, amount, account_reference, client)
+        return data
 
 # Use mock for development, real for production
 mpesa_gateway = MockMpesaGateway()
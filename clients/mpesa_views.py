@@ -0,0 +1,71 @@
+import hmac
+import ipaddress
+import json
+import logging
+import os
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .mpesa_callbacks import store_callback
+
+logger = logging.getLogger(__name__)
+
+# Daraja does not sign callbacks: MPESA_CALLBACK_URL must end in ?token=<this value>,
+# and every callback is refused until it is set
+CALLBACK_TOKEN = os.getenv('MPESA_CALLBACK_TOKEN', '')
+
+# Addresses Safaricom sends production callbacks from
+SAFARICOM_CALLBACK_IPS = (
+    '196.201.214.200,196.201.214.206,196.201.213.114,196.201.214.207,196.201.214.208,'
+    '196.201.213.44,196.201.212.127,196.201.212.138,196.201.212.129,196.201.212.136,'
+    '196.201.212.74,196.201.212.69'
+)
+
+def parse_networks(value):
+    """Comma-separated addresses or CIDR ranges; * accepts any address (e.g. for the sandbox)"""
+    if value.strip() == '*':
+        return None
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(',') if item.strip()]
+
+CALLBACK_NETWORKS = parse_networks(os.getenv('MPESA_CALLBACK_IPS', SAFARICOM_CALLBACK_IPS))
+
+# Behind a reverse proxy REMOTE_ADDR is the proxy; with this set, the address the proxy
+# appended to X-Forwarded-For is used instead (earlier entries can be forged by the sender)
+TRUST_FORWARDED_FOR = os.getenv('MPESA_CALLBACK_TRUST_FORWARDED_FOR', '').lower() in ('1', 'true', 'yes')
+
+def callback_source(request):
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    if TRUST_FORWARDED_FOR and forwarded:
+        return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+def allowed_source(address):
+    if CALLBACK_NETWORKS is None:
+        return True
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in CALLBACK_NETWORKS)
+
+@csrf_exempt
+@require_POST
+def mpesa_callback(request):
+    """Store an M-Pesa STK push result or C2B confirmation; process_mpesa_callbacks records the payment"""
+    if not CALLBACK_TOKEN:
+        logger.error('M-Pesa callback refused: MPESA_CALLBACK_TOKEN is not set')
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Rejected'}, status=403)
+    source = callback_source(request)
+    if not allowed_source(source):
+        logger.warning(f'M-Pesa callback refused from {source}')
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Rejected'}, status=403)
+    if not hmac.compare_digest(request.GET.get('token', ''), CALLBACK_TOKEN):
+        logger.warning(f'M-Pesa callback with a wrong token from {source}')
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Rejected'}, status=403)
+    try:
+        store_callback(json.loads(request.body))
+    except ValueError as e:
+        # json.JSONDecodeError is a ValueError too
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': f'Rejected: {e}'}, status=400)
+    # Also the answer to a redelivered callback, which was stored the first time
+    return JsonResponse({'ResultCode': 0, 'ResultDesc': 'Accepted'})
@@ -0,0 +1,72 @@
+# MESSAGE OUTBOX
+# Views never talk to the SMS provider: they render each recipient's message from a compiled
+# template and queue it as an OutboundMessage (batched executemany inserts), and return at once.
+# run_sms_dispatcher sends the queue through a rate-limited thread pool, one provider request per
+# group of identical texts, and records the outcome.
+
+import secrets
+from django.db import connection, transaction
+from django.utils import timezone
+from .message_templates import compile_template, sms_segments
+from .models import OutboundMessage
+
+ENQUEUE_BATCH_SIZE = 1000
+
+def new_campaign(prefix='sms'):
+    return f'{prefix}-{timezone.now():%Y%m%d-%H%M%S}-{secrets.token_hex(3)}'
+
+def insert_messages(rows, channel, campaign, status='pending'):
+    """Insert (client_id, phone, body) rows as messages, with their SMS segment counts, in one executemany.
+
+    bulk_create spends most of its time compiling the INSERT value by value; the outbox is
+    written in large bursts, so its few columns are spelled out here instead.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    values = {
+        'channel': channel, 'campaign': campaign, 'status': status, 'attempts': 0, 'next_attempt_at': now,
+        'last_error': '', 'provider_message_id': '', 'created_at': now, 'updated_at': now,
+    }
+    columns = ['client_id', 'phone', 'body', 'segments'] + list(values)
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(OutboundMessage._meta.db_table), ', '.join(quote(column) for column in columns), ', '.join(['%s'] * len(columns))
+    )
+    constant = tuple(values.values())
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [row + (sms_segments(row[2]),) + constant for row in rows])
+
+def mark_sent(sent):
+    """Record (message id, provider message id) pairs as sent with one executemany UPDATE"""
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    quote = connection.ops.quote_name
+    sql = (
+        "UPDATE {} SET {} = 'sent', {} = {} + 1, {} = %s, {} = %s, {} = '', {} = %s WHERE {} = %s".format(
+            quote(OutboundMessage._meta.db_table), quote('status'), quote('attempts'), quote('attempts'),
+            quote('sent_at'), quote('provider_message_id'), quote('last_error'), quote('updated_at'), quote('id'),
+        )
+    )
+    # One transaction, or SQLite commits after every row
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, [(now, provider_id, now, pk) for pk, provider_id in sent])
+
+def enqueue_messages(clients, template, channel='sms', campaign=''):
+    """Queue one personalized message per client of a queryset that has a phone number; returns how many were queued.
+
+    The template (text or a compiled MessageTemplate) is compiled once, and each batch of
+    recipients is one values_list query carrying only the fields it uses.
+    """
+    template = compile_template(template)
+    rows = clients.exclude(phone='').order_by('pk').values_list(*template.fields, 'pk', 'phone')
+    queued = 0
+    last = None
+    # All or nothing, so a failed request never leaves half a campaign queued
+    with transaction.atomic():
+        while True:
+            pending = rows if last is None else rows.filter(pk__gt=last)
+            batch = list(pending[:ENQUEUE_BATCH_SIZE])
+            if not batch:
+                return queued
+            last = batch[-1][-2]
+            bodies = template.render_rows(batch)
+            insert_messages([(row[-2], row[-1], body) for row, body in zip(batch, bodies)], channel, campaign)
+            queued += len(batch)
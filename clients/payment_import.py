@@ -0,0 +1,255 @@
+# M-PESA STATEMENT IMPORT
+# Streams a downloaded M-Pesa statement (CSV) row by row and records the payments in batches.
+# Statements uploaded in the admin are queued as StatementImport rows and imported by
+# run_statement_imports, so a month-end statement never runs inside a web request.
+
+import csv
+import io
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.utils import timezone
+from .ledger import record_payments
+from .models import Client, Payment, StatementImport
+from .phones import clients_by_phone
+
+# Accepted header names (lower-cased) for each statement column
+STATEMENT_COLUMNS = {
+    'receipt': ('receipt no.', 'receipt no', 'receipt', 'transaction id', 'trans id', 'mpesareceiptnumber'),
+    'completed_at': ('completion time', 'transaction time', 'trans time', 'date'),
+    'amount': ('paid in', 'amount', 'trans amount'),
+    'account': ('a/c no.', 'a/c no', 'account', 'account no.', 'bill ref number', 'billrefnumber'),
+    'party': ('other party info', 'msisdn', 'phone', 'phone number'),
+    'status': ('transaction status', 'status'),
+}
+
+DATE_FORMATS = (
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d-%m-%Y %H:%M:%S',
+    '%d-%m-%Y %H:%M',
+    '%Y%m%d%H%M%S',
+    '%Y-%m-%d',
+)
+
+class PaymentStatementImporter:
+    """Match statement rows to clients and record them with one bulk insert per batch"""
+
+    def __init__(self, batch_size=1000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.account_index = {}
+        self.stats = {
+            'rows': 0,
+            'imported': 0,
+            'duplicates': 0,
+            'unmatched': 0,
+            'skipped': 0,
+            'failed': 0,
+            'amount': Decimal('0'),
+        }
+        self.unmatched_receipts = []
+        self.failed_receipts = []
+
+    def build_client_index(self):
+        """Load account lookups for every client once; phones are matched per batch via phone_e164"""
+        clients = Client.objects.order_by().values_list('pk', 'username')
+        for client_id, username in clients.iterator(chunk_size=5000):
+            if username:
+                self.account_index[username.strip().lower()] = client_id
+
+    def import_file(self, fileobj, progress=None):
+        """Import an open text-mode CSV statement and return the run statistics.
+
+        progress, if given, is called with the statistics after every batch.
+        """
+        started = time.monotonic()
+        self.build_client_index()
+
+        reader = csv.reader(fileobj)
+        columns = self.find_columns(reader)
+        batch = []
+
+        for row in reader:
+            parsed = self.parse_row(row, columns)
+            if parsed is None:
+                continue
+            batch.append(parsed)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+                if progress:
+                    progress(self.stats)
+
+        if batch:
+            self.flush(batch)
+
+        self.stats['seconds'] = time.monotonic() - started
+        return self.stats
+
+    def find_columns(self, reader):
+        """Skip statement preamble lines until the header row and map column positions"""
+        for header in reader:
+            names = [name.strip().lower() for name in header]
+            columns = {}
+            for key, aliases in STATEMENT_COLUMNS.items():
+                for alias in aliases:
+                    if alias in names:
+                        columns[key] = names.index(alias)
+                        break
+            if 'receipt' in columns and 'amount' in columns:
+                return columns
+        raise ValueError('Could not find a receipt and amount column in the statement')
+
+    def parse_row(self, row, columns):
+        """Turn a CSV row into a payment dict, or None if the row is not an incoming payment"""
+        def cell(key):
+            index = columns.get(key)
+            if index is None or index >= len(row):
+                return ''
+            return row[index].strip()
+
+        if not any(row):
+            return None
+        self.stats['rows'] += 1
+
+        receipt = cell('receipt')
+        status = cell('status').lower()
+        try:
+            amount = Decimal(cell('amount').replace(',', '') or '0')
+        except InvalidOperation:
+            amount = Decimal('0')
+
+        if not receipt or amount <= 0 or (status and status != 'completed'):
+            self.stats['skipped'] += 1
+            return None
+
+        # Booking it to today would put it in the wrong day's revenue and ledger
+        completed_at = self.parse_date(cell('completed_at'))
+        if completed_at is None:
+            self.stats['failed'] += 1
+            if len(self.failed_receipts) < 100:
+                self.failed_receipts.append(receipt)
+            return None
+
+        return {
+            'receipt': receipt,
+            'amount': amount,
+            'completed_at': completed_at,
+            'account': cell('account'),
+            'party': cell('party'),
+        }
+
+    def parse_date(self, value):
+        for date_format in DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+            return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+        return None
+
+    def phone_candidates(self, row):
+        """The account reference and the paying number, either of which may be a phone"""
+        return (row['account'], row['party'].split('-')[0])
+
+    def match_client(self, row, phone_index):
+        """Match by account reference (username or phone), then by the paying number"""
+        account = row['account'].lower()
+        if account in self.account_index:
+            return self.account_index[account]
+
+        for value in self.phone_candidates(row):
+            if value in phone_index:
+                return phone_index[value]
+        return None
+
+    def flush(self, batch):
+        """Drop duplicates, then insert one batch of payments"""
+        receipts = {row['receipt'] for row in batch}
+        seen = set(
+            Payment.objects.filter(transaction_id__in=receipts).values_list('transaction_id', flat=True)
+        )
+
+        # One indexed phone_e164 lookup for the whole batch
+        phone_index = clients_by_phone(
+            value for row in batch if row['account'].lower() not in self.account_index
+            for value in self.phone_candidates(row)
+        )
+
+        payments = []
+        for row in batch:
+            if row['receipt'] in seen:
+                self.stats['duplicates'] += 1
+                continue
+            seen.add(row['receipt'])
+
+            client_id = self.match_client(row, phone_index)
+            if client_id is None:
+                self.stats['unmatched'] += 1
+                if len(self.unmatched_receipts) < 100:
+                    self.unmatched_receipts.append(row['receipt'])
+                continue
+
+            payments.append(Payment(
+                client_id=client_id,
+                amount=row['amount'],
+                payment_method='mpesa',
+                transaction_id=row['receipt'],
+                payment_date=row['completed_at'],
+                notes='Imported from M-Pesa statement',
+            ))
+
+        if payments and not self.dry_run:
+            record_payments(payments, batch_size=self.batch_size)
+
+        self.stats['imported'] += len(payments)
+        self.stats['amount'] += sum((payment.amount for payment in payments), Decimal('0'))
+
+def progress_fields(stats):
+    """Importer statistics as JSON for StatementImport.progress"""
+    return {key: str(value) if isinstance(value, Decimal) else value for key, value in stats.items()}
+
+def run_statement_import(statement_import, batch_size=1000):
+    """Import a queued statement, saving progress after every batch; returns the statistics.
+
+    A statement that is not UTF-8 or lacks the expected columns fails for good, and its file is
+    deleted as after a successful import. Running an interrupted import again is safe: receipts it already recorded are skipped as duplicates.
+    """
+    importer = PaymentStatementImporter(batch_size=batch_size, dry_run=statement_import.dry_run)
+    queryset = StatementImport.objects.filter(pk=statement_import.pk)
+
+    def save_progress(stats):
+        queryset.update(progress=progress_fields(stats), updated_at=timezone.now())
+
+    try:
+        # Read through csv.reader a line at a time, so memory does not grow with the file
+        with statement_import.statement.open('rb') as upload:
+            stats = importer.import_file(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''), progress=save_progress)
+    except UnicodeDecodeError:
+        error = 'The statement is not a UTF-8 CSV file'
+    except ValueError as e:
+        error = str(e)
+    else:
+        error = None
+
+    # Any other error propagates and leaves the file for the retry
+    statement_import.statement.delete(save=False)
+    if error:
+        queryset.update(status='failed', statement='', last_error=error, updated_at=timezone.now())
+        return None
+
+    now = timezone.now()
+    queryset.update(
+        status='done',
+        progress=progress_fields(stats),
+        unmatched_receipts=importer.unmatched_receipts,
+        failed_receipts=importer.failed_receipts,
+        statement='',
+        last_error='',
+        completed_at=now,
+        updated_at=now,
+    )
+    return stats
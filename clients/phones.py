@@ -0,0 +1,103 @@
+# PHONE NUMBERS
+# Client.phone is free text ("0712 345678", "+254712345678", "Not set"). Client.phone_e164
+# keeps it normalized to +254XXXXXXXXX ('' when it is not a Kenyan number) and indexed, so an
+# M-Pesa MSISDN is matched to a client with an index lookup instead of a scan. Client.save
+# keeps the column in sync; backfill_phone_e164 fills existing rows with the NumPy formatter.
+
+import re
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+BACKFILL_BATCH_SIZE = 10000
+
+# Widest phone value the vectorized formatter reads (Client.phone is max_length=20)
+PHONE_WIDTH = 20
+
+ZERO, ONE, TWO, FOUR, FIVE, SEVEN, NINE = (ord(digit) for digit in '0124579')
+
+def to_e164(value):
+    """Return a Kenyan number as +2547XXXXXXXX / +2541XXXXXXXX, or ''"""
+    digits = re.sub(r'[^0-9]', '', value or '')
+    if len(digits) == 10 and digits.startswith('0'):
+        digits = '254' + digits[1:]
+    elif len(digits) == 9 and digits[0] in '71':
+        digits = '254' + digits
+    if len(digits) == 12 and digits.startswith('254'):
+        return '+' + digits
+    return ''
+
+def to_e164_array(values):
+    """to_e164 for a whole sequence at once; returns a NumPy array of str"""
+    if not len(values):
+        return np.array([], dtype='U13')
+    # One code point per cell: (rows, PHONE_WIDTH) with 0 padding
+    codes = np.array(values, dtype=f'U{PHONE_WIDTH}').view(np.uint32).reshape(len(values), PHONE_WIDTH)
+    is_digit = (codes >= ZERO) & (codes <= NINE)
+    count = is_digit.sum(axis=1)
+    # Move each row's digits to the front, keeping their order
+    digits = np.take_along_axis(codes, np.argsort(~is_digit, axis=1, kind='stable'), axis=1)[:, :12]
+
+    national = (count == 10) & (digits[:, 0] == ZERO)
+    short = (count == 9) & ((digits[:, 0] == SEVEN) | (digits[:, 0] == ONE))
+    full = (count == 12) & (digits[:, 0] == TWO) & (digits[:, 1] == FIVE) & (digits[:, 2] == FOUR)
+
+    result = np.zeros((len(values), 13), dtype=np.uint32)
+    result[:, :4] = [ord('+'), TWO, FIVE, FOUR]
+    result[national, 4:] = digits[national, 1:10]
+    result[short, 4:] = digits[short, :9]
+    result[full, 1:] = digits[full, :12]
+    # Rows matching no pattern become '' (all NUL code points)
+    result[~(national | short | full)] = 0
+    return result.view('U13').ravel()
+
+def backfill_phone_e164(client_model, batch_size=BACKFILL_BATCH_SIZE, progress=None):
+    """Normalize every client's phone in primary-key batches; returns how many rows changed.
+
+    Takes the model so migrations can pass their historical Client.
+    """
+    table = connection.ops.quote_name(client_model._meta.db_table)
+    quote = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = %s, {} = %s WHERE {} = %s'.format(
+        table, quote('phone_e164'), quote('updated_at'), quote('id')
+    )
+    rows = client_model._base_manager.order_by('pk').values_list('pk', 'phone', 'phone_e164')
+    changed = 0
+    last = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return changed
+        last = batch[-1][0]
+
+        ids, phones, current = zip(*batch)
+        normalized = to_e164_array(phones).tolist()
+        # Only rows whose value changes, so running it again is cheap and leaves updated_at alone
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        updates = [(value, now, pk) for pk, value, old in zip(ids, normalized, current) if value != old]
+        if updates:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, updates)
+        changed += len(updates)
+        if progress:
+            progress(last, changed)
+
+def clients_by_phone(numbers):
+    """Map each number that belongs to a client to that client's id, with one indexed query.
+
+    Numbers may be in any format to_e164 understands; when several clients share a number the
+    oldest one wins.
+    """
+    from .models import Client
+
+    wanted = {}
+    for number in numbers:
+        e164 = to_e164(number)
+        if e164:
+            wanted.setdefault(e164, []).append(number)
+    matches = {}
+    clients = Client.objects.filter(phone_e164__in=list(wanted)).order_by('pk').values_list('phone_e164', 'pk')
+    for e164, client_id in clients:
+        for number in wanted.pop(e164, ()):
+            matches[number] = client_id
+    return matches
@@ -0,0 +1,31 @@
+# RATE LIMITING
+# A token bucket shared by the threads of a sender pool, so a provider's requests-per-second
+# limit holds however many requests are in flight at once.
+
+import threading
+import time
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available and take them (no-op without a rate)"""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
@@ -4,13 +4,21 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse
 from django.db.models import Sum, Count, Q
+from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Client, ServicePlan, Invoice, Payment, NetworkUsage
+from .models import Client, ServicePlan, Invoice, Payment, NetworkUsage, RevenueDaily
+from .dashboard_cache import get_snapshot
 from .mikrotik_integration import mikrotik_manager
+from .router_sessions import get_session_snapshot
+from .router_state import latest_sample
 
 def get_real_dashboard_data():
-    """Get real data for dashboard"""
-    today = datetime.now().date()
+    """Get real data for dashboard (cached; see dashboard_cache)"""
+    return get_snapshot('real_views', build_dashboard_data)
+
+def build_dashboard_data():
+    """Compute the dashboard figures from the database and router"""
+    today = timezone.localdate()
     month_start = today.replace(day=1)
     
     # Real client statistics
@@ -19,10 +27,10 @@ def get_real_dashboard_data():
     hotspot_clients = Client.objects.filter(is_active=True, client_type='hotspot').count()
     
     # Real revenue data
-    monthly_revenue = Payment.objects.filter(
-        payment_date__year=today.year,
-        payment_date__month=today.month
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    monthly_revenue = RevenueDaily.objects.filter(
+        date__gte=month_start,
+        date__lte=today
+    ).aggregate(total=Sum('total'))['total'] or 0
     
     # Pending payments
     pending_invoices = Invoice.objects.filter(
@@ -30,9 +38,9 @@ def get_real_dashboard_data():
         due_date__lte=today
     ).count()
     
-    # Active connections from MikroTik
-    active_connections = mikrotik_manager.get_active_connections()
-    active_sessions = len(active_connections.get('pppoe', [])) + len(active_connections.get('hotspot', []))
+    # Active connections from the latest poll_mikrotik sample
+    sample = latest_sample()
+    active_sessions = sample.total_sessions if sample else 0
     
     return {
         'total_clients': total_clients,
@@ -51,9 +59,9 @@ def main_dashboard(request):
     recent_payments = Payment.objects.select_related('client').order_by('-payment_date')[:5]
     recent_clients = Client.objects.filter(is_active=True).order_by('-created_at')[:5]
     
-    # Network status from MikroTik
-    system_resources = mikrotik_manager.get_system_resources()
-    uptime = system_resources.get('uptime', 'N/A') if system_resources else 'N/A'
+    # Network status from the latest router sample
+    sample = latest_sample()
+    uptime = sample.uptime if sample and sample.uptime else 'N/A'
     
     context = {
         # Real data
@@ -86,9 +94,8 @@ def client_management(request):
         'suspended': clients.filter(status='suspended').count(),
     }
     
-    # Check connection status for each client
-    for client in clients:
-        client.currently_connected = client.get_connection_status()
+    # Connection status for every client from one router snapshot
+    clients = clients.with_connection_status(get_session_snapshot(request))
     
     context = {
         'clients': clients,
@@ -139,27 +146,24 @@ def billing_dashboard(request):
     return render(request, 'billing/dashboard.html', context)
 
 def network_live_dashboard(request):
-    """Real-time network dashboard with MikroTik data"""
-    # Get real network data from MikroTik
-    active_connections = mikrotik_manager.get_active_connections()
-    system_resources = mikrotik_manager.get_system_resources()
-    interface_stats = mikrotik_manager.get_interface_stats()
-    
-    # Calculate real usage
-    total_download = sum(int(iface.get('rx-byte', 0)) for iface in interface_stats)
-    total_upload = sum(int(iface.get('tx-byte', 0)) for iface in interface_stats)
+    """Real-time network dashboard from the latest poll_mikrotik sample"""
+    sample = latest_sample()
+    interfaces = list(sample.interfaces.all()) if sample else []
     
     context = {
-        'active_pppoe': len(active_connections.get('pppoe', [])),
-        'active_hotspot': len(active_connections.get('hotspot', [])),
-        'total_sessions': len(active_connections.get('pppoe', [])) + len(active_connections.get('hotspot', [])),
-        'cpu_load': system_resources.get('cpu-load', 'N/A'),
-        'memory_usage': system_resources.get('free-memory', 'N/A'),
-        'total_memory': system_resources.get('total-memory', 'N/A'),
-        'uptime': system_resources.get('uptime', 'N/A'),
-        'total_download': total_download,
-        'total_upload': total_upload,
-        'interface_stats': interface_stats[:5],  # Show first 5 interfaces
+        'active_pppoe': sample.pppoe_sessions if sample else 0,
+        'active_hotspot': sample.hotspot_sessions if sample else 0,
+        'total_sessions': sample.total_sessions if sample else 0,
+        'cpu_load': sample.cpu_load if sample and sample.cpu_load is not None else 'N/A',
+        'memory_usage': (sample.free_memory if sample else None) or 'N/A',
+        'total_memory': (sample.total_memory if sample else None) or 'N/A',
+        'uptime': (sample.uptime if sample else '') or 'N/A',
+        'total_download': sum(iface.rx_bytes for iface in interfaces),
+        'total_upload': sum(iface.tx_bytes for iface in interfaces),
+        'interface_stats': [
+            {'name': iface.name, 'rx-byte': iface.rx_bytes, 'tx-byte': iface.tx_bytes, 'status': iface.status}
+            for iface in interfaces[:5]  # Show first 5 interfaces
+        ],
     }
     
     return render(request, 'network/live_dashboard.html', context)
@@ -187,7 +191,8 @@ def sync_mikrotik_users(request):
                         phone='Not set',
                         address='Not set',
                         monthly_fee=2000,  # Default fee
-                        password='synced_from_mikrotik'
+                        password='synced_from_mikrotik',
+                        provisioning_status='provisioned'  # Already exists on the router
                     )
                     synced_count += 1
             
@@ -203,7 +208,8 @@ def sync_mikrotik_users(request):
                         phone='Not set',
                         address='Not set',
                         monthly_fee=1000,  # Default fee for hotspot
-                        password='synced_from_mikrotik'
+                        password='synced_from_mikrotik',
+                        provisioning_status='provisioned'  # Already exists on the router
                     )
                     synced_count += 1
             
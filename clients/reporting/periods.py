@@ -0,0 +1,84 @@
+# CALENDAR PERIOD SERIES
+# Builds daily / weekly / monthly / quarterly report series from one grouped query per
+# series. Buckets are real calendar periods in the current time zone, filtered with
+# half-open ranges (start <= value < end) so the date indexes can be used.
+
+from datetime import date, datetime, timedelta
+from django.db import models
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+PERIODS = ('day', 'week', 'month', 'quarter')
+
+def period_start(day, period):
+    """First day of the period containing day"""
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    if period == 'quarter':
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    raise ValueError(f'Unknown period: {period}')
+
+def shift_period(start, period, count):
+    """Start of the period count periods after (or before, if negative) start"""
+    if period == 'day':
+        return start + timedelta(days=count)
+    if period == 'week':
+        return start + timedelta(weeks=count)
+    months = count * (3 if period == 'quarter' else 1)
+    if period not in ('month', 'quarter'):
+        raise ValueError(f'Unknown period: {period}')
+    month_index = start.year * 12 + start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def period_starts(period, periods, end=None):
+    """Start dates of the last `periods` periods, oldest first, ending with the one containing end"""
+    last = period_start(end or timezone.localdate(), period)
+    return [shift_period(last, period, offset) for offset in range(1 - periods, 1)]
+
+def period_label(start, period):
+    if period == 'month':
+        return start.strftime('%b %Y')
+    if period == 'quarter':
+        return f'Q{(start.month - 1) // 3 + 1} {start.year}'
+    return start.isoformat()
+
+def as_bound(value, field):
+    """Date bound in the form the field compares against (local midnight for datetimes)"""
+    if isinstance(field, models.DateTimeField):
+        return timezone.make_aware(datetime.combine(value, datetime.min.time()))
+    return value
+
+def time_series(queryset, date_field, period, periods, end=None, **aggregates):
+    """Aggregate queryset per calendar period over the last `periods` periods in one query.
+
+    Returns one dict per period, oldest first, with 'start', 'end' (exclusive), 'label'
+    and one key per aggregate. Periods without rows are filled with 0.
+    """
+    starts = period_starts(period, periods, end)
+    range_end = shift_period(starts[-1], period, 1)
+    field = queryset.model._meta.get_field(date_field)
+
+    rows = queryset.filter(**{
+        f'{date_field}__gte': as_bound(starts[0], field),
+        f'{date_field}__lt': as_bound(range_end, field),
+    }).annotate(
+        bucket=Trunc(date_field, period, output_field=models.DateField())
+    ).order_by().values('bucket').annotate(**aggregates)
+    found = {row['bucket']: row for row in rows}
+
+    series = []
+    for index, start in enumerate(starts):
+        row = found.get(start, {})
+        bucket = {
+            'start': start,
+            'end': starts[index + 1] if index + 1 < len(starts) else range_end,
+            'label': period_label(start, period),
+        }
+        for name in aggregates:
+            bucket[name] = row.get(name) or 0
+        series.append(bucket)
+    return series
@@ -0,0 +1,202 @@
+# USAGE ANALYTICS
+# A window of NetworkUsage is summed per client in one query and loaded as NumPy column
+# arrays (client, plan, download, upload); heavy users, percentiles and the plan breakdown
+# are then computed on the arrays. Summaries are cached per window through dashboard_cache,
+# so the network APIs read a ready-made result.
+
+from datetime import timedelta
+import numpy as np
+from django.db import connection
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from ..dashboard_cache import USAGE, get_snapshot
+from ..models import Client, NetworkUsage, ServicePlan, UsageRollup
+from ..usage_retention import as_datetime
+
+# Usage is ingested every few minutes; a summary this old is still current enough
+ANALYTICS_TTL = 300
+MAX_WINDOW_DAYS = 366
+PERCENTILES = (50, 75, 90, 95, 99)
+GB = 1024 ** 3
+
+def window_bounds(days, end=None):
+    """Inclusive (start, end) dates of a window of `days` days ending on `end` (default today)"""
+    end = end or timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+def parse_window(value, default=30):
+    """Window length from a query parameter, clamped to 1..MAX_WINDOW_DAYS"""
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        days = default
+    return min(max(days, 1), MAX_WINDOW_DAYS)
+
+def fetch_array(queryset, columns):
+    """Run a values_list queryset and return its rows as an int64 array of shape (n, columns)"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return np.array(rows, dtype=np.int64).reshape(-1, columns)
+
+class UsageFrame:
+    """Per-client usage totals of a date range as column arrays (plan -1 means no plan)"""
+
+    def __init__(self, client_ids, plan_ids, download, upload, records):
+        self.client_ids = client_ids
+        self.plan_ids = plan_ids
+        self.download = download
+        self.upload = upload
+        self.records = records
+
+    @classmethod
+    def load(cls, start, end):
+        queryset = NetworkUsage.objects.filter(usage_date__gte=start, usage_date__lte=end).order_by().values(
+            'client_id'
+        ).annotate(
+            plan=Coalesce('client__service_plan_id', Value(-1)),
+            download=Sum('download_bytes'),
+            upload=Sum('upload_bytes'),
+            records=Count('id'),
+        ).values_list('client_id', 'plan', 'download', 'upload', 'records')
+        data = fetch_array(queryset, 5)
+        return cls(*data.T)
+
+    @property
+    def totals(self):
+        return self.download + self.upload
+
+    def __len__(self):
+        return len(self.client_ids)
+
+def gb(value):
+    return round(float(value) / GB, 2)
+
+def top_users(frame, limit):
+    """The `limit` clients with the highest totals, heaviest first"""
+    if not len(frame):
+        return []
+    totals = frame.totals
+    limit = min(limit, len(frame))
+    top = np.argpartition(totals, -limit)[-limit:]
+    top = top[np.argsort(totals[top])[::-1]]
+    names = dict(Client.objects.filter(pk__in=frame.client_ids[top].tolist()).values_list('pk', 'name'))
+    return [
+        {
+            'client_id': int(frame.client_ids[i]),
+            'name': names.get(int(frame.client_ids[i]), ''),
+            'download_gb': gb(frame.download[i]),
+            'upload_gb': gb(frame.upload[i]),
+            'total_gb': gb(totals[i]),
+        }
+        for i in top
+    ]
+
+def plan_breakdown(frame):
+    """Usage summed per service plan, largest first"""
+    plans, inverse = np.unique(frame.plan_ids, return_inverse=True)
+    plan_download = np.bincount(inverse, weights=frame.download, minlength=len(plans))
+    plan_upload = np.bincount(inverse, weights=frame.upload, minlength=len(plans))
+    plan_clients = np.bincount(inverse, minlength=len(plans))
+    plan_total = plan_download + plan_upload
+    names = dict(ServicePlan.objects.filter(pk__in=plans.tolist()).values_list('pk', 'name'))
+    grand_total = plan_total.sum() or 1
+    return [
+        {
+            'plan_id': int(plans[i]) if plans[i] >= 0 else None,
+            'plan': names.get(int(plans[i]), 'No plan'),
+            'clients': int(plan_clients[i]),
+            'download_gb': gb(plan_download[i]),
+            'upload_gb': gb(plan_upload[i]),
+            'average_gb': gb(plan_total[i] / plan_clients[i]),
+            'share': round(float(100 * plan_total[i] / grand_total), 1),
+        }
+        for i in np.argsort(plan_total)[::-1]
+    ]
+
+def build_usage_summary(days, end=None, top=20):
+    """Totals, heavy users, percentiles and plan breakdown for a window of `days` days"""
+    start, end = window_bounds(days, end)
+    frame = UsageFrame.load(start, end)
+    totals = frame.totals
+
+    percentiles = {}
+    if len(frame):
+        percentiles = {f'p{p}': gb(value) for p, value in zip(PERCENTILES, np.percentile(totals, PERCENTILES))}
+
+    return {
+        'window': {'start': start.isoformat(), 'end': end.isoformat(), 'days': days},
+        'totals': {
+            'download_gb': gb(frame.download.sum()),
+            'upload_gb': gb(frame.upload.sum()),
+            'clients': len(frame),
+            'records': int(frame.records.sum()),
+            'average_gb': gb(totals.mean()) if len(frame) else 0,
+            'median_gb': percentiles.get('p50', 0),
+        },
+        'percentiles': percentiles,
+        'top_users': top_users(frame, top),
+        'plans': plan_breakdown(frame),
+    }
+
+def build_peak_profile(days, end=None):
+    """Average traffic per hour of day over the window, from the hourly rollups"""
+    start, end = window_bounds(days, end)
+    hourly = UsageRollup.objects.filter(
+        resolution='hour',
+        period_start__gte=as_datetime(start),
+        period_start__lt=as_datetime(end + timedelta(days=1)),
+    ).order_by().values('period_start').annotate(
+        download=Sum('download_bytes'), upload=Sum('upload_bytes')
+    )
+    rows = list(hourly.values_list('period_start', 'download', 'upload'))
+
+    hours = np.array([timezone.localtime(row[0]).hour for row in rows], dtype=np.int64)
+    download = np.array([row[1] for row in rows], dtype=np.float64)
+    upload = np.array([row[2] for row in rows], dtype=np.float64)
+    # Average over the days that have data for that hour, not over the whole window
+    samples = np.bincount(hours, minlength=24)
+    divisor = np.maximum(samples, 1)
+    hour_download = np.bincount(hours, weights=download, minlength=24) / divisor
+    hour_upload = np.bincount(hours, weights=upload, minlength=24) / divisor
+    hour_total = hour_download + hour_upload
+
+    return {
+        'window': {'start': start.isoformat(), 'end': end.isoformat(), 'days': days},
+        'peak_hour': f'{int(hour_total.argmax()):02d}:00' if samples.any() else None,
+        'peak_hours': [
+            {
+                'hour': f'{hour:02d}:00',
+                'usage': gb(hour_total[hour]),
+                'download_gb': gb(hour_download[hour]),
+                'upload_gb': gb(hour_upload[hour]),
+            }
+            for hour in range(24)
+        ],
+    }
+
+def usage_gb(summary):
+    """Download plus upload of a summary, in GB"""
+    return round(summary['totals']['download_gb'] + summary['totals']['upload_gb'], 2)
+
+def usage_summary(days=30, top=20):
+    """Cached build_usage_summary for the window ending today"""
+    today = timezone.localdate()
+    return get_snapshot(
+        f'usage:summary:{days}:{top}:{today.isoformat()}',
+        lambda: build_usage_summary(days, today, top),
+        ttl=ANALYTICS_TTL,
+        family=USAGE,
+    )
+
+def peak_profile(days=7):
+    """Cached build_peak_profile for the window ending today"""
+    today = timezone.localdate()
+    return get_snapshot(
+        f'usage:peaks:{days}:{today.isoformat()}',
+        lambda: build_peak_profile(days, today),
+        ttl=ANALYTICS_TTL,
+        family=USAGE,
+    )
@@ -0,0 +1,65 @@
+# ROUTER SESSION SNAPSHOT
+# Active PPPoE / hotspot sessions indexed as username sets, so per-client connection
+# checks are set lookups instead of router calls. Views build it from the
+# RouterSessionSnapshot that poll_mikrotik overwrites with every sample. A snapshot older
+# than router_state.STALE_AFTER (the poller failed or stopped) says nothing about who is
+# connected now, so it is reported as unknown.
+
+def session_usernames(sessions):
+    """Usernames in a list of router session dicts (PPPoE uses 'name', hotspot 'user')"""
+    usernames = set()
+    for session in sessions or []:
+        username = session.get('user') or session.get('name')
+        if username:
+            usernames.add(username)
+    return usernames
+
+class SessionSnapshot:
+    """Active router sessions at one point in time, as username sets per service type"""
+
+    def __init__(self, connections=None, known=True):
+        connections = connections or {}
+        self.pppoe = session_usernames(connections.get('pppoe'))
+        self.hotspot = session_usernames(connections.get('hotspot'))
+        # False when there is no current poll to go by
+        self.known = known
+
+    @classmethod
+    def from_stored(cls, stored, known=True):
+        """Snapshot from the stored RouterSessionSnapshot (None gives an unknown snapshot)"""
+        snapshot = cls(known=known and stored is not None)
+        if snapshot.known:
+            snapshot.pppoe = set(stored.sessions.get('pppoe', []))
+            snapshot.hotspot = set(stored.sessions.get('hotspot', []))
+        return snapshot
+
+    def usernames_for(self, client_type):
+        if client_type == 'pppoe':
+            return self.pppoe
+        if client_type == 'hotspot':
+            return self.hotspot
+        return set()
+
+    def is_connected(self, client_type, username):
+        """True or False, or None when the snapshot is unknown"""
+        if not self.known:
+            return None
+        return username in self.usernames_for(client_type)
+
+    @property
+    def total(self):
+        return len(self.pppoe) + len(self.hotspot)
+
+def latest_session_snapshot():
+    """Snapshot from the latest poll_mikrotik sample (no router call); unknown once it is stale"""
+    from .models import RouterSessionSnapshot
+    from .router_state import is_stale
+    stored = RouterSessionSnapshot.objects.first()
+    return SessionSnapshot.from_stored(stored, known=not is_stale(stored))
+
+def get_session_snapshot(request):
+    """The request's session snapshot, read from the latest sample on first use"""
+    snapshot = getattr(request, '_router_sessions', None)
+    if snapshot is None:
+        snapshot = request._router_sessions = latest_session_snapshot()
+    return snapshot
@@ -0,0 +1,135 @@
+# ROUTER STATE SAMPLES
+# poll_mikrotik records session counts, interface counters and system resources as
+# RouterSample rows at a fixed interval, and the active usernames in RouterSessionSnapshot. Views read the latest stored sample, so page loads never wait
+# on the router and router load does not depend on how many dashboards are open.
+
+import re
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .mikrotik_integration import mikrotik_manager
+from .models import InterfaceSample, RouterSample, RouterSessionSnapshot
+from .router_sessions import session_usernames
+
+# A sample older than this means the poller is behind or stopped
+STALE_AFTER = timedelta(minutes=5)
+
+# Primary key of the single RouterSessionSnapshot row
+SESSION_SNAPSHOT_ID = 1
+
+SIZE_UNITS = {'': 1, 'B': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3}
+
+def parse_size(value):
+    """RouterOS sizes ('512000KiB', '2048MiB', '1073741824') in bytes, or None"""
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]iB|B)?\s*$', str(value or ''))
+    if not match:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2) or ''])
+
+def parse_int(value):
+    try:
+        return int(str(value).rstrip('%'))
+    except (TypeError, ValueError):
+        return None
+
+def take_sample(manager=mikrotik_manager):
+    """Read the router once and store the result; a failed read is stored with its error"""
+    now = timezone.now()
+    try:
+        resources = manager.get_system_resources() or {}
+        connections = manager.get_active_connections() or {}
+        interfaces = manager.get_interface_stats() or []
+    except Exception as e:
+        return RouterSample.objects.create(sampled_at=now, error=str(e)[:255])
+
+    pppoe = sorted(session_usernames(connections.get('pppoe')))
+    hotspot = sorted(session_usernames(connections.get('hotspot')))
+
+    previous = latest_sample()
+    previous_counters = {}
+    elapsed = None
+    if previous is not None:
+        elapsed = (now - previous.sampled_at).total_seconds()
+        previous_counters = {iface.name: iface for iface in previous.interfaces.all()}
+
+    with transaction.atomic():
+        sample = RouterSample.objects.create(
+            sampled_at=now,
+            cpu_load=parse_int(resources.get('cpu-load')),
+            free_memory=parse_size(resources.get('free-memory')),
+            total_memory=parse_size(resources.get('total-memory')),
+            uptime=str(resources.get('uptime', ''))[:50],
+            pppoe_sessions=len(pppoe),
+            hotspot_sessions=len(hotspot),
+        )
+        # History keeps only the counts; the usernames are kept for the latest poll alone
+        RouterSessionSnapshot.objects.update_or_create(
+            pk=SESSION_SNAPSHOT_ID, defaults={'sampled_at': now, 'sessions': {'pppoe': pppoe, 'hotspot': hotspot}}
+        )
+
+        rows = []
+        for iface in interfaces:
+            row = InterfaceSample(
+                sample=sample,
+                name=iface.get('name', '')[:100],
+                status=iface.get('status', '')[:20],
+                rx_bytes=parse_int(iface.get('rx-byte')) or 0,
+                tx_bytes=parse_int(iface.get('tx-byte')) or 0,
+            )
+            before = previous_counters.get(row.name)
+            # A counter that went backwards was reset; leave the rate empty for this sample
+            if before is not None and elapsed and row.rx_bytes >= before.rx_bytes and row.tx_bytes >= before.tx_bytes:
+                row.rx_rate = int((row.rx_bytes - before.rx_bytes) / elapsed)
+                row.tx_rate = int((row.tx_bytes - before.tx_bytes) / elapsed)
+            rows.append(row)
+        InterfaceSample.objects.bulk_create(rows)
+    return sample
+
+def latest_sample():
+    """Most recent successful sample with its interfaces, or None"""
+    return RouterSample.objects.filter(error='').prefetch_related('interfaces').first()
+
+def is_stale(sample, max_age=STALE_AFTER):
+    return sample is None or timezone.now() - sample.sampled_at > max_age
+
+def prune_samples(keep_days, batch_size=1000):
+    """Delete samples older than keep_days in batches of batch_size; returns rows deleted"""
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    deleted = 0
+    while True:
+        ids = list(RouterSample.objects.filter(sampled_at__lt=cutoff).order_by('sampled_at').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        InterfaceSample.objects.filter(sample_id__in=ids).delete()
+        deleted += RouterSample.objects.filter(pk__in=ids).delete()[0]
+
+def throughput_mbps(sample):
+    """Total (download, upload) rate across interfaces in Mbps"""
+    if sample is None:
+        return 0.0, 0.0
+    interfaces = sample.interfaces.all()
+    rx = sum(iface.rx_rate or 0 for iface in interfaces)
+    tx = sum(iface.tx_rate or 0 for iface in interfaces)
+    return round(rx * 8 / 1_000_000, 1), round(tx * 8 / 1_000_000, 1)
+
+def network_health(sample):
+    """Share of interfaces up, in percent; 0 when the poller has no recent sample"""
+    if is_stale(sample):
+        return 0
+    interfaces = sample.interfaces.all()
+    if not interfaces:
+        return 100
+    return round(100 * sum(1 for iface in interfaces if iface.status == 'up') / len(interfaces))
+
+def network_alerts(sample, cpu_threshold=80):
+    alerts = []
+    if sample is None:
+        return [{'level': 'warning', 'message': 'No router samples yet - is poll_mikrotik running?'}]
+    if is_stale(sample):
+        alerts.append({'level': 'warning', 'message': f'Router data is from {sample.sampled_at:%Y-%m-%d %H:%M}'})
+    if sample.cpu_load is not None and sample.cpu_load >= cpu_threshold:
+        alerts.append({'level': 'critical', 'message': f'Router CPU at {sample.cpu_load}%'})
+    for iface in sample.interfaces.all():
+        if iface.status and iface.status != 'up':
+            alerts.append({'level': 'warning', 'message': f'Interface {iface.name} is {iface.status}'})
+    return alerts
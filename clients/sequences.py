@@ -0,0 +1,136 @@
+# INVOICE NUMBER SEQUENCES
+# Hands out invoice numbers in blocks from the InvoiceSequence counter table.
+
+import threading
+import time
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F
+from django.db.models.functions import Length
+
+DEFAULT_BLOCK_SIZE = 100
+MAX_RETRIES = 10
+
+def _current_max_number(prefix):
+    """Highest number already used by invoices with this prefix (seeds new counters)"""
+    from .models import Invoice
+
+    # Order by length first so 10000 sorts after 9999
+    last_number = Invoice.objects.filter(
+        invoice_number__startswith=f"{prefix}-"
+    ).order_by(Length('invoice_number').desc(), '-invoice_number').values_list(
+        'invoice_number', flat=True
+    ).first()
+
+    if not last_number:
+        return 0
+    try:
+        return int(last_number.rsplit('-', 1)[-1])
+    except ValueError:
+        return 0
+
+def reserve_block(prefix, size):
+    """Atomically reserve `size` numbers for prefix and return (first, last).
+
+    The counter row is bumped with a single UPDATE ... SET last_value = last_value + size,
+    so concurrent callers serialize on the row lock (PostgreSQL) or write lock (SQLite)
+    and never receive overlapping ranges.
+    """
+    from .models import InvoiceSequence
+
+    if size < 1:
+        raise ValueError('Block size must be at least 1')
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            with transaction.atomic():
+                updated = InvoiceSequence.objects.filter(prefix=prefix).update(
+                    last_value=F('last_value') + size
+                )
+                if updated:
+                    last = InvoiceSequence.objects.filter(prefix=prefix).values_list(
+                        'last_value', flat=True
+                    ).get()
+                else:
+                    last = _current_max_number(prefix) + size
+                    InvoiceSequence.objects.create(prefix=prefix, last_value=last)
+            return last - size + 1, last
+        except IntegrityError:
+            # Another worker created the counter row first - retry the UPDATE
+            continue
+        except OperationalError:
+            # SQLite reports lock contention as "database is locked"
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(0.01 * (2 ** attempt))
+
+    raise RuntimeError(f'Could not reserve invoice numbers for {prefix}')
+
+class InvoiceNumberAllocator:
+    """Per-process cache of reserved invoice numbers.
+
+    Each worker reserves `block_size` numbers at a time and serves them from memory,
+    so the counter row is touched once per block instead of once per invoice.
+    Numbers left in a block when the process exits are skipped (gaps are expected).
+
+    A block reserved inside a transaction may still roll back, so until the transaction
+    commits it is only served to that transaction (per thread), then handed to the process.
+    """
+
+    def __init__(self, block_size=DEFAULT_BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._local = threading.local()
+
+    def next_number(self, prefix):
+        with self._lock:
+            block = self._blocks.get(prefix)
+            if block and block[0] <= block[1]:
+                number = block[0]
+                block[0] += 1
+                return number
+
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            first, last = reserve_block(prefix, self.block_size)
+            self._store_block(prefix, first + 1, last)
+            return first
+
+        pending = getattr(self._local, 'blocks', {}).get(prefix)
+        if pending and pending[0] <= pending[1] and self._still_pending(connection, pending[2]):
+            number = pending[0]
+            pending[0] += 1
+            return number
+
+        first, last = reserve_block(prefix, self.block_size)
+        block = [first + 1, last, None]
+
+        def publish():
+            if self._local.blocks.get(prefix) is block:
+                del self._local.blocks[prefix]
+            self._store_block(prefix, block[0], block[1])
+
+        block[2] = publish
+        # Drop blocks for previous days
+        self._local.blocks = {prefix: block}
+        transaction.on_commit(publish)
+        return first
+
+    @staticmethod
+    def _still_pending(connection, publish):
+        """Whether the block's on_commit callback is still queued: a rolled back savepoint or
+        transaction drops it, and the reservation with it"""
+        return any(callback is publish for _, callback, _ in connection.run_on_commit)
+
+    def _store_block(self, prefix, first, last):
+        if first > last:
+            return
+        with self._lock:
+            block = self._blocks.get(prefix)
+            if block and block[0] <= block[1]:
+                return
+            # Drop blocks for previous days
+            self._blocks = {prefix: [first, last]}
+
+# Global allocator used by Invoice.save()
+invoice_number_allocator = InvoiceNumberAllocator()
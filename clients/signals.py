@@ -0,0 +1,69 @@
+# MODEL SIGNAL HANDLERS
+# Connected in ClientsConfig.ready().
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .dashboard_cache import invalidate_dashboard
+from .ledger import post_entry
+from .models import Client, DeletedRecord, Invoice, LedgerEntry, Payment, ProvisioningTask, SystemSettings
+from .revenue import apply_revenue_changes
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_revenue(sender, instance, **kwargs):
+    """Take a deleted payment back out of the daily revenue rollup"""
+    apply_revenue_changes([(instance, -1)])
+
+@receiver(post_delete, sender=Payment)
+def reverse_payment_credit(sender, instance, origin=None, **kwargs):
+    """Take a deleted payment's credit back off the client's balance with an adjustment entry"""
+    # A client being deleted takes its ledger with it
+    if isinstance(origin, Client) or getattr(origin, 'model', None) is Client:
+        return
+    post_entry(LedgerEntry(
+        client_id=instance.client_id,
+        entry_type='adjustment',
+        amount=instance.amount,
+        description=f"Payment {instance.transaction_id or instance.pk} deleted"
+    ))
+
+@receiver(pre_delete, sender=Invoice)
+def note_invoice_charge(sender, instance, origin=None, **kwargs):
+    """Remember what the invoice charged; its ledger entries lose the link before post_delete"""
+    if isinstance(origin, Client) or getattr(origin, 'model', None) is Client:
+        return
+    instance._ledger_charge = instance.ledger_charge()
+
+@receiver(post_delete, sender=Invoice)
+def reverse_invoice_charge(sender, instance, origin=None, **kwargs):
+    """Take a deleted invoice's charge back off the client's balance with an adjustment entry"""
+    # A client being deleted takes its ledger with it
+    if isinstance(origin, Client) or getattr(origin, 'model', None) is Client:
+        return
+    charged = getattr(instance, '_ledger_charge', 0)
+    if charged:
+        post_entry(LedgerEntry(
+            client_id=instance.client_id,
+            entry_type='adjustment',
+            amount=-charged,
+            description=f"Invoice {instance.invoice_number} deleted"
+        ))
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def expire_dashboard_snapshot(sender, **kwargs):
+    """Mark cached dashboard figures stale once the change is committed"""
+    transaction.on_commit(invalidate_dashboard)
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=ProvisioningTask)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=SystemSettings)
+def record_deletion(sender, instance, **kwargs):
+    """Leave a tombstone for incremental backups (rows deleted only by cascade or retention need none)"""
+    DeletedRecord.objects.create(model=sender._meta.label_lower, object_id=instance.pk)
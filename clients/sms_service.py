@@ -1,9 +1,57 @@
-﻿import requests
+﻿import os
 from django.conf import settings
 
+# Africa's Talking accepts up to this many recipients in one send request
+AT_BATCH_LIMIT = 1000
+# Recipient status codes meaning the message was accepted (Processed, Sent, Queued)
+AT_SUCCESS_CODES = {100, 101, 102}
+
+class MockSMSProvider:
+    """Local stand-in for Africa's Talking: same request limits and response shape, no network"""
+    
+    def __init__(self, batch_limit=AT_BATCH_LIMIT, verbose=True):
+        self.batch_limit = batch_limit
+        self.verbose = verbose
+        self.requests = 0
+        self.sent = 0
+    
+    def send(self, message, recipients, sender_id=None):
+        if len(recipients) > self.batch_limit:
+            raise ValueError(f"Too many recipients in one request ({len(recipients)} > {self.batch_limit})")
+        self.requests += 1
+        self.sent += len(recipients)
+        if self.verbose:
+            print(f"📱 MOCK SMS from {sender_id} to {len(recipients)} recipient(s): {message}")
+        return {
+            "SMSMessageData": {
+                "Message": f"Sent to {len(recipients)}/{len(recipients)} Total Cost: KES 0.00 (Mock)",
+                "Recipients": [
+                    {
+                        "statusCode": 101,
+                        "number": number,
+                        "status": "Success",
+                        "cost": "KES 0.0000",
+                        "messageId": f"MOCK-{self.requests}-{position}",
+                    }
+                    for position, number in enumerate(recipients)
+                ],
+            }
+        }
+
 class KenyaSMSService:
-    def __init__(self):
+    def __init__(self, provider=None):
         self.sender_id = "0706315742"
+        self.batch_limit = AT_BATCH_LIMIT
+        self.provider = provider or self.default_provider()
+    
+    def default_provider(self):
+        """Africa's Talking when credentials are configured, the mock provider otherwise"""
+        username = os.getenv('AFRICASTALKING_USERNAME')
+        api_key = os.getenv('AFRICASTALKING_API_KEY')
+        if not (username and api_key):
+            return MockSMSProvider()
+        from africastalking.SMS import SMSService
+        return SMSService(username, api_key)
     
     def format_phone(self, phone_number):
         """Format Kenyan phone numbers"""
@@ -20,19 +68,53 @@ class KenyaSMSService:
         
         return phone_number
     
-    def send_sms_mock(self, phone_number, message):
-        """Mock SMS service for testing"""
-        formatted_phone = self.format_phone(phone_number)
-        print(f"📱 MOCK SMS from {self.sender_id} to {formatted_phone}: {message}")
-        return {
-            "status": "success",
-            "message": "SMS sent successfully (MOCK MODE)",
-            "recipient": formatted_phone,
-            "cost": "KES 0.00 (Mock)"
-        }
+    def send_batch(self, message, phone_numbers):
+        """Send one text to up to batch_limit numbers in a single request; returns a result per number, in order"""
+        recipients = ["+" + self.format_phone(phone) for phone in phone_numbers]
+        try:
+            response = self.provider.send(message, recipients, self.sender_id)
+            statuses = response["SMSMessageData"]["Recipients"]
+        except Exception as e:
+            return [{"status": "error", "message": str(e)} for _ in recipients]
+        
+        # The provider reports recipients by number, not by position
+        by_number = {}
+        for status in statuses:
+            by_number.setdefault(status.get("number"), []).append(status)
+        results = []
+        for number in recipients:
+            matches = by_number.get(number)
+            status = matches.pop(0) if matches else None
+            if status is None:
+                results.append({"status": "error", "message": "Recipient missing from the provider response"})
+            elif int(status.get("statusCode", 0)) in AT_SUCCESS_CODES:
+                results.append({
+                    "status": "success",
+                    "message": "SMS sent successfully",
+                    "recipient": number,
+                    "message_id": status.get("messageId", ""),
+                    "cost": status.get("cost", ""),
+                })
+            else:
+                results.append({"status": "error", "message": status.get("status") or "Rejected by the SMS provider"})
+        return results
+    
+    def send_sms(self, phone_number, message):
+        return self.send_batch(message, [phone_number])[0]
+
+def group_messages(messages, limit=AT_BATCH_LIMIT):
+    """Split messages (anything with .phone and .body) into (body, messages) groups sharing one text, at most limit each"""
+    by_body = {}
+    for message in messages:
+        by_body.setdefault(message.body, []).append(message)
+    return [
+        (body, group[start:start + limit])
+        for body, group in by_body.items()
+        for start in range(0, len(group), limit)
+    ]
 
 # Global SMS service
 sms_service = KenyaSMSService()
 
 def send_client_sms(phone_number, message):
-    return sms_service.send_sms_mock(phone_number, message)
+    return sms_service.send_sms(phone_number, message)
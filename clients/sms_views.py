@@ -1,52 +1,52 @@
 ﻿from django.shortcuts import render, redirect
 from django.contrib import messages
-from .models import Client
-from .sms_service import send_client_sms
-from django.utils import timezone
+from django.contrib.auth.decorators import login_required
+from django.db.models import Sum
+from .message_templates import MessageTemplate, TemplateError
+from .models import Client, OutboundMessage
+from .outbox import enqueue_messages, new_campaign
 
+@login_required
 def send_bulk_sms(request):
-    """Send SMS to multiple clients"""
+    """Queue an SMS for each selected client; run_sms_dispatcher sends them"""
     if request.method == 'POST':
         client_ids = request.POST.getlist('clients')
         message = request.POST.get('message', '')
+        # Whole audiences are chosen by filter, not by posting thousands of ids
+        send_to_all = request.POST.get('audience') == 'active'
         
-        if not client_ids or not message:
+        if not (client_ids or send_to_all) or not message:
             messages.error(request, "Please select clients and enter a message")
             return redirect('sms_compose')
         
-        success_count = 0
-        for client_id in client_ids:
-            try:
-                client = Client.objects.get(id=client_id)
-                if client.phone:
-                    # Personalize message
-                    personalized_message = message
-                    personalized_message = personalized_message.replace('[Name]', client.first_name)
-                    personalized_message = personalized_message.replace('[Amount]', str(client.monthly_rate))
-                    personalized_message = personalized_message.replace('[Date]', str(client.next_billing_date))
-                    
-                    # Send SMS
-                    result = send_client_sms(client.phone, personalized_message)
-                    if result and result.get('status') == 'success':
-                        success_count += 1
-            except Client.DoesNotExist:
-                continue
+        try:
+            template = MessageTemplate(message)
+        except TemplateError as e:
+            messages.error(request, f"❌ {e}")
+            return redirect('sms_compose')
         
-        messages.success(request, f"✅ Sent {success_count} SMS messages successfully! (Mock Mode)")
+        recipients = Client.objects.filter(status='active') if send_to_all else Client.objects.filter(pk__in=client_ids)
+        campaign = new_campaign()
+        queued = enqueue_messages(recipients, template, campaign=campaign)
+        segments = OutboundMessage.objects.filter(campaign=campaign).aggregate(total=Sum('segments'))['total'] or 0
+        messages.success(request, f"✅ Queued {queued} SMS messages, {segments} segments ({campaign})")
         return redirect('client_list')
     
-    clients = Client.objects.filter(status='Active')
+    clients = Client.objects.filter(status='active').only('pk', 'name', 'phone', 'monthly_fee')
     return render(request, 'sms/compose_sms.html', {'clients': clients})
 
+@login_required
 def send_payment_reminder(request, client_id):
-    """Send payment reminder to single client"""
-    try:
-        client = Client.objects.get(id=client_id)
-        message = f"Hello {client.first_name}, your internet payment of KSH {client.monthly_rate} is due on {client.next_billing_date}. Pay via M-Pesa to 0706315742. Africa Online Networks"
-        
-        result = send_client_sms(client.phone, message)
-        messages.success(request, f"✅ Payment reminder sent to {client.phone} (Mock Mode)")
-    except Client.DoesNotExist:
+    """Queue a payment reminder for a single client"""
+    client = Client.objects.filter(id=client_id).only('phone').first()
+    if client is None:
         messages.error(request, "❌ Client not found")
+        return redirect('client_list')
+    
+    message = "Hello [Name], your internet payment of KSH [Amount] is due on [Date]. Pay via M-Pesa to 0706315742. Africa Online Networks"
+    if enqueue_messages(Client.objects.filter(pk=client_id), message, campaign=new_campaign('reminder')):
+        messages.success(request, f"✅ Payment reminder queued for {client.phone}")
+    else:
+        messages.error(request, "❌ Client has no phone number")
     
     return redirect('client_list')
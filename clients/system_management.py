@@ -5,7 +5,8 @@ from datetime import datetime, timedelta
 from django.utils import timezone
 from django.db import models
 from django.db.models import Sum, Count, Q
-from .models import Client, ServicePlan, Invoice, Payment, NetworkUsage
+from .models import Client, ServicePlan, Invoice, Payment
+from .usage_retention import apply_retention, usage_totals
 
 class SystemManager:
     def __init__(self):
@@ -40,10 +41,11 @@ class SystemManager:
             ).count()
             
             # Network usage
-            total_usage = NetworkUsage.objects.aggregate(
-                total_download=Sum('download_bytes'),
-                total_upload=Sum('upload_bytes')
-            )
+            usage = usage_totals()
+            total_usage = {
+                'total_download': usage['download_bytes'],
+                'total_upload': usage['upload_bytes']
+            }
             
             stats = {
                 # System performance
@@ -123,29 +125,26 @@ class SystemManager:
             print(f"Error getting performance metrics: {e}")
             return {'error': str(e)}
     
-    def cleanup_old_data(self, days=30):
-        """Clean up data older than specified days"""
+    def cleanup_old_data(self):
+        """Roll up and purge old network usage per the retention settings (see usage_retention)"""
         try:
-            cutoff_date = timezone.now() - timedelta(days=days)
-            
-            # Clean up old network usage records
-            deleted_usage, _ = NetworkUsage.objects.filter(
-                timestamp__lt=cutoff_date
-            ).delete()
-            
-            # Clean up old payment records (keep for accounting)
-            # deleted_payments, _ = Payment.objects.filter(
-            #     payment_date__lt=cutoff_date
-            # ).delete()
-            
-            return {
-                'deleted_usage_records': deleted_usage,
-                'cutoff_date': cutoff_date
-            }
+            return apply_retention()
             
         except Exception as e:
             print(f"Error during data cleanup: {e}")
             return {'error': str(e)}
+    
+    def reset_system_data(self, reset_type='all', user=None):
+        """Run (or resume) a batched reset (see system_reset); returns (success, message)"""
+        from .system_reset import RESET_TYPES, reset_summary, run_reset
+        if reset_type not in RESET_TYPES:
+            return False, f'Unknown reset type: {reset_type}'
+        try:
+            log = run_reset(reset_type, user=user)
+        except Exception as e:
+            print(f"Error during system reset: {e}")
+            return False, f'Reset stopped: {e}. Running it again resumes where it stopped.'
+        return True, f'Reset completed: {reset_summary(log)} deleted'
 
 # Global instance
 system_manager = SystemManager()
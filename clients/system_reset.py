@@ -0,0 +1,188 @@
+# SYSTEM RESET
+# Resets delete in primary-key batches with raw DELETEs instead of QuerySet.delete(), whose
+# collector loads every related row into memory and sends signals one row at a time. Cascades
+# are spelled out as steps (children first), SET_NULL references are cleared per batch, and
+# the work the signals did is done per batch or once at the end (revenue rollup, dashboard).
+# Incremental backups refuse to build across a reset, so no deletion tombstones are written.
+# Each batch commits together with its counts on the SystemResetLog row: the counts are exact,
+# and running an interrupted reset again carries on where it stopped.
+
+from datetime import datetime, timedelta
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .dashboard_cache import FAMILIES, invalidate_dashboard
+from .models import (
+    Client, InterfaceSample, Invoice, LedgerEntry, NetworkUsage, Payment, ProvisioningTask,
+    RevenueDaily, RouterSample, RouterSessionSnapshot, SystemResetLog, UsageCounter, UsageRollup, UsageSample,
+)
+from .revenue import apply_revenue_changes
+
+RESET_BATCH_SIZE = 5000
+# Custom resets remove invoices and payments older than this by default
+CUSTOM_RESET_DAYS = 365
+
+DESCRIPTIONS = {
+    'clients': 'Full clients data reset',
+    'financial': 'Financial data reset - invoices, payments and ledger cleared',
+    'all': 'Complete system reset',
+    'custom': 'Custom reset: data older than {cutoff:%Y-%m-%d}',
+    'network_stats': 'Network statistics reset',
+    'test_data': "Test data reset: clients with 'test' in their name",
+}
+RESET_TYPES = list(DESCRIPTIONS)
+
+# SystemResetLog columns that count the headline models
+LOG_COUNTERS = {
+    Client: 'clients_deleted',
+    Invoice: 'invoices_deleted',
+    Payment: 'payments_deleted',
+}
+
+class ResetStep:
+    """Delete a model's rows matching filters; before(ids) runs ahead of each batch"""
+
+    def __init__(self, model, filters=None, before=None):
+        self.model = model
+        self.filters = filters if filters is not None else Q()
+        self.before = before
+
+    @property
+    def label(self):
+        return self.model._meta.label_lower
+
+def subtract_revenue(ids):
+    """What the Payment post_delete signal does, for a whole batch in one upsert"""
+    payments = Payment.objects.filter(pk__in=ids).only('amount', 'payment_date', 'service_plan_id', 'payment_method')
+    apply_revenue_changes([(payment, -1) for payment in payments])
+
+def client_steps(clients=None):
+    """Steps deleting clients (all, or those matching a Q) and every row that cascades from them"""
+    if clients is None:
+        # Revenue goes as a whole with a later RevenueDaily step
+        scope = payments = Q()
+        before = None
+    else:
+        ids = Client.objects.filter(clients).values('pk')
+        scope = Q(client__in=ids)
+        # Payments against those clients' invoices cascade as well
+        payments = scope | Q(invoice__client__in=ids)
+        before = subtract_revenue
+    return [
+        ResetStep(ProvisioningTask, scope),
+        ResetStep(UsageCounter, scope),
+        ResetStep(UsageSample, scope),
+        ResetStep(UsageRollup, scope),
+        ResetStep(NetworkUsage, scope),
+        ResetStep(LedgerEntry, scope),
+        ResetStep(Payment, payments, before=before),
+        ResetStep(Invoice, scope),
+        ResetStep(Client, clients),
+    ]
+
+def reset_steps(reset_type, cutoff=None):
+    if reset_type == 'clients':
+        return client_steps() + [ResetStep(RevenueDaily)]
+    if reset_type == 'all':
+        return client_steps() + [ResetStep(RevenueDaily), ResetStep(InterfaceSample), ResetStep(RouterSample), ResetStep(RouterSessionSnapshot)]
+    if reset_type == 'financial':
+        # Balances are zeroed afterwards, so the ledger goes too
+        return [ResetStep(LedgerEntry), ResetStep(Payment), ResetStep(Invoice), ResetStep(RevenueDaily)]
+    if reset_type == 'custom':
+        return [
+            ResetStep(Payment, Q(payment_date__lt=cutoff) | Q(invoice__created_at__lt=cutoff), before=subtract_revenue),
+            ResetStep(Invoice, Q(created_at__lt=cutoff)),
+        ]
+    if reset_type == 'network_stats':
+        return [ResetStep(UsageSample), ResetStep(UsageRollup), ResetStep(NetworkUsage)]
+    if reset_type == 'test_data':
+        return client_steps(Q(name__icontains='test'))
+    raise ValueError(f'Unknown reset type: {reset_type}')
+
+def delete_in_batches(log, step, batch_size, progress=None):
+    """Delete a step's rows batch by batch, adding each batch to the log in the same transaction"""
+    queryset = step.model._base_manager.filter(step.filters)
+    set_null = [
+        (relation.related_model, relation.field.name)
+        for relation in step.model._meta.related_objects if relation.on_delete is models.SET_NULL
+    ]
+    counter = LOG_COUNTERS.get(step.model)
+    last = None
+    while True:
+        pending = queryset if last is None else queryset.filter(pk__gt=last)
+        ids = list(pending.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return log
+        last = ids[-1]
+
+        with transaction.atomic():
+            # The row lock keeps the counts exact if the same reset is run twice at once
+            log = SystemResetLog.objects.select_for_update().get(pk=log.pk)
+            ids = list(queryset.filter(pk__in=ids).values_list('pk', flat=True))
+            if step.before and ids:
+                step.before(ids)
+            for related_model, field in set_null:
+                related_model._base_manager.filter(**{f'{field}__in': ids}).update(**{field: None})
+            batch = step.model._base_manager.filter(pk__in=ids)
+            rows = batch._raw_delete(batch.db)
+
+            deleted = log.progress.setdefault('deleted', {})
+            deleted[step.label] = deleted.get(step.label, 0) + rows
+            update_fields = ['progress']
+            if counter:
+                setattr(log, counter, getattr(log, counter) + rows)
+                update_fields.append(counter)
+            log.save(update_fields=update_fields)
+        if progress:
+            progress(step.label, deleted[step.label])
+
+def start_reset(reset_type, user=None, cutoff=None):
+    """Log a new reset as running; nothing is deleted until it is resumed"""
+    if reset_type not in DESCRIPTIONS:
+        raise ValueError(f'Unknown reset type: {reset_type}')
+    if reset_type == 'custom':
+        cutoff = cutoff or timezone.now() - timedelta(days=CUSTOM_RESET_DAYS)
+    else:
+        cutoff = None
+    state = {'deleted': {}}
+    if cutoff:
+        state['cutoff'] = cutoff.isoformat()
+    return SystemResetLog.objects.create(
+        reset_type=reset_type,
+        reset_by=user,
+        status='running',
+        description=DESCRIPTIONS[reset_type].format(cutoff=cutoff),
+        progress=state,
+    )
+
+def resume_reset(log, batch_size=RESET_BATCH_SIZE, progress=None):
+    """Delete whatever a running reset has left to delete and mark it completed; returns the log"""
+    cutoff = log.progress.get('cutoff')
+    cutoff = datetime.fromisoformat(cutoff) if cutoff else None
+    for step in reset_steps(log.reset_type, cutoff):
+        log = delete_in_batches(log, step, batch_size, progress)
+
+    with transaction.atomic():
+        if log.reset_type == 'financial':
+            Client.objects.update(balance=0, updated_at=timezone.now())
+        log.status = 'completed'
+        log.completed_at = timezone.now()
+        log.save(update_fields=['status', 'completed_at'])
+    invalidate_dashboard(FAMILIES)
+    return log
+
+def run_reset(reset_type, user=None, cutoff=None, batch_size=RESET_BATCH_SIZE, progress=None):
+    """Run a reset, or carry on with an interrupted one of the same type; returns its log"""
+    log = SystemResetLog.objects.filter(reset_type=reset_type, status='running').order_by('reset_date').first()
+    if log is None:
+        log = start_reset(reset_type, user, cutoff)
+    return resume_reset(log, batch_size, progress)
+
+def reset_summary(log):
+    """'12 clients, 30 invoices, ...' for the rows a reset has deleted"""
+    parts = [
+        f'{rows} {apps.get_model(label)._meta.verbose_name_plural}'
+        for label, rows in log.progress.get('deleted', {}).items() if rows
+    ]
+    return ', '.join(parts) or 'nothing'
@@ -0,0 +1,44 @@
+# DATABASE-BACKED WORK QUEUES
+# Shared helpers for queue models with status / attempts / next_attempt_at / updated_at columns.
+
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+def backoff_delay(attempts, base_seconds=30, max_seconds=3600):
+    """Exponential retry delay: 30s, 60s, 120s ... capped at max_seconds"""
+    return timedelta(seconds=min(max_seconds, base_seconds * (2 ** max(attempts - 1, 0))))
+
+def claim_batch(model, batch_size, stale_after=timedelta(minutes=10), filters=None):
+    """Mark up to batch_size due rows (optionally also matching a Q) as processing and return their ids.
+
+    Rows left in processing by a crashed worker are picked up again after stale_after.
+    On PostgreSQL SKIP LOCKED lets several workers claim batches side by side.
+    """
+    now = timezone.now()
+    due = Q(status='pending', next_attempt_at__lte=now) | Q(status='processing', updated_at__lt=now - stale_after)
+    if filters is not None:
+        due &= filters
+
+    with transaction.atomic():
+        ids = list(
+            model.objects.filter(due).order_by('next_attempt_at').select_for_update(
+                skip_locked=True
+            ).values_list('pk', flat=True)[:batch_size]
+        )
+        if ids:
+            model.objects.filter(pk__in=ids).update(status='processing', updated_at=now)
+    return ids
+
+def schedule_retry(task, error, max_attempts):
+    """Record a failed attempt; returns True if the task will be retried"""
+    task.attempts += 1
+    task.last_error = str(error)[:1000]
+    if task.attempts >= max_attempts:
+        task.status = 'failed'
+    else:
+        task.status = 'pending'
+        task.next_attempt_at = timezone.now() + backoff_delay(task.attempts)
+    task.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at'])
+    return task.status == 'pending'
@@ -0,0 +1,98 @@
+# TWILIO STAND-IN
+# A local HTTP server answering Twilio's Messages endpoint, so the WhatsApp sender can be
+# benchmarked without network access or credentials. Like Twilio it answers requests over an
+# account's rate with 429 and a Retry-After header; latency and error_rate simulate a slow
+# or flaky API.
+
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+MESSAGES_PATH = re.compile(r'^/2010-04-01/Accounts/[^/]+/Messages\.json$')
+
+class TwilioHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled sender connections are reused as they are against Twilio
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this each reply waits on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not MESSAGES_PATH.match(self.path):
+            return self.reply(404, {'code': 20404, 'message': 'The requested resource was not found'})
+        data = parse_qs(body.decode())
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        outcome = self.server.admit()
+        if outcome == 'throttled':
+            return self.reply(429, {'code': 20429, 'message': 'Too Many Requests'}, {'Retry-After': '1'})
+        if outcome == 'error':
+            return self.reply(503, {'code': 20503, 'message': 'Service unavailable'})
+        self.reply(201, {
+            'sid': 'SM' + secrets.token_hex(16),
+            'to': data.get('To', [''])[0],
+            'from': data.get('From', [''])[0],
+            'status': 'queued',
+        })
+
+    def reply(self, status, payload, headers=None):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class TwilioStandIn(ThreadingHTTPServer):
+    """Serve the stand-in on 127.0.0.1 (a free port unless one is given) from a background thread"""
+    daemon_threads = True
+
+    def __init__(self, port=0, limit=0, latency=0.0, error_rate=0.0):
+        super().__init__(('127.0.0.1', port), TwilioHandler)
+        self.limit = limit
+        self.latency = latency
+        self.error_rate = error_rate
+        self.counts = {'requests': 0, 'accepted': 0, 'throttled': 0, 'error': 0}
+        self.window = (0, 0)
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def admit(self):
+        """Count a request against the per-second limit: 'accepted', 'throttled' or 'error'"""
+        with self.lock:
+            self.counts['requests'] += 1
+            second, seen = self.window
+            now = int(time.monotonic())
+            if now != second:
+                second, seen = now, 0
+            self.window = (second, seen + 1)
+            if self.limit and seen >= self.limit:
+                outcome = 'throttled'
+            elif self.error_rate and random.random() < self.error_rate:
+                outcome = 'error'
+            else:
+                outcome = 'accepted'
+            self.counts[outcome] += 1
+        return outcome
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
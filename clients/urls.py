@@ -1,5 +1,5 @@
 ﻿from django.urls import path
-from . import views
+from . import custom_views, financial_views, mpesa_views, sms_views, views
 from .views import create_admin
 
 urlpatterns = [
@@ -20,6 +20,8 @@ urlpatterns = [
     path('billing/', views.billing_dashboard, name='billing_dashboard'),
     path('billing/management/', views.billing_management, name='billing_management'),
     path('billing/reports/', views.reports_dashboard, name='reports_dashboard'),
+    path('billing/export/', custom_views.export_billing_report, name='export_billing_report'),
+    path('billing/export/payments/', financial_views.export_financial_report, name='export_financial_report'),
     
     # Network Management
     path('network/', views.network_dashboard, name='network_dashboard'),
@@ -40,17 +42,23 @@ urlpatterns = [
     path('messaging/', views.whatsapp_compose, name='whatsapp_compose'),
     path('messaging/results/', views.whatsapp_results, name='whatsapp_results'),
     path('messaging/reminders/', views.whatsapp_reminders, name='whatsapp_reminders'),
+    path('messaging/sms/', sms_views.send_bulk_sms, name='sms_compose'),
+    path('messaging/sms/reminder/<int:client_id>/', sms_views.send_payment_reminder, name='send_payment_reminder'),
     
     # System Management
     path('system/', views.system_management, name='system_management'),
     path('system/reset/', views.reset_system_data, name='reset_system_data'),
     path('system/initialize/', views.initialize_system, name='initialize_system'),
     path('system/stats/', views.get_system_stats, name='get_system_stats'),
+    path('system/export/', custom_views.export_system_report, name='export_system_report'),
     
     # Auto-login (for development)
     path('auto-login/', views.auto_login, name='auto_login'),
     
     # Data APIs
     path('api/dashboard/', views.get_real_dashboard_data, name='get_real_dashboard_data'),
+    
+    # M-Pesa (MpesaGateway.callback_url)
+    path('mpesa-callback/', mpesa_views.mpesa_callback, name='mpesa_callback'),
 ]
 
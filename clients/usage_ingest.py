@@ -0,0 +1,209 @@
+# NETWORK USAGE INGESTION
+# Turns per-user byte counters (router sessions or RADIUS accounting) into NetworkUsage
+# totals. Each session's reading is compared with the last one stored in UsageCounter; the
+# differences are added to today's row with one INSERT ... ON CONFLICT statement per batch
+# and kept as a raw UsageSample for usage_retention to roll up.
+
+import csv
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .bulk_upsert import upsert_increment
+from .models import Client, NetworkUsage, UsageCounter, UsageSample
+
+# Fastest link we expect (10 Gbit/s); used to tell a counter wrap from a counter reset
+MAX_BYTES_PER_SECOND = 10 * 10 ** 9 // 8
+
+# Counters of sessions missing from readings this long are dropped. A RADIUS export must
+# not reach back to sessions gone for longer, or their totals are counted again.
+COUNTER_RETENTION = timedelta(days=2)
+
+def counter_delta(previous, current, bits=64, elapsed=None):
+    """Bytes counted between two readings of a counter that is `bits` wide.
+
+    A counter that went backwards either wrapped past its maximum or was reset (router
+    reboot, cleared interface). It is read as a wrap only when the previous value was in
+    the top half of the range and the wrapped difference is possible at link speed.
+    Returns (delta, kind) where kind is 'ok', 'wrap' or 'reset'.
+    """
+    if current >= previous:
+        return current - previous, 'ok'
+    modulus = 2 ** bits
+    wrapped = current + modulus - previous
+    plausible = elapsed is None or wrapped <= max(elapsed, 1) * MAX_BYTES_PER_SECOND
+    if previous >= modulus // 2 and plausible:
+        return wrapped, 'wrap'
+    return current, 'reset'
+
+def router_readings(manager):
+    """Readings from the router's active-session counters (bytes-in is the user's upload)"""
+    for counter in manager.get_user_counters():
+        yield {
+            'username': counter.get('name', ''),
+            'session_id': counter.get('session-id', ''),
+            'download': int(counter.get('bytes-out', 0)),
+            'upload': int(counter.get('bytes-in', 0)),
+        }
+
+def radius_readings(fileobj):
+    """Readings from a RADIUS accounting (radacct) CSV export.
+
+    Input octets are what the NAS received from the user (upload). Gigaword columns, when
+    present, carry the 32-bit overflow and make the counters 64-bit.
+    """
+    for row in csv.DictReader(fileobj):
+        row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+        if not row.get('username'):
+            continue
+        upload = int(row.get('acctinputoctets') or 0) + (int(row.get('acctinputgigawords') or 0) << 32)
+        download = int(row.get('acctoutputoctets') or 0) + (int(row.get('acctoutputgigawords') or 0) << 32)
+        yield {
+            'username': row['username'],
+            'session_id': row.get('acctsessionid', ''),
+            'download': download,
+            'upload': upload,
+        }
+
+class UsageIngestor:
+    """Compute usage deltas for a stream of counter readings and store them in bulk"""
+
+    def __init__(self, counter_bits=64, batch_size=2000):
+        self.counter_bits = counter_bits
+        self.batch_size = batch_size
+        self.client_index = {}
+        self.stats = {
+            'readings': 0,
+            'clients': 0,
+            'unknown': 0,
+            'new': 0,
+            'resets': 0,
+            'wraps': 0,
+            'download_bytes': 0,
+            'upload_bytes': 0,
+        }
+
+    def build_client_index(self):
+        """Load the username -> client id lookup once"""
+        clients = Client.objects.order_by().values_list('username', 'pk')
+        self.client_index = dict(clients.iterator(chunk_size=5000))
+
+    def ingest(self, readings, read_at=None):
+        """Ingest an iterable of {'username', 'session_id', 'download', 'upload'} readings"""
+        started = time.monotonic()
+        read_at = read_at or timezone.now()
+        if not self.client_index:
+            self.build_client_index()
+
+        # One entry per session: several sessions of a user (hotspot multi-login, RADIUS rows
+        # of earlier sessions) each get their own delta, and the deltas are added up per client
+        batch = OrderedDict()
+        for reading in readings:
+            self.stats['readings'] += 1
+            client_id = self.client_index.get(reading['username'])
+            if client_id is None:
+                self.stats['unknown'] += 1
+                continue
+
+            session_id = (reading.get('session_id') or '')[:100]
+            batch[(client_id, session_id)] = {'download': reading['download'], 'upload': reading['upload']}
+
+            if len(batch) >= self.batch_size:
+                self.flush(batch, read_at)
+                batch = OrderedDict()
+
+        if batch:
+            self.flush(batch, read_at)
+
+        self.prune_counters(read_at)
+        self.stats['seconds'] = time.monotonic() - started
+        return self.stats
+
+    def flush(self, batch, read_at):
+        """Compute per-session deltas for one batch and write usage and counter state"""
+        client_ids = {client_id for client_id, _ in batch}
+        previous = {
+            (counter.client_id, counter.session_id): counter
+            for counter in UsageCounter.objects.filter(client_id__in=client_ids)
+        }
+        known = {client_id for client_id, _ in previous}
+        usage_date = timezone.localdate(read_at)
+        # Wall-clock time of the write, which incremental backups select on
+        now = timezone.now()
+        totals = OrderedDict()
+        counters = []
+
+        for (client_id, session_id), reading in batch.items():
+            last = previous.get((client_id, session_id))
+            if last is None and client_id not in known:
+                # First reading of a client only sets the baseline
+                download = upload = 0
+                self.stats['new'] += 1
+            elif last is None:
+                # New session: its counters started from zero
+                download, upload = reading['download'], reading['upload']
+                self.stats['resets'] += 1
+            else:
+                elapsed = (read_at - last.read_at).total_seconds()
+                download, download_kind = counter_delta(last.download_bytes, reading['download'], self.counter_bits, elapsed)
+                upload, upload_kind = counter_delta(last.upload_bytes, reading['upload'], self.counter_bits, elapsed)
+                kinds = {download_kind, upload_kind}
+                if 'reset' in kinds:
+                    self.stats['resets'] += 1
+                elif 'wrap' in kinds:
+                    self.stats['wraps'] += 1
+
+            total = totals.setdefault(client_id, [0, 0])
+            total[0] += download
+            total[1] += upload
+            counters.append(UsageCounter(
+                client_id=client_id,
+                session_id=session_id,
+                download_bytes=reading['download'],
+                upload_bytes=reading['upload'],
+                read_at=read_at,
+            ))
+
+        usage_rows = []
+        samples = []
+        for client_id, (download, upload) in totals.items():
+            if download or upload:
+                usage_rows.append({
+                    'client': client_id,
+                    'usage_date': usage_date,
+                    'download_bytes': download,
+                    'upload_bytes': upload,
+                    'created_at': read_at,
+                    'updated_at': now,
+                })
+                samples.append(UsageSample(client_id=client_id, sampled_at=read_at, download_bytes=download, upload_bytes=upload))
+                self.stats['download_bytes'] += download
+                self.stats['upload_bytes'] += upload
+
+        with transaction.atomic():
+            upsert_increment(
+                NetworkUsage,
+                usage_rows,
+                key_fields=['client', 'usage_date'],
+                increment_fields=['download_bytes', 'upload_bytes'],
+                insert_fields=['created_at'],
+                replace_fields=['updated_at'],
+                batch_size=self.batch_size,
+            )
+            UsageSample.objects.bulk_create(samples, batch_size=self.batch_size)
+            UsageCounter.objects.bulk_create(
+                counters,
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=['client', 'session_id'],
+                update_fields=['download_bytes', 'upload_bytes', 'read_at'],
+            )
+        self.stats['clients'] += len(totals)
+
+    def prune_counters(self, read_at):
+        """Drop counters of sessions not seen for COUNTER_RETENTION, keeping each client's latest"""
+        # The latest one stays so the client's next session is counted from zero, not baselined
+        newer = UsageCounter.objects.filter(client_id=OuterRef('client_id'), read_at__gt=OuterRef('read_at'))
+        UsageCounter.objects.filter(read_at__lt=read_at - COUNTER_RETENTION).filter(Exists(newer)).delete()
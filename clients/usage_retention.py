@@ -0,0 +1,170 @@
+# NETWORK USAGE RETENTION
+# Usage is kept at a coarser resolution as it ages: raw UsageSample rows for a few days,
+# hourly UsageRollup rows for a few months, daily NetworkUsage rows for about a year and
+# monthly UsageRollup rows for good. Each tier is rolled up before the finer one is purged,
+# and purges delete in bounded batches. Thresholds are SystemSettings (0 keeps a tier forever).
+
+from datetime import datetime, time, timedelta
+from itertools import islice
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import TruncHour, TruncMonth
+from django.utils import timezone
+from .models import NetworkUsage, SystemSettings, UsageRollup, UsageSample
+
+RETENTION_SETTINGS = {
+    'usage_raw_retention_days': (7, 'Days raw usage samples are kept; older usage stays as hourly totals'),
+    'usage_hourly_retention_days': (90, 'Days hourly usage totals are kept; older usage stays as daily totals'),
+    'usage_daily_retention_days': (400, 'Days daily usage totals are kept; older usage stays as monthly totals'),
+    'usage_monthly_retention_days': (0, 'Days monthly usage totals are kept (0 keeps them forever)'),
+    'usage_retention_batch_size': (5000, 'Rows deleted per statement when purging old usage'),
+}
+
+def retention_settings():
+    """Retention thresholds from SystemSettings, falling back to the defaults above"""
+    values = {key: default for key, (default, _) in RETENTION_SETTINGS.items()}
+    for setting in SystemSettings.objects.filter(key__in=RETENTION_SETTINGS, is_active=True):
+        try:
+            values[setting.key] = max(int(setting.value), 0)
+        except (TypeError, ValueError):
+            pass
+    values['usage_retention_batch_size'] = max(values['usage_retention_batch_size'], 1)
+    return values
+
+def month_start(day):
+    return day.replace(day=1)
+
+def as_datetime(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def save_rollups(rows, batch_size):
+    """Insert or overwrite rollup rows from an iterable; returns rows written"""
+    rows = iter(rows)
+    written = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return written
+        written += len(UsageRollup.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['client', 'resolution', 'period_start'],
+            update_fields=['download_bytes', 'upload_bytes', 'updated_at'],
+        ))
+
+def rollup_hourly(batch_size=5000):
+    """Recompute hourly totals from raw samples, starting at the last hour already rolled up.
+
+    Returns the start of the latest hour rolled up (raw samples before it are safe to purge).
+    """
+    last = UsageRollup.objects.filter(resolution='hour').aggregate(last=Max('period_start'))['last']
+    samples = UsageSample.objects.all()
+    if last:
+        samples = samples.filter(sampled_at__gte=last)
+
+    sums = samples.annotate(period=TruncHour('sampled_at')).order_by().values('client', 'period').annotate(
+        download=Sum('download_bytes'), upload=Sum('upload_bytes')
+    )
+    save_rollups(
+        (
+            UsageRollup(client_id=row['client'], resolution='hour', period_start=row['period'],
+                        download_bytes=row['download'], upload_bytes=row['upload'])
+            for row in sums.iterator(chunk_size=batch_size)
+        ),
+        batch_size,
+    )
+    return UsageRollup.objects.filter(resolution='hour').aggregate(last=Max('period_start'))['last']
+
+def rollup_monthly(batch_size=5000):
+    """Recompute monthly totals from daily rows, starting at the last month already rolled up.
+
+    Returns the first day of the latest month rolled up (daily rows before it are safe to purge).
+    """
+    last = UsageRollup.objects.filter(resolution='month').aggregate(last=Max('period_start'))['last']
+    days = NetworkUsage.objects.all()
+    if last:
+        days = days.filter(usage_date__gte=timezone.localdate(last))
+
+    sums = days.annotate(period=TruncMonth('usage_date')).order_by().values('client', 'period').annotate(
+        download=Sum('download_bytes'), upload=Sum('upload_bytes')
+    )
+    save_rollups(
+        (
+            UsageRollup(client_id=row['client'], resolution='month', period_start=as_datetime(row['period']),
+                        download_bytes=row['download'], upload_bytes=row['upload'])
+            for row in sums.iterator(chunk_size=batch_size)
+        ),
+        batch_size,
+    )
+    last = UsageRollup.objects.filter(resolution='month').aggregate(last=Max('period_start'))['last']
+    return timezone.localdate(last) if last else None
+
+def purge(queryset, batch_size):
+    """Delete the rows of queryset batch_size at a time; returns rows deleted"""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+
+def apply_retention(now=None):
+    """Roll each tier up into the next and purge what is past its retention; returns counts"""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    config = retention_settings()
+    batch_size = config['usage_retention_batch_size']
+    result = {'raw_deleted': 0, 'hourly_deleted': 0, 'daily_deleted': 0, 'monthly_deleted': 0}
+
+    rolled_hour = rollup_hourly(batch_size)
+    rolled_month = rollup_monthly(batch_size)
+
+    # Never purge rows newer than the last rollup: the rolled-up period is recomputed next run
+    if config['usage_raw_retention_days'] and rolled_hour:
+        cutoff = min(now - timedelta(days=config['usage_raw_retention_days']), rolled_hour)
+        result['raw_deleted'] = purge(UsageSample.objects.filter(sampled_at__lt=cutoff), batch_size)
+
+    if config['usage_hourly_retention_days']:
+        cutoff = now - timedelta(days=config['usage_hourly_retention_days'])
+        result['hourly_deleted'] = purge(
+            UsageRollup.objects.filter(resolution='hour', period_start__lt=cutoff), batch_size
+        )
+
+    # Daily rows go a whole month at a time, so the daily tier always starts on a month boundary
+    if config['usage_daily_retention_days'] and rolled_month:
+        cutoff = min(month_start(today - timedelta(days=config['usage_daily_retention_days'])), rolled_month)
+        result['daily_deleted'] = purge(NetworkUsage.objects.filter(usage_date__lt=cutoff), batch_size)
+
+    if config['usage_monthly_retention_days']:
+        cutoff = as_datetime(month_start(today - timedelta(days=config['usage_monthly_retention_days'])))
+        result['monthly_deleted'] = purge(
+            UsageRollup.objects.filter(resolution='month', period_start__lt=cutoff), batch_size
+        )
+
+    return result
+
+def usage_totals(start=None, end=None, **filters):
+    """Download and upload bytes between two dates (inclusive) across the daily and monthly tiers.
+
+    Days still in NetworkUsage are exact; before that, whole months that overlap the range
+    are counted from the monthly rollups. filters apply to both (e.g. client=...).
+    """
+    days = NetworkUsage.objects.filter(**filters)
+    months = UsageRollup.objects.filter(resolution='month', **filters)
+
+    # The daily tier starts on a month boundary (see apply_retention); months before it are rolled up
+    first_day = NetworkUsage.objects.aggregate(first=Min('usage_date'))['first']
+    if first_day:
+        months = months.filter(period_start__lt=as_datetime(month_start(first_day)))
+    if start:
+        days = days.filter(usage_date__gte=start)
+        months = months.filter(period_start__gte=as_datetime(month_start(start)))
+    if end:
+        days = days.filter(usage_date__lte=end)
+        months = months.filter(period_start__lte=as_datetime(end))
+
+    daily = days.aggregate(download=Sum('download_bytes'), upload=Sum('upload_bytes'))
+    monthly = months.aggregate(download=Sum('download_bytes'), upload=Sum('upload_bytes'))
+    return {
+        'download_bytes': (daily['download'] or 0) + (monthly['download'] or 0),
+        'upload_bytes': (daily['upload'] or 0) + (monthly['upload'] or 0),
+    }
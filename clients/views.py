@@ -4,14 +4,23 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse
 from django.db.models import Sum, Count, Q
+from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Client, ServicePlan, Invoice, Payment, NetworkUsage, SystemSettings, SystemResetLog
+from .models import Client, ServicePlan, Invoice, Payment, NetworkUsage, RevenueDaily, SystemSettings, SystemResetLog
+from .dashboard_cache import get_snapshot
 from .mikrotik_integration import mikrotik_manager
+from .reporting.usage_analytics import parse_window, peak_profile, usage_gb, usage_summary
+from .router_sessions import get_session_snapshot
+from .router_state import is_stale, latest_sample, network_alerts, network_health, throughput_mbps
 from .system_management import system_manager
 
 def get_real_dashboard_data():
-    """Get real data for dashboard"""
-    today = datetime.now().date()
+    """Get real data for dashboard (cached; see dashboard_cache)"""
+    return get_snapshot('main', build_dashboard_data)
+
+def build_dashboard_data():
+    """Compute the dashboard figures from the database and router"""
+    today = timezone.localdate()
     month_start = today.replace(day=1)
     
     # Real client statistics
@@ -20,10 +29,10 @@ def get_real_dashboard_data():
     hotspot_clients = Client.objects.filter(is_active=True, client_type='hotspot').count()
     
     # Real revenue data
-    monthly_revenue = Payment.objects.filter(
-        payment_date__year=today.year,
-        payment_date__month=today.month
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    monthly_revenue = RevenueDaily.objects.filter(
+        date__gte=month_start,
+        date__lte=today
+    ).aggregate(total=Sum('total'))['total'] or 0
     
     # Pending payments
     pending_invoices = Invoice.objects.filter(
@@ -31,12 +40,9 @@ def get_real_dashboard_data():
         due_date__lte=today
     ).count()
     
-    # Active connections from MikroTik
-    try:
-        active_connections = mikrotik_manager.get_active_connections()
-        active_sessions = len(active_connections.get('pppoe', [])) + len(active_connections.get('hotspot', []))
-    except:
-        active_sessions = 0
+    # Active connections from the latest poll_mikrotik sample
+    sample = latest_sample()
+    active_sessions = sample.total_sessions if sample else 0
     
     return {
         'total_clients': total_clients,
@@ -55,12 +61,9 @@ def main_dashboard(request):
     recent_payments = Payment.objects.select_related('client').order_by('-payment_date')[:5]
     recent_clients = Client.objects.filter(is_active=True).order_by('-created_at')[:5]
     
-    # Network status from MikroTik
-    try:
-        system_resources = mikrotik_manager.get_system_resources()
-        uptime = system_resources.get('uptime', 'N/A') if system_resources else 'N/A'
-    except:
-        uptime = 'N/A'
+    # Network status from the latest router sample
+    sample = latest_sample()
+    uptime = sample.uptime if sample and sample.uptime else 'N/A'
     
     context = {
         # Real data
@@ -94,12 +97,8 @@ def client_management(request):
             'suspended': clients.filter(status='suspended').count(),
         }
         
-        # Check connection status for each client
-        for client in clients:
-            try:
-                client.currently_connected = client.get_connection_status()
-            except:
-                client.currently_connected = False
+        # Connection status for every client from one router snapshot
+        clients = clients.with_connection_status(get_session_snapshot(request))
         
         context = {
             'clients': clients,
@@ -156,30 +155,27 @@ def billing_dashboard(request):
     return render(request, 'billing/dashboard.html', context)
 
 def network_live_dashboard(request):
-    """Real-time network dashboard with MikroTik data"""
-    # Get real network data from MikroTik
-    try:
-        active_connections = mikrotik_manager.get_active_connections()
-        system_resources = mikrotik_manager.get_system_resources()
-        interface_stats = mikrotik_manager.get_interface_stats()
-        
-        # Calculate real usage
-        total_download = sum(int(iface.get('rx-byte', 0)) for iface in interface_stats)
-        total_upload = sum(int(iface.get('tx-byte', 0)) for iface in interface_stats)
-        
+    """Real-time network dashboard from the latest poll_mikrotik sample"""
+    sample = latest_sample()
+    if sample is not None:
+        interfaces = list(sample.interfaces.all())
         context = {
-            'active_pppoe': len(active_connections.get('pppoe', [])),
-            'active_hotspot': len(active_connections.get('hotspot', [])),
-            'total_sessions': len(active_connections.get('pppoe', [])) + len(active_connections.get('hotspot', [])),
-            'cpu_load': system_resources.get('cpu-load', 'N/A'),
-            'memory_usage': system_resources.get('free-memory', 'N/A'),
-            'total_memory': system_resources.get('total-memory', 'N/A'),
-            'uptime': system_resources.get('uptime', 'N/A'),
-            'total_download': total_download,
-            'total_upload': total_upload,
-            'interface_stats': interface_stats[:5],  # Show first 5 interfaces
+            'active_pppoe': sample.pppoe_sessions,
+            'active_hotspot': sample.hotspot_sessions,
+            'total_sessions': sample.total_sessions,
+            'cpu_load': sample.cpu_load if sample.cpu_load is not None else 'N/A',
+            'memory_usage': sample.free_memory or 'N/A',
+            'total_memory': sample.total_memory or 'N/A',
+            'uptime': sample.uptime or 'N/A',
+            'total_download': sum(iface.rx_bytes for iface in interfaces),
+            'total_upload': sum(iface.tx_bytes for iface in interfaces),
+            'interface_stats': [
+                {'name': iface.name, 'rx-byte': iface.rx_bytes, 'tx-byte': iface.tx_bytes, 'status': iface.status}
+                for iface in interfaces[:5]  # Show first 5 interfaces
+            ],
+            'sampled_at': sample.sampled_at,
         }
-    except Exception as e:
+    else:
         context = {
             'active_pppoe': 0,
             'active_hotspot': 0,
@@ -191,7 +187,7 @@ def network_live_dashboard(request):
             'total_download': 0,
             'total_upload': 0,
             'interface_stats': [],
-            'error': str(e)
+            'error': 'No router data yet - start the poll_mikrotik command'
         }
     
     return render(request, 'network/live_dashboard.html', context)
@@ -219,7 +215,8 @@ def sync_mikrotik_users(request):
                         phone='Not set',
                         address='Not set',
                         monthly_fee=2000,  # Default fee
-                        password='synced_from_mikrotik'
+                        password='synced_from_mikrotik',
+                        provisioning_status='provisioned'  # Already exists on the router
                     )
                     synced_count += 1
             
@@ -235,7 +232,8 @@ def sync_mikrotik_users(request):
                         phone='Not set',
                         address='Not set',
                         monthly_fee=1000,  # Default fee for hotspot
-                        password='synced_from_mikrotik'
+                        password='synced_from_mikrotik',
+                        provisioning_status='provisioned'  # Already exists on the router
                     )
                     synced_count += 1
             
@@ -358,35 +356,44 @@ def network_dashboard(request):
     return render(request, 'network/dashboard.html')
 
 def network_traffic_api(request):
-    """Network traffic API"""
-    from django.http import JsonResponse
-    import random
+    """Network traffic API (latest router sample)"""
+    sample = latest_sample()
+    download, upload = throughput_mbps(sample)
     data = {
-        'download': random.randint(10, 100),
-        'upload': random.randint(5, 50),
-        'sessions': random.randint(5, 50)
+        'download': download,
+        'upload': upload,
+        'sessions': sample.total_sessions if sample else 0,
+        'health': network_health(sample),
+        'sampled_at': sample.sampled_at.isoformat() if sample else None,
+        'data_today_gb': usage_gb(usage_summary(1)),
+        'data_month_gb': usage_gb(usage_summary(30)),
     }
     return JsonResponse(data)
 
 def network_alerts_api(request):
     """Network alerts API"""
-    from django.http import JsonResponse
-    return JsonResponse({'alerts': []})
+    return JsonResponse({'alerts': network_alerts(latest_sample())})
 
 def network_health_check(request):
     """Network health check API"""
-    from django.http import JsonResponse
-    return JsonResponse({'status': 'healthy'})
+    return network_health_api(request)
 
 def network_usage_breakdown(request):
-    """Network usage breakdown API"""
-    from django.http import JsonResponse
-    return JsonResponse({'usage': {}})
+    """Network usage breakdown API: usage per plan and the heaviest users over ?days= (default 30)"""
+    try:
+        top = min(max(int(request.GET.get('top', 20)), 1), 100)
+    except ValueError:
+        top = 20
+    summary = usage_summary(parse_window(request.GET.get('days')), top=top)
+    return JsonResponse({
+        'window': summary['window'],
+        'plans': summary['plans'],
+        'top_users': summary['top_users'],
+    })
 
 def network_peak_hours(request):
     """Network peak hours API"""
-    from django.http import JsonResponse
-    return JsonResponse({'peak_hours': []})
+    return network_peak_hours_api(request)
 
 def whatsapp_compose(request):
     """WhatsApp compose message"""
@@ -466,34 +473,26 @@ def reports_dashboard(request):
 
 def network_health_api(request):
     """Network health check API"""
+    sample = latest_sample()
     return JsonResponse({
-        'status': 'healthy',
-        'timestamp': '2025-10-01 00:00:00',
+        'status': 'stale' if is_stale(sample) else 'healthy',
+        'health': network_health(sample),
+        'timestamp': sample.sampled_at.strftime('%Y-%m-%d %H:%M:%S') if sample else None,
         'services': ['web', 'database', 'api']
     })
 
 def network_usage_api(request):
-    """Network usage breakdown API"""
-    import random
+    """Network usage API: totals and per-client percentiles over ?days= (default 30)"""
+    summary = usage_summary(parse_window(request.GET.get('days')))
     return JsonResponse({
-        'usage': {
-            'download': random.randint(1000, 5000),
-            'upload': random.randint(500, 2500),
-            'clients_online': random.randint(50, 200)
-        }
+        'window': summary['window'],
+        'usage': summary['totals'],
+        'percentiles': summary['percentiles'],
     })
 
 def network_peak_hours_api(request):
-    """Network peak hours API"""
-    import random
-    peak_hours = []
-    for hour in range(24):
-        peak_hours.append({
-            'hour': f'{hour:02d}:00',
-            'usage': random.randint(10, 100)
-        })
-    return JsonResponse({'peak_hours': peak_hours})
-
+    """Network peak hours API: average traffic per hour of day over ?days= (default 7)"""
+    return JsonResponse(peak_profile(parse_window(request.GET.get('days'), default=7)))
 
 
 from django.contrib.auth import get_user_model
@@ -1,84 +1,127 @@
 import os
-from twilio.rest import Client
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
-from .models import Client
+from .models import Client, OutboundMessage
+from .outbox import enqueue_messages, mark_sent, new_campaign
+from .rate_limit import TokenBucket
+from .sms_service import sms_service
+from .task_queue import schedule_retry
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Twilio's REST API; point TWILIO_API_URL at a stand-in (see twilio_standin) to run offline
+TWILIO_API_URL = os.getenv('TWILIO_API_URL', 'https://api.twilio.com')
+
+WHATSAPP_CONCURRENCY = 8
+# Requests per second across all sender threads
+WHATSAPP_RATE = 50
+# Retries of one request within a send, for 429 and 5xx responses
+WHATSAPP_RETRIES = 3
+# Sends before a message is marked as failed; run_whatsapp_sender retries those in between
+WHATSAPP_MAX_ATTEMPTS = 5
+# Messages claimed, sent and recorded together (10s at the default rate)
+WHATSAPP_BATCH_SIZE = 500
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
 class WhatsAppService:
-    def __init__(self):
+    def __init__(self, concurrency=WHATSAPP_CONCURRENCY, rate=WHATSAPP_RATE, retries=WHATSAPP_RETRIES, api_url=None):
         # Twilio credentials - you'll get these from twilio.com
         self.account_sid = os.getenv('TWILIO_ACCOUNT_SID', 'your_account_sid')
         self.auth_token = os.getenv('TWILIO_AUTH_TOKEN', 'your_auth_token')
         self.whatsapp_from = os.getenv('TWILIO_WHATSAPP_FROM', 'whatsapp:+14155238886')  # Twilio sandbox number
+        self.api_url = api_url or TWILIO_API_URL
         
-        self.client = Client(self.account_sid, self.auth_token)
+        self.concurrency = concurrency
+        self.retries = retries
+        # Evenly spaced, no bursts: Twilio counts requests per fixed second
+        self.bucket = TokenBucket(rate, burst=1)
+        # One keep-alive connection per sender thread
+        self.session = requests.Session()
+        self.session.auth = (self.account_sid, self.auth_token)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
     
-    def send_whatsapp_message(self, to_number, message):
-        """Send single WhatsApp message"""
+    def retry_delay(self, response, attempt):
+        """Seconds to wait before retrying: Retry-After when Twilio sends one, else exponential"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
         try:
-            # Format number to WhatsApp format
-            if not to_number.startswith('whatsapp:'):
-                to_number = f'whatsapp:{to_number}'
-            
-            message = self.client.messages.create(
-                from_=self.whatsapp_from,
-                body=message,
-                to=to_number
-            )
-            
-            logger.info(f"WhatsApp message sent to {to_number}: {message.sid}")
-            return {'success': True, 'message_sid': message.sid}
-            
-        except Exception as e:
-            logger.error(f"WhatsApp send failed to {to_number}: {str(e)}")
-            return {'success': False, 'error': str(e)}
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return 0.5 * (2 ** attempt)
     
-    def send_bulk_whatsapp(self, client_ids, message_template):
-        """Send bulk WhatsApp to multiple clients"""
-        results = {
-            'successful': [],
-            'failed': []
-        }
-        
-        clients = Client.objects.filter(id__in=client_ids)
+    def send_whatsapp_message(self, to_number, message):
+        """Send single WhatsApp message, retrying 429 and 5xx responses"""
+        # Format number to WhatsApp format
+        if not to_number.startswith('whatsapp:'):
+            to_number = f'whatsapp:+{sms_service.format_phone(to_number)}'
+        url = f'{self.api_url}/2010-04-01/Accounts/{self.account_sid}/Messages.json'
+        data = {'From': self.whatsapp_from, 'To': to_number, 'Body': message}
         
-        for client in clients:
-            # Personalize message
-            personalized_message = message_template.replace(
-                '{name}', client.first_name
-            ).replace(
-                '{username}', client.username
-            ).replace(
-                '{plan}', client.service_plan.name
-            )
-            
-            # Send message
-            result = self.send_whatsapp_message(client.phone, personalized_message)
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            response = None
+            try:
+                response = self.session.post(url, data=data, timeout=30)
+            except requests.ConnectionError as e:
+                error, retryable = str(e), True
+            except requests.RequestException as e:
+                # The request may have reached Twilio, so it is not sent again
+                error, retryable = str(e), False
+            else:
+                if response.status_code < 300:
+                    message_sid = response.json().get('sid', '')
+                    logger.info(f"WhatsApp message sent to {to_number}: {message_sid}")
+                    return {'success': True, 'message_sid': message_sid}
+                error = f'HTTP {response.status_code}: {response.text[:200]}'
+                retryable = response.status_code in RETRY_STATUSES
             
+            if not retryable or attempt == self.retries:
+                break
+            time.sleep(self.retry_delay(response, attempt))
+        
+        logger.error(f"WhatsApp send failed to {to_number}: {error}")
+        return {'success': False, 'error': error, 'retryable': retryable}
+    
+    def send_messages(self, messages, max_attempts=WHATSAPP_MAX_ATTEMPTS):
+        """Send outbox messages from a pool of sender threads and store each one's result; returns counts"""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(lambda message: self.send_whatsapp_message(message.phone, message.body), messages))
+        
+        outcome = {'sent': 0, 'retry': 0, 'failed': 0}
+        sent = []
+        for message, result in zip(messages, results):
             if result['success']:
-                results['successful'].append({
-                    'client': client.full_name,
-                    'phone': client.phone,
-                    'message_sid': result.get('message_sid')
-                })
+                sent.append((message.pk, result['message_sid']))
+            # Rejected messages (4xx other than 429) fail straight away
+            elif schedule_retry(message, result['error'], max_attempts if result['retryable'] else 0):
+                outcome['retry'] += 1
             else:
-                results['failed'].append({
-                    'client': client.full_name,
-                    'phone': client.phone,
-                    'error': result.get('error')
-                })
-        
-        return results
+                outcome['failed'] += 1
+        mark_sent(sent)
+        outcome['sent'] = len(sent)
+        return outcome
+    
+    def send_bulk_whatsapp(self, client_ids, message_template):
+        """Queue a WhatsApp message for each client and return at once; run_whatsapp_sender sends them"""
+        campaign = new_campaign('whatsapp')
+        queued = enqueue_messages(
+            Client.objects.filter(id__in=client_ids), message_template,
+            channel='whatsapp', campaign=campaign
+        )
+        return {'queued': queued, 'campaign': campaign}
     
     def send_payment_reminder(self, client_ids):
         """Send automated payment reminders"""
-        message_template = """Hello {name}! 
+        message_template = """Hello [Name]!
 
-This is a friendly reminder that your payment for {plan} is due. 
+This is a friendly reminder that your payment for [Plan] is due.
 
-Username: {username}
+Username: [Username]
 
 Please make payment to avoid service interruption.
 
@@ -88,7 +131,7 @@ Thank you!"""
     
     def send_service_update(self, client_ids, update_message):
         """Send service updates/announcements"""
-        message_template = f"""Hello {{name}}!
+        message_template = f"""Hello [Name]!
 
 Important Service Update:
 
@@ -96,4 +139,4 @@ Important Service Update:
 
 Thank you for being our valued customer!"""
         
-        return self.send_bulk_whatsapp(client_ids, message_template)
\ No newline at end of file
+        return self.send_bulk_whatsapp(client_ids, message_template)